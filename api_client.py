@@ -0,0 +1,56 @@
+import json
+from typing import Iterator, Optional
+
+import httpx
+
+from config import CHAT_API_URL, CHAT_API_TIMEOUT_SECONDS
+
+# Client of the headless chat API (server.py) with the same signatures as chat_service's
+# chat_fn and stream_chat_fn, so the Streamlit UI can run as a thin client (CHAT_API_URL).
+
+_client = None
+
+
+def _get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        _client = httpx.Client(base_url=CHAT_API_URL, timeout=httpx.Timeout(CHAT_API_TIMEOUT_SECONDS, connect=10.0))
+    return _client
+
+
+def _raise_for_status(response: httpx.Response):
+    if response.status_code != 200:
+        response.read()
+        try:
+            error = response.json().get("error")
+        except ValueError:
+            error = response.text
+        raise RuntimeError(f"Chat API returned {response.status_code}: {error}")
+
+
+def _body(message: str, llm_name: str, session_id: Optional[str]) -> dict:
+    return {"message": message, "llm_name": llm_name, "session_id": session_id}
+
+
+def stream_chat_fn(message: str, llm_name: str, session_id: Optional[str] = None) -> Iterator[dict]:
+    """
+    Yields the events of POST /chat/stream, see chat_service.stream_chat_fn.
+    """
+    with _get_client().stream("POST", "/chat/stream", json=_body(message, llm_name, session_id)) as response:
+        _raise_for_status(response)
+        for line in response.iter_lines():
+            if not line.startswith("data: "):
+                continue # "event:" lines repeat the type; blank lines end an event
+            event = json.loads(line[len("data: "):])
+            if event["type"] == "error":
+                raise RuntimeError(f"Chat API turn failed: {event['message']}")
+            yield event
+
+
+def chat_fn(message: str, llm_name: str, session_id: Optional[str] = None) -> dict:
+    """
+    POST /chat, see chat_service.chat_fn.
+    """
+    response = _get_client().post("/chat", json=_body(message, llm_name, session_id))
+    _raise_for_status(response)
+    return response.json()
@@ -1,4 +1,12 @@
+from config import CHAT_API_URL
 from visuals import ui_main
-from chat_service import chat_fn
 
-ui_main(chat_fn)
+if CHAT_API_URL:
+    # Thin client: the agent runs in the chat API (server.py), shared by every UI session
+    from api_client import chat_fn, stream_chat_fn
+else:
+    from chat_service import chat_fn, stream_chat_fn
+    from metrics import start_metrics_server
+    start_metrics_server() # Once per process; Streamlit reruns this script on every interaction
+
+ui_main(chat_fn, stream_chat_fn)
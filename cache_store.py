@@ -0,0 +1,110 @@
+import pickle
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Optional
+
+from config import CACHE_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class TieredCache:
+    """
+    Two-tier key/value cache: an in-memory LRU in front of an on-disk SQLite table.
+
+    Every entry has an expiry time (TTL). Both tiers are bounded by item count; the
+    memory tier evicts least-recently-used keys and the disk tier evicts the least
+    recently accessed rows. Values are pickled on disk, so they must be picklable.
+    Each cache owns one table (namespace) in the shared CACHE_DB_PATH database.
+    """
+
+    def __init__(self, namespace: str, ttl: float, max_memory_items: int = 256,
+                 max_disk_items: int = 5000, db_path: Optional[str] = CACHE_DB_PATH):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self._memory = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{namespace}" '
+                "(key TEXT PRIMARY KEY, value BLOB, expires_at REAL, last_access REAL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                f'SELECT value, expires_at FROM "{self.namespace}" WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            blob, expires_at = row
+            if expires_at <= now:
+                self._conn.execute(f'DELETE FROM "{self.namespace}" WHERE key = ?', (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(f'UPDATE "{self.namespace}" SET last_access = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            try:
+                value = pickle.loads(blob)
+            except Exception as e:
+                logger.warning(f"Dropping unreadable cache entry in {self.namespace}: {e}")
+                return None
+            # Promote to the memory tier
+            self._set_memory(key, expires_at, value)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._set_memory(key, expires_at, value)
+            if self._conn is None:
+                return
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO "{self.namespace}" (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)',
+                (key, pickle.dumps(value), expires_at, now),
+            )
+            self._evict_disk(now)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute(f'DELETE FROM "{self.namespace}"')
+                self._conn.commit()
+
+    def _set_memory(self, key: str, expires_at: float, value: Any):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now: float):
+        self._conn.execute(f'DELETE FROM "{self.namespace}" WHERE expires_at <= ?', (now,))
+        (count,) = self._conn.execute(f'SELECT COUNT(*) FROM "{self.namespace}"').fetchone()
+        if count > self.max_disk_items:
+            self._conn.execute(
+                f'DELETE FROM "{self.namespace}" WHERE key IN '
+                f'(SELECT key FROM "{self.namespace}" ORDER BY last_access ASC LIMIT ?)',
+                (count - self.max_disk_items,),
+            )
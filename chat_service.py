@@ -1,59 +1,247 @@
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
-from lang_graph import agent_graph
+import lang_graph
+from lang_graph import get_agent_graph
+from compaction import get_full_payload
+from metrics import TurnMetrics
+from typing import AsyncIterator, Iterator, Optional
 import logging
+import uuid
 
 # Logging is configured in lang_graph.py or app.py, avoid re-configuring here.
 # logging.basicConfig(level=logging.DEBUG)
 
-# Configure basic logging to capture messages
-def chat_fn(message: str, llm_name: str) -> dict:
+
+class ToolEntryCollector:
+    """
+    Builds the tool_entries list incrementally while the graph is running,
+    matching each AIMessage tool_call with the ToolMessage that answers it.
+    """
+
+    def __init__(self):
+        self.tool_entries = []
+        self.pending_tool_calls = {} # Store AIMessage tool_calls by id to match with ToolMessage
+        self.completed_tool_calls = {} # tool_call_id -> finished entry, to annotate it once compacted
+        self.llm_entries = [] # call_model entries, in call order
+        self.metric_ids = {} # tool_call_id -> id the call actually ran under (speculative calls)
+
+    def add_router_entry(self, route: dict):
+        # The local router's decision, logged as the turn's first step
+        self.tool_entries.append(dict(route))
+
+    def add_llm_call(self, msg: AIMessage) -> dict:
+        # One entry per agent LLM call, so its cost shows up as a step of the turn
+        output = msg.content if msg.content else "Requested tools: " + ", ".join(tc['name'] for tc in msg.tool_calls)
+        entry = {"name": "call_model", "kind": "llm", "tool_input": "", "tool_output": output}
+        if msg.response_metadata.get("provider"):
+            entry["provider"] = msg.response_metadata["provider"] # Set by llm_router's failover/hedging
+        self.tool_entries.append(entry)
+        self.llm_entries.append(entry)
+        return entry
+
+    def add_tool_calls(self, msg: AIMessage) -> list:
+        started = []
+        for tc in msg.tool_calls:
+            entry = {"name": tc['name'], "tool_input": tc['args'], "tool_output": "Error: Tool output not found"}
+            self.pending_tool_calls[tc['id']] = entry
+            started.append(entry)
+        return started
+
+    def add_tool_message(self, msg: ToolMessage):
+        compaction = {k: v for k, v in msg.response_metadata.items()
+                      if k in ("payload_ref", "original_tokens", "context_tokens")}
+        if msg.tool_call_id in self.completed_tool_calls:
+            # Compacted copy (from the "compact" node) of an output already logged in full
+            self.completed_tool_calls[msg.tool_call_id].update(compaction)
+            return None
+        if msg.tool_call_id not in self.pending_tool_calls:
+            return None
+        # This ToolMessage is the result of a pending tool call
+        entry = self.pending_tool_calls.pop(msg.tool_call_id) # Remove from pending
+        entry["name"] = msg.name # ToolMessage.name is the actual tool's name
+        entry["tool_output"] = msg.content
+        entry["metrics"] = {"retries": msg.response_metadata.get("http_retries", 0)}
+        if msg.response_metadata.get("memo_hit"):
+            entry["metrics"]["memo_hit"] = True # Answered from this turn's memo, the tool didn't run
+        if msg.response_metadata.get("prefetched"):
+            entry["metrics"]["prefetched"] = True # Started speculatively before the LLM asked for it
+            self.metric_ids[msg.tool_call_id] = msg.response_metadata["prefetch_call_id"]
+        if compaction:
+            # Only the compacted output is in the message; the log shows the full one
+            entry.update(compaction)
+            entry["tool_output"] = get_full_payload(compaction["payload_ref"]) or msg.content
+        self.tool_entries.append(entry)
+        self.completed_tool_calls[msg.tool_call_id] = entry
+        return entry
+
+    def finish(self) -> list:
+        # Add any remaining pending_tool_calls (should be rare if graph completes tool cycles)
+        for _id, entry_data in self.pending_tool_calls.items():
+            self.tool_entries.append(entry_data)
+        self.pending_tool_calls = {}
+        return self.tool_entries
+
+    def add_metrics(self, metrics: TurnMetrics):
+        """
+        Copies the timings and token counts collected by the turn's callbacks into the entries.
+        """
+        for entry, call in zip(self.llm_entries, metrics.llm_calls):
+            entry["tool_input"] = f"{call['context_messages']} messages in context"
+            entry["metrics"] = {k: v for k, v in call.items() if k != "context_messages"}
+        for tool_call_id, entry in self.completed_tool_calls.items():
+            tool_metrics = metrics.tool_metrics(self.metric_ids.get(tool_call_id, tool_call_id))
+            if tool_metrics:
+                entry.setdefault("metrics", {}).update(
+                    {k: v for k, v in tool_metrics.items() if v or not k.startswith("llm_")}
+                )
+
+
+def _message_text(msg: AIMessage) -> str:
+    # Claude returns content blocks; only the text blocks are the answer
+    if isinstance(msg.content, str):
+        return msg.content
+    return "".join(part.get("text", "") for part in msg.content if isinstance(part, dict))
+
+
+class _TurnEvents:
+    """
+    Turns the (mode, chunk) items of a messages+updates graph stream into UI events.
+    Shared by the sync and async streaming entry points.
+    """
+
+    def __init__(self, message: str, llm_name: str = ""):
+        self.message = message
+        self.turn_id = str(uuid.uuid4())
+        self.collector = ToolEntryCollector()
+        self.llm_name = llm_name
+        self.metrics = TurnMetrics(llm_name)
+        self.last_message = None
+        self.last_answer = None # Text of the last AIMessage that had any
+
+    def handle(self, mode: str, chunk) -> list:
+        events = []
+        if mode == "messages":
+            msg_chunk, metadata = chunk
+            # Only surface tokens of the agent LLM, not of LLMs nested inside tools (e.g. define_tool)
+            if metadata.get("langgraph_node") == "agent" and isinstance(msg_chunk, AIMessage) and msg_chunk.content:
+                text = _message_text(msg_chunk)
+                if text:
+                    events.append({"type": "token", "content": text})
+            return events
+
+        # mode == "updates": {node_name: {"messages": [...]}}
+        for node_name, update in chunk.items():
+            if node_name == "router" and (update or {}).get("route"):
+                self.collector.add_router_entry(update["route"])
+            for msg in (update or {}).get("messages", []):
+                self.last_message = msg
+                if isinstance(msg, AIMessage) and _message_text(msg):
+                    self.last_answer = _message_text(msg)
+                if node_name == "agent" and isinstance(msg, AIMessage):
+                    self.collector.add_llm_call(msg)
+                if isinstance(msg, AIMessage) and msg.tool_calls:
+                    for entry in self.collector.add_tool_calls(msg):
+                        events.append({"type": "tool_start", "name": entry["name"], "tool_input": entry["tool_input"]})
+                elif isinstance(msg, ToolMessage):
+                    entry = self.collector.add_tool_message(msg)
+                    if entry is not None:
+                        events.append({"type": "tool_end", "entry": entry})
+        return events
+
+    def final(self) -> dict:
+        # The parsed response is the text of the final state's last AIMessage. A turn can end
+        # without one (e.g. it failed right after a router-dispatched tool call): log "" then.
+        if self.last_message is None:
+            final_parsed_response = "Error: Could not get response from agent."
+        else:
+            final_parsed_response = self.last_answer or ""
+
+        tool_entries = self.collector.finish()
+        self.collector.add_metrics(self.metrics)
+        turn_metrics = self.metrics.summary()
+        if lang_graph.prefetcher is not None:
+            # Speculative calls the LLM didn't ask for are dropped now
+            turn_metrics["prefetch"] = lang_graph.prefetcher.finish(self.turn_id)
+        logging.debug(f"--- [chat_service.py] Final tool_entries: {tool_entries}")
+
+        used_tools_names = list(set(entry['name'] for entry in tool_entries
+                                    if entry.get("kind") != "llm" and entry['name'] != "tool_determination_router"))
+
+        return {
+            "type": "final",
+            "entry": {
+                "id": uuid.uuid4().hex, # Stable key of this interaction in the UI log
+                "query": self.message,
+                "llm": self.llm_name, # The selected model; call_model steps name the provider that answered
+                "raw": "LangGraph Agent Invoked", # Indicate that the agent was used
+                "parsed": final_parsed_response, # The final processed response
+                "tool_entries": tool_entries,
+                "used_tools": used_tools_names,
+                "metrics": turn_metrics, # Turn wall time, time per node, LLM token totals, prefetch outcome
+            },
+        }
+
+
+def _turn_config(session_id: Optional[str], turn: _TurnEvents) -> dict:
+    # turn_id lets tools keep per-turn state, e.g. search results already shown this turn
+    return {"configurable": {"thread_id": session_id or str(uuid.uuid4())},
+            "metadata": {"turn_id": turn.turn_id},
+            "callbacks": [turn.metrics]}
+
+
+def stream_chat_fn(message: str, llm_name: str, session_id: Optional[str] = None) -> Iterator[dict]:
+    """
+    Streams the LangGraph agent run for the user message.
+    session_id selects the checkpointed conversation thread; without one the turn
+    runs in a fresh thread with no memory of earlier turns.
+    Yields events as they happen:
+      {"type": "token", "content": str}            - LLM tokens from the agent node
+      {"type": "tool_start", "name", "tool_input"}  - a tool call proposed by the agent
+      {"type": "tool_end", "entry": dict}           - a finished tool call (tool_entries item)
+      {"type": "final", "entry": dict}              - the same dict chat_fn returns
+    Every step in the final tool_entries (tool calls and "call_model" LLM calls) carries
+    a "metrics" dict with its wall time, tokens and retries, see metrics.TurnMetrics.
+    """
+    turn = _TurnEvents(message, llm_name)
+    logging.debug(f"--- [chat_service.py] Streaming agent_graph with message: {message}")
+    agent_graph = get_agent_graph(llm_name) # Compiled once per model, then cached
+    for mode, chunk in agent_graph.stream({"messages": [HumanMessage(content=message)]}, _turn_config(session_id, turn),
+                                          stream_mode=["messages", "updates"]):
+        yield from turn.handle(mode, chunk)
+    yield turn.final()
+
+
+async def astream_chat_fn(message: str, llm_name: str, session_id: Optional[str] = None) -> AsyncIterator[dict]:
+    """
+    Async version of stream_chat_fn. The graph runs via astream, so LLM calls and
+    tools with a coroutine wait on the event loop instead of holding a thread.
+    """
+    turn = _TurnEvents(message, llm_name)
+    logging.debug(f"--- [chat_service.py] Async streaming agent_graph with message: {message}")
+    agent_graph = get_agent_graph(llm_name)
+    async for mode, chunk in agent_graph.astream({"messages": [HumanMessage(content=message)]}, _turn_config(session_id, turn),
+                                                 stream_mode=["messages", "updates"]):
+        for event in turn.handle(mode, chunk):
+            yield event
+    yield turn.final()
+
+
+def chat_fn(message: str, llm_name: str, session_id: Optional[str] = None) -> dict:
     """
     Invokes the LangGraph agent with the user message.
     Extracts tool usage information for logging and visualization.
     """
-    user_msg = HumanMessage(content=message)
-
-    # Invoke the LangGraph agent.
-    # We stream the graph to capture all intermediate steps/messages.
-    # Use invoke to get the final state directly for non-streaming output
-    logging.debug(f"--- [chat_service.py] Invoking agent_graph with message: {message}")
-    final_state_dict = agent_graph.invoke({"messages": [user_msg]})
-    logging.debug(f"--- [chat_service.py] agent_graph.invoke returned state: {final_state_dict}")
-
-    final_messages = final_state_dict.get('messages', [])
-    logging.debug(f"--- [chat_service.py] Extracted final_messages: {final_messages}")
-
-    # Extract the last message from the final state as the parsed response
-    final_parsed_response = "Error: Could not get response from agent."
-    if final_messages and hasattr(final_messages[-1], 'content'):
-        final_parsed_response = final_messages[-1].content
-
-    tool_entries = []
-    pending_tool_calls = {} # Store AIMessage tool_calls by id to match with ToolMessage
-
-    for msg in final_messages:
-        if isinstance(msg, AIMessage) and msg.tool_calls:
-            for tc in msg.tool_calls:
-                pending_tool_calls[tc['id']] = {"name": tc['name'], "tool_input": tc['args'], "tool_output": "Error: Tool output not found"}
-        elif isinstance(msg, ToolMessage):
-            if msg.tool_call_id in pending_tool_calls:
-                # This ToolMessage is the result of a pending tool call
-                entry = pending_tool_calls.pop(msg.tool_call_id) # Remove from pending
-                entry["name"] = msg.name # ToolMessage.name is the actual tool's name
-                entry["tool_output"] = msg.content
-                tool_entries.append(entry)
-
-    # Add any remaining pending_tool_calls (should be rare if graph completes tool cycles)
-    for _id, entry_data in pending_tool_calls.items():
-        tool_entries.append(entry_data)
-    logging.debug(f"--- [chat_service.py] Final tool_entries: {tool_entries}")
-
-    used_tools_names = list(set(entry['name'] for entry in tool_entries))
-
-    return {
-      "query": message,
-      "raw": "LangGraph Agent Invoked", # Indicate that the agent was used
-      "parsed": final_parsed_response, # The final processed response
-      "tool_entries": tool_entries,
-      "used_tools": used_tools_names
-    }
+    # Drain the stream; tool entries are collected as the graph runs.
+    for event in stream_chat_fn(message, llm_name, session_id):
+        if event["type"] == "final":
+            return event["entry"]
+    raise RuntimeError("Agent stream ended without a final event.")
+
+
+async def achat_fn(message: str, llm_name: str, session_id: Optional[str] = None) -> dict:
+    """
+    Async version of chat_fn.
+    """
+    async for event in astream_chat_fn(message, llm_name, session_id):
+        if event["type"] == "final":
+            return event["entry"]
+    raise RuntimeError("Agent stream ended without a final event.")
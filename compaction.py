@@ -0,0 +1,129 @@
+import json
+import logging
+import uuid
+from langchain_core.messages import AIMessage, ToolMessage
+
+from cache_store import TieredCache
+from config import TOOL_OUTPUT_TOKEN_BUDGET, TOOL_OUTPUT_TOKEN_BUDGETS, TOOL_PAYLOAD_TTL_SECONDS
+
+# Compaction of tool outputs before they re-enter the LLM context.
+# The "compact" graph node runs between "action" and "agent". For each new ToolMessage it:
+#   - strips fields the LLM never needs (raw_content, images, follow_up_questions, ...) from JSON output
+#   - cuts the output to the tool's token budget (TOOL_OUTPUT_TOKEN_BUDGET / TOOL_OUTPUT_TOKEN_BUDGETS)
+#   - keeps the full output in a side store; the compacted message carries a payload_ref to it
+# The checkpointed history therefore only holds compacted outputs, which every later
+# call_model iteration resends, while the UI log can still show the full payload.
+
+logger = logging.getLogger(__name__)
+
+REDUNDANT_FIELDS = frozenset({"raw_content", "images", "follow_up_questions", "response_time", "request_id"})
+
+_encoding = None
+_payloads = None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local token count: tiktoken's cl100k_base when it is available, otherwise ~4 characters per token.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception: # Not installed, or the encoding file cannot be fetched offline
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _payload_store() -> TieredCache:
+    global _payloads
+    if _payloads is None:
+        _payloads = TieredCache("tool_payloads", ttl=TOOL_PAYLOAD_TTL_SECONDS)
+    return _payloads
+
+
+def get_full_payload(payload_ref: str):
+    """
+    Returns the uncompacted tool output stored under payload_ref, or None once it has expired.
+    """
+    return _payload_store().get(payload_ref)
+
+
+def _strip(value):
+    if isinstance(value, dict):
+        return {k: _strip(v) for k, v in value.items() if k not in REDUNDANT_FIELDS and v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [_strip(v) for v in value]
+    return value
+
+
+def _truncate(text: str, budget: int) -> str:
+    # Binary search on the character length, so the result fits the budget with any tokenizer
+    if estimate_tokens(text) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+def compact_text(text: str, budget: int) -> str:
+    """
+    Strips redundant JSON fields from a tool output and cuts it to budget tokens.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        data = None
+    if isinstance(data, (dict, list)):
+        text = json.dumps(_strip(data), separators=(",", ":"), ensure_ascii=False)
+    if estimate_tokens(text) <= budget:
+        return text
+    marker = " ...[truncated]"
+    return _truncate(text, max(0, budget - estimate_tokens(marker))) + marker
+
+
+def _new_tool_messages(messages) -> list:
+    # ToolMessages answering the last AIMessage, i.e. the output of the "action" step that just ran
+    new = []
+    for msg in reversed(messages):
+        if isinstance(msg, AIMessage):
+            break
+        if isinstance(msg, ToolMessage):
+            new.append(msg)
+    return list(reversed(new))
+
+
+def compact_tool_outputs(state) -> dict:
+    """
+    Graph node: replaces the latest ToolMessages (same message id) with their compacted versions.
+    """
+    replaced = []
+    for msg in _new_tool_messages(state["messages"]):
+        if not isinstance(msg.content, str) or "payload_ref" in msg.response_metadata:
+            continue
+        budget = TOOL_OUTPUT_TOKEN_BUDGETS.get(msg.name, TOOL_OUTPUT_TOKEN_BUDGET)
+        compacted = compact_text(msg.content, budget)
+        if compacted == msg.content:
+            continue
+        payload_ref = uuid.uuid4().hex
+        _payload_store().set(payload_ref, msg.content)
+        original_tokens, context_tokens = estimate_tokens(msg.content), estimate_tokens(compacted)
+        logger.debug(f"Compacted {msg.name} output from {original_tokens} to {context_tokens} tokens ({payload_ref})")
+        replaced.append(msg.model_copy(update={
+            "content": compacted,
+            "response_metadata": {
+                **msg.response_metadata,
+                "payload_ref": payload_ref,
+                "original_tokens": original_tokens,
+                "context_tokens": context_tokens,
+            },
+        }))
+    return {"messages": replaced}
@@ -1,4 +1,5 @@
 import os
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,8 +7,108 @@ load_dotenv()
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+TAVILY_API_URL = os.getenv("TAVILY_API_URL", "https://api.tavily.com")
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "3600")) # Per normalized query
+SEARCH_FETCH_RESULTS = int(os.getenv("SEARCH_FETCH_RESULTS", "5")) # Results fetched and cached per query; tools slice to top_n
 
 # Weather API
-NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
-NWS_POINTS_URL_TEMPLATE = "https://api.weather.gov/points/{lat},{lon}"
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+NWS_POINTS_URL_TEMPLATE = os.getenv("NWS_POINTS_URL_TEMPLATE", "https://api.weather.gov/points/{lat},{lon}")
 NWS_USER_AGENT = "weather-tool/1.0"
+WEATHER_GEOCODE_TTL_SECONDS = float(os.getenv("WEATHER_GEOCODE_TTL_SECONDS", str(30 * 86400))) # location -> lat/lon
+WEATHER_POINTS_TTL_SECONDS = float(os.getenv("WEATHER_POINTS_TTL_SECONDS", str(7 * 86400))) # lat/lon -> forecast URL
+WEATHER_FORECAST_TTL_SECONDS = float(os.getenv("WEATHER_FORECAST_TTL_SECONDS", "600")) # Used when NWS sends no cache headers
+
+# Tool HTTP layer (tools/http_client.py)
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3")) # Retries on 429/5xx and connection errors
+HTTP_BACKOFF_BASE_SECONDS = float(os.getenv("HTTP_BACKOFF_BASE_SECONDS", "0.5"))
+HTTP_BACKOFF_MAX_SECONDS = float(os.getenv("HTTP_BACKOFF_MAX_SECONDS", "8"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20")) # Keep-alive connections per host
+# Requests per second allowed per host; hosts not listed are not throttled
+HTTP_HOST_RATE_LIMITS = {
+    urlsplit(NOMINATIM_URL).netloc: 1.0, # Nominatim usage policy: at most 1 request per second
+}
+
+# Conversation memory
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "checkpoints.sqlite") # SQLite file holding session threads
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000")) # Max history tokens sent to the LLM
+# Old turns are dropped in steps of about this many tokens, so the history prefix stays the same for several turns
+CONTEXT_TRIM_STEP_TOKENS = int(os.getenv("CONTEXT_TRIM_STEP_TOKENS", str(CONTEXT_TOKEN_BUDGET // 2)))
+
+# Caching
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "cache.sqlite") # SQLite file shared by the on-disk cache tiers
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MAX_MEMORY_ITEMS", "256"))
+LLM_CACHE_MAX_DISK_ITEMS = int(os.getenv("LLM_CACHE_MAX_DISK_ITEMS", "5000"))
+
+# Tool registry: cached names/descriptions/schemas of the tools package
+TOOL_MANIFEST_PATH = os.getenv("TOOL_MANIFEST_PATH", "tool_manifest.json") # Runtime state, next to the SQLite files
+
+# Tool execution
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "8")) # Concurrent tool calls per process
+# Per tool call. On the sync path a timed-out call is only abandoned: its thread keeps a
+# TOOL_MAX_WORKERS slot until the tool returns, which the HTTP layer's own request timeouts
+# bound. Keep TOOL_MAX_WORKERS above the calls that may hang at once (calls per step x sessions).
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "30"))
+# Tool calls repeated within a turn are answered from a per-turn memo, except for these tools
+TOOL_MEMO_EXCLUDED_TOOLS = frozenset(
+    name.strip() for name in os.getenv("TOOL_MEMO_EXCLUDED_TOOLS", "recipe_tool").split(",") if name.strip()
+)
+TOOL_MEMO_MAX_TURNS = int(os.getenv("TOOL_MEMO_MAX_TURNS", "256")) # Turns whose memo is kept in memory
+
+# Speculative tool calls (prefetch.py) started from the user message while the agent LLM decides
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+# Only the cheap, cached weather lookups by default. define_tool is opt-in since it makes its own
+# paid Claude call; search too, since the LLM rarely words a query like the user did.
+PREFETCH_TOOLS = frozenset(
+    name.strip() for name in os.getenv("PREFETCH_TOOLS", "weather_tool").split(",") if name.strip()
+)
+PREFETCH_MAX_CALLS = int(os.getenv("PREFETCH_MAX_CALLS", "3")) # Per turn
+
+# Local intent router (router.py), run before the agent LLM
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1") == "1"
+ROUTER_DISPATCH_THRESHOLD = float(os.getenv("ROUTER_DISPATCH_THRESHOLD", "0.9")) # Min confidence to call a tool directly
+ROUTER_SUBSET_THRESHOLD = float(os.getenv("ROUTER_SUBSET_THRESHOLD", "0.2")) # Min similarity to bind only the closest tools
+ROUTER_SUBSET_RATIO = float(os.getenv("ROUTER_SUBSET_RATIO", "0.5")) # Tools scoring at least this share of the best are kept
+
+# Anthropic prompt caching: cache breakpoints on the stable prompt prefix of every Claude request
+ANTHROPIC_PROMPT_CACHE_ENABLED = os.getenv("ANTHROPIC_PROMPT_CACHE_ENABLED", "1") == "1"
+
+# Provider failover and hedging (llm_router.py) for the agent LLM
+LLM_FAILOVER_ENABLED = os.getenv("LLM_FAILOVER_ENABLED", "1") == "1"
+LLM_FAILOVER_ORDER = { # Selected model -> providers tried, in order
+    "DeepSeek": ["DeepSeek", "Claude"],
+    "Claude": ["Claude", "DeepSeek"],
+}
+# Opt-in: a hedge is a second paid request, possibly answered by the other provider
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "0") == "1" # Race the next provider when the first token is late
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")) # First-token samples needed to use the p95
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "8")) # Hedge delay until then
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3")) # Consecutive failures that open a provider's breaker
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30")) # Until a trial call is let through
+
+# Tool output compaction: max tokens of one tool output kept in the LLM context
+TOOL_OUTPUT_TOKEN_BUDGET = int(os.getenv("TOOL_OUTPUT_TOKEN_BUDGET", "600"))
+TOOL_OUTPUT_TOKEN_BUDGETS = { # Per-tool overrides, by tool name
+    "recipe_tool": 1200,
+    "weather_batch_tool": 1000,
+}
+TOOL_PAYLOAD_TTL_SECONDS = float(os.getenv("TOOL_PAYLOAD_TTL_SECONDS", "604800")) # Full outputs kept for the UI log
+
+# UI interaction log
+LOG_PAGE_SIZE = int(os.getenv("LOG_PAGE_SIZE", "10")) # Interactions rendered per log page
+LOG_MAX_ENTRIES = int(os.getenv("LOG_MAX_ENTRIES", "50")) # Interactions kept in session memory
+LOG_SPILL_DIR = os.getenv("LOG_SPILL_DIR", "") # If set, interactions dropped from memory are appended here as JSONL
+
+# Headless chat API (server.py) and the UI's client of it
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "8")) # Turns run concurrently per process
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "32")) # Turns waiting for a worker; beyond that: 429
+CHAT_API_URL = os.getenv("CHAT_API_URL", "") # e.g. http://127.0.0.1:8000; if set, the Streamlit UI calls the API
+CHAT_API_TIMEOUT_SECONDS = float(os.getenv("CHAT_API_TIMEOUT_SECONDS", "300"))
+
+# Metrics: Prometheus text endpoint (http://METRICS_HOST:METRICS_PORT/metrics); port 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
@@ -1,12 +1,17 @@
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode
 from langgraph.prebuilt import tools_condition 
 from langchain_core.messages import BaseMessage, AIMessage, HumanMessage, ToolMessage
-from langchain_tavily import TavilySearch
-from typing import Annotated, Sequence, TypedDict
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from typing import Annotated, List, Optional, Sequence, TypedDict
+import threading
 import logging
 
+from config import LLM_FAILOVER_ENABLED, PREFETCH_ENABLED, ROUTER_ENABLED
+from memory import get_checkpointer, trim_context
+from compaction import compact_tool_outputs
+from router import ToolRouter, after_route, message_text, route_node
+
 _LANG_GRAPH_INITIALIZATION_RAN = False
 logger = logging.getLogger(__name__)
 
@@ -15,128 +20,177 @@ logger = logging.getLogger(__name__)
 # The state will track the conversation history
 class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
+    selected_tools: Optional[List[str]] # Tools the router picked for this turn; None binds all of them
+    route: Optional[dict] # The router's decision for this turn, as logged in tool_entries
 
-agent_llm_name = "DeepSeek" # Or "Claude"
-core_llm = None
-llm_with_tools = None
+agent_llm_name = "DeepSeek" # Default model; chat_fn picks a graph per request
 available_tools = []
 tool_node = None # Define tool_node here
+prefetcher = None # Speculative tool calls (prefetch.py), if PREFETCH_ENABLED
 agent_graph = None # Define agent_graph here
-
-# This node takes the state (messages) and invokes the LLM with tools
-def call_model(state: AgentState):
-    if llm_with_tools is None:
-        raise RuntimeError("LangGraph's llm_with_tools was not initialized properly.")
-    messages = state['messages']
-    
-    # --- Logic to detect and prevent redundant weather_tool calls ---
-    last_executed_tool_name = None
-    last_executed_tool_args = None
-
-    # Check if the last message in history is a ToolMessage
-    if messages and isinstance(messages[-1], ToolMessage):
-        last_tool_message = messages[-1]
-        # The 'name' attribute of ToolMessage should be the actual tool's name
-        last_executed_tool_name = last_tool_message.name 
-
-        # Find the AIMessage that made this tool_call to get its arguments
-        for i in range(len(messages) - 2, -1, -1):
-            prev_msg = messages[i]
-            if isinstance(prev_msg, AIMessage) and prev_msg.tool_calls:
-                for tc in prev_msg.tool_calls:
-                    if tc['id'] == last_tool_message.tool_call_id:
-                        # Ensure the name from AIMessage matches for robustness, though ToolMessage.name is primary
-                        if tc['name'] != last_executed_tool_name:
-                            pass
-                        last_executed_tool_name = tc['name']
-                        last_executed_tool_args = tc['args']
-                        break # Found the specific tool_call
-            if last_executed_tool_args is not None: # Args for the last ToolMessage are found
-                break
-
-    # The LLM will decide if it needs to call a tool based on the messages and bound tools
-    llm_response = llm_with_tools.invoke(messages)
-
-    # --- Check LLM's new decision for redundant weather_tool call ---
-    if hasattr(llm_response, 'tool_calls') and llm_response.tool_calls:
-        current_llm_tool_calls = llm_response.tool_calls
-        filtered_tool_calls = []
-        modified_call_list = False
-
-        for proposed_tc in current_llm_tool_calls:
-            is_redundant = False
-            if last_executed_tool_name and last_executed_tool_args is not None: # Check only if a previous tool ran
-                if proposed_tc['name'] == "weather_tool" and \
-                    last_executed_tool_name == "weather_tool" and \
-                    proposed_tc['args'] == last_executed_tool_args: # Exact name and args match
-                    modified_call_list = True
-                    is_redundant = True
-            
-            if not is_redundant:
-                filtered_tool_calls.append(proposed_tc)
-        
-        if modified_call_list:
+_agent_graphs = {} # llm_name -> compiled graph
+_agent_graphs_lock = threading.Lock()
+
+def _last_step_keys(messages, config) -> set:
+    """
+    Memo keys (tool name, canonical args) of the tool calls answered by the last "action" step.
+    Only the trailing ToolMessages are read; their args come from the tool node's per-turn index.
+    """
+    tool_call_ids = []
+    for msg in reversed(messages):
+        if not isinstance(msg, ToolMessage):
+            break
+        tool_call_ids.append(msg.tool_call_id)
+    if not tool_call_ids:
+        return set()
+    return tool_node.memo.keys_for(config, tool_call_ids)
+
+
+def _suppress_redundant_calls(llm_response, last_step_keys):
+    # --- Drop proposed calls identical to one the previous step just answered (agent loops) ---
+    # Other repeats within the turn still reach the tool node, which answers them from its memo.
+    if last_step_keys and hasattr(llm_response, 'tool_calls') and llm_response.tool_calls:
+        filtered_tool_calls = [tc for tc in llm_response.tool_calls if tool_node.memo.key(tc) not in last_step_keys]
+
+        if len(filtered_tool_calls) != len(llm_response.tool_calls):
             llm_response.tool_calls = filtered_tool_calls
             if not filtered_tool_calls: # All proposed tool calls were suppressed
                 if not llm_response.content: # If LLM provided no text content
                     llm_response.content = "The requested information was previously retrieved. Please let me know if you need a summary or further assistance."
     # --- End of redundancy suppression ---
+    return llm_response
 
-    return {"messages": [llm_response]}
 
-core_llm = None
-llm_with_tools = None
-available_tools = []
-tool_node = None
-agent_graph = None
+# This node takes the state (messages) and invokes the LLM with tools
+def call_model(state: AgentState, llm_with_tools, config: RunnableConfig = None):
+    if llm_with_tools is None:
+        raise RuntimeError("LangGraph's llm_with_tools was not initialized properly.")
+    messages = state['messages']
+    last_step_keys = _last_step_keys(messages, config)
 
-if not _LANG_GRAPH_INITIALIZATION_RAN:
+    # The LLM will decide if it needs to call a tool based on the messages and bound tools.
+    # Older turns are trimmed so the prompt stays within the context token budget.
+    llm_response = llm_with_tools.invoke(trim_context(messages))
 
-    # Moved imports to be part of the one-time execution block
-    # This is useful if these imports are costly or have side-effects.
-    from llm import get_llm
-    from tools import tool_box
+    return {"messages": [_suppress_redundant_calls(llm_response, last_step_keys)]}
 
-    core_llm = get_llm(agent_llm_name)
 
-    available_tools = list(tool_box.values()) if tool_box else []
+# Async version of call_model, used when the graph runs via ainvoke/astream
+async def acall_model(state: AgentState, llm_with_tools, config: RunnableConfig = None):
+    if llm_with_tools is None:
+        raise RuntimeError("LangGraph's llm_with_tools was not initialized properly.")
+    messages = state['messages']
+    last_step_keys = _last_step_keys(messages, config)
+
+    llm_response = await llm_with_tools.ainvoke(trim_context(messages))
 
-    # Add TavilySearch tool
-    try:
-        # You can customize max_results and other parameters
-        tavily_web_search = TavilySearch(max_results=2, name="tavily_search_results_json")
-        available_tools.append(tavily_web_search)
-    except Exception as e:
-        pass
+    return {"messages": [_suppress_redundant_calls(llm_response, last_step_keys)]}
 
 
+def build_agent_graph(core_llm, stable_tools: bool = False):
+    """
+    Binds the tools to core_llm and compiles the router/agent/action graph for it.
+    With stable_tools, every call is bound to all tools, ignoring the router's subset, so the
+    tool definitions at the start of the prompt stay identical for the provider's prompt cache.
+    """
     if available_tools:
-        llm_with_tools = core_llm.bind_tools(available_tools) # Assign to module-level llm_with_tools
+        llm_with_tools = core_llm.bind_tools(available_tools)
     else:
-        llm_with_tools = core_llm # Assign to module-level llm_with_tools
-
-    # ToolNode must be created after available_tools is populated.
-    tool_node = ToolNode(available_tools) # Assign to module-level tool_node
-
-    # Graph wiring and compilation
+        llm_with_tools = core_llm
+    subset_llms = {} # frozenset of tool names -> core_llm bound to only those tools
+
+    def llm_for(state: AgentState):
+        selected = state.get("selected_tools")
+        if stable_tools or not available_tools or not selected or len(selected) == len(available_tools):
+            return llm_with_tools
+        key = frozenset(selected)
+        if key not in subset_llms:
+            subset_llms[key] = core_llm.bind_tools([t for t in available_tools if t.name in key])
+        return subset_llms[key]
+
+    def agent_node(state: AgentState, config: RunnableConfig):
+        return call_model(state, llm_for(state), config)
+
+    async def aagent_node(state: AgentState, config: RunnableConfig):
+        return await acall_model(state, llm_for(state), config)
+
+    # Graph wiring and compilation. Each node has a sync and an async implementation,
+    # so the same compiled graph serves invoke/stream and ainvoke/astream.
     workflow = StateGraph(AgentState)
-    workflow.add_node("agent", call_model) # call_model function is defined below
-    workflow.add_node("action", tool_node) # Uses the initialized tool_node
-    workflow.set_entry_point("agent")
+    # The local router picks the tools (or dispatches an obvious call) before any LLM runs
+    router = ToolRouter(available_tools) if ROUTER_ENABLED and available_tools else None
+    route = route_node(router)
+
+    def router_node(state: AgentState, config: RunnableConfig):
+        update = route(state)
+        if prefetcher is not None and not update.get("messages") and isinstance(state["messages"][-1], HumanMessage):
+            # The agent LLM decides next; likely tool calls already start in the background
+            prefetcher.start(message_text(state["messages"][-1]), config)
+        return update
+
+    workflow.add_node("router", RunnableLambda(router_node, name="router"))
+    workflow.add_node("agent", RunnableLambda(agent_node, afunc=aagent_node, name="agent"))
+    # The tool node is shared by every model's graph
+    workflow.add_node("action", RunnableLambda(tool_node.__call__, afunc=tool_node.acall, name="action"))
+    # Tool outputs are cut to their token budget before the agent sees them
+    workflow.add_node("compact", compact_tool_outputs)
+    workflow.set_entry_point("router")
+    workflow.add_conditional_edges("router", after_route, {"action": "action", "agent": "agent"})
     workflow.add_conditional_edges(
         "agent",
         tools_condition,
         {"tools": "action", END: END}
     )
-    workflow.add_edge("action", "agent")
-    agent_graph = workflow.compile() # Assign to module-level agent_graph
+    workflow.add_edge("action", "compact")
+    workflow.add_edge("compact", "agent")
+    # The checkpointer keeps one conversation thread per session (thread_id in the run config)
+    return workflow.compile(checkpointer=get_checkpointer())
+
+
+def get_agent_graph(llm_name: str = agent_llm_name):
+    """
+    Returns the compiled graph for llm_name ("DeepSeek" or "Claude").
+    Tool binding and compilation happen once per model; later calls reuse the cached graph.
+    """
+    graph = _agent_graphs.get(llm_name)
+    if graph is not None:
+        return graph
+    with _agent_graphs_lock:
+        graph = _agent_graphs.get(llm_name)
+        if graph is None:
+            # With failover, a slow or failing provider is backed by the other one (llm_router.py)
+            graph = build_agent_graph(get_routed_llm(llm_name) if LLM_FAILOVER_ENABLED else get_llm(llm_name),
+                                      stable_tools=caches_prompt_prefix(llm_name))
+            _agent_graphs[llm_name] = graph
+            logger.debug(f"Compiled agent graph for {llm_name}")
+    return graph
 
-    _LANG_GRAPH_INITIALIZATION_RAN = True
 
-# You can optionally add a checkpointer here for memory across turns
-# from langgraph.checkpoint.memory import MemorySaver
-# memory = MemorySaver()
-# agent_graph = workflow.compile(checkpointer=memory)
+if not _LANG_GRAPH_INITIALIZATION_RAN:
+
+    # Moved imports to be part of the one-time execution block
+    # This is useful if these imports are costly or have side-effects.
+    from llm import caches_prompt_prefix, get_llm, startup_report
+    from llm_router import get_routed_llm
+    from tools import tool_box
+
+    available_tools = list(tool_box.values()) if tool_box else []
+
+    # "tavily_search_results_json" (formerly langchain_tavily's TavilySearch) is now defined in
+    # tools/web_search.py so both search tools share one cached, deduplicating backend.
+
+    # The tool node must be created after available_tools is populated.
+    # ParallelToolNode runs independent tool_calls of one step concurrently.
+    from tool_executor import ParallelToolNode
+    tool_node = ParallelToolNode(available_tools) # Assign to module-level tool_node
+    if PREFETCH_ENABLED:
+        from prefetch import Prefetcher
+        prefetcher = Prefetcher(tool_node)
+
+    agent_graph = get_agent_graph(agent_llm_name) # Graph of the default model
+
+    _LANG_GRAPH_INITIALIZATION_RAN = True
+    logger.debug(f"LLM provider startup cost: {startup_report()}")
 
-# Export the compiled graph for use in chat_service.py
-__all__ = ["agent_graph"]
\ No newline at end of file
+# Export the graph factory for use in chat_service.py
+__all__ = ["agent_graph", "get_agent_graph", "build_agent_graph"]
\ No newline at end of file
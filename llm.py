@@ -1,31 +1,212 @@
-from config import DEEPSEEK_API_KEY, ANTHROPIC_API_KEY
-from langchain_deepseek import ChatDeepSeek
-from langchain_anthropic import ChatAnthropic
-
-__all__ = ["get_llm"]
-
-
-# Initialize DeepSeek LLM with tools
-llm_deepseek = ChatDeepSeek(
-    model="deepseek-chat",
-    api_key=DEEPSEEK_API_KEY,
-    temperature=0.25,
-    max_tokens=8192,
-)
-
-# Initialize Claude LLM with tools
-llm_claude = ChatAnthropic(
-    api_key=ANTHROPIC_API_KEY,
-    model="claude-3-7-sonnet-20250219",
-    temperature=0.0,
-    max_tokens=1024,
-)
-
-
-def get_llm(model_name: str):
-    if model_name == "DeepSeek":
-        return llm_deepseek
-    elif model_name == "Claude":
-        return llm_claude
-    else:
+from config import DEEPSEEK_API_KEY, ANTHROPIC_API_KEY, ANTHROPIC_PROMPT_CACHE_ENABLED
+from llm_cache import get_llm_cache
+import importlib
+import threading
+import time
+import logging
+
+__all__ = ["get_llm", "startup_report", "caches_prompt_prefix", "add_cache_breakpoints"]
+
+logger = logging.getLogger(__name__)
+
+# Default settings per selectable model. Provider SDKs are only imported when a
+# model of that provider is first requested.
+_MODEL_SPECS = {
+    "DeepSeek": {"provider": "deepseek", "model": "deepseek-chat", "temperature": 0.25, "max_tokens": 8192},
+    "Claude": {"provider": "anthropic", "model": "claude-3-7-sonnet-20250219", "temperature": 0.0, "max_tokens": 1024},
+}
+
+_clients = {} # (model_name, temperature, max_tokens) -> chat model
+_clients_lock = threading.Lock()
+_http_client = None
+_startup_costs = {} # provider -> {"import_seconds": float, "init_seconds": float, "clients": int}
+
+
+def _get_http_client():
+    """
+    One keep-alive httpx client shared by the OpenAI-compatible (DeepSeek) clients.
+    httpx pools connections per host, so all DeepSeek clients reuse warm TLS connections.
+    """
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+    return _http_client
+
+
+def _build_deepseek(model: str, temperature: float, max_tokens: int):
+    from langchain_deepseek import ChatDeepSeek
+    return ChatDeepSeek(
+        model=model,
+        api_key=DEEPSEEK_API_KEY,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        http_client=_get_http_client(),
+        cache=get_llm_cache(),
+    )
+
+
+_EPHEMERAL = {"type": "ephemeral"}
+
+
+def _mark_last_block(message: dict) -> bool:
+    # Breakpoint on the message's last block that can carry one (not thinking, not empty text)
+    content = message.get("content")
+    if isinstance(content, str):
+        if not content:
+            return False
+        message["content"] = [{"type": "text", "text": content, "cache_control": _EPHEMERAL}]
+        return True
+    for block in reversed(content or []):
+        if not isinstance(block, dict) or block.get("type") in ("thinking", "redacted_thinking"):
+            continue
+        if block.get("type") == "text" and not block.get("text"):
+            continue
+        block["cache_control"] = _EPHEMERAL
+        return True
+    return False
+
+
+def _is_turn_start(message: dict) -> bool:
+    # A user message with the user's own text; tool results come back as user messages too
+    if message.get("role") != "user":
+        return False
+    content = message.get("content")
+    return isinstance(content, str) or any(
+        isinstance(block, dict) and block.get("type") != "tool_result" for block in content or []
+    )
+
+
+def _has_breakpoint(payload: dict) -> bool:
+    blocks = list(payload.get("tools") or [])
+    if isinstance(payload.get("system"), list):
+        blocks += payload["system"]
+    for message in payload.get("messages") or []:
+        if isinstance(message.get("content"), list):
+            blocks += message["content"]
+    return any(isinstance(block, dict) and "cache_control" in block for block in blocks)
+
+
+def add_cache_breakpoints(payload: dict) -> dict:
+    """
+    Adds Anthropic prompt caching breakpoints to a Messages API request payload, in place.
+    The prompt is tools, then system, then messages, and each breakpoint caches everything
+    before it: the tool definitions, the system prompt, the history before the current turn
+    (read back by the next turn) and the whole prompt (read back by the turn's next step).
+    That is the API's limit of 4. Payloads that already carry breakpoints are left alone.
+    """
+    if _has_breakpoint(payload):
+        return payload
+    tools = payload.get("tools")
+    if tools:
+        tools[-1] = {**tools[-1], "cache_control": _EPHEMERAL}
+    system = payload.get("system")
+    if isinstance(system, str) and system:
+        payload["system"] = [{"type": "text", "text": system, "cache_control": _EPHEMERAL}]
+    elif isinstance(system, list) and system:
+        _mark_last_block({"content": system})
+    messages = payload.get("messages") or []
+    turn_start = max((i for i, m in enumerate(messages) if _is_turn_start(m)), default=0)
+    for i in sorted({turn_start - 1, len(messages) - 1}):
+        if i >= 0:
+            _mark_last_block(messages[i])
+    return payload
+
+
+_anthropic_class = None
+
+
+def _prompt_caching_anthropic():
+    # Defined on first use, so langchain_anthropic is only imported when Claude is requested
+    global _anthropic_class
+    if _anthropic_class is None:
+        from langchain_anthropic import ChatAnthropic
+
+        class PromptCachingChatAnthropic(ChatAnthropic):
+            """
+            ChatAnthropic adding prompt caching breakpoints to every request (add_cache_breakpoints).
+            """
+
+            def _get_request_payload(self, input_, *, stop=None, **kwargs) -> dict:
+                return add_cache_breakpoints(super()._get_request_payload(input_, stop=stop, **kwargs))
+
+        _anthropic_class = PromptCachingChatAnthropic
+    return _anthropic_class
+
+
+def _build_anthropic(model: str, temperature: float, max_tokens: int):
+    from langchain_anthropic import ChatAnthropic
+    model_class = _prompt_caching_anthropic() if ANTHROPIC_PROMPT_CACHE_ENABLED else ChatAnthropic
+    # langchain_anthropic keeps one pooled httpx client per base URL for all ChatAnthropic instances
+    return model_class(
+        api_key=ANTHROPIC_API_KEY,
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        cache=get_llm_cache(),
+    )
+
+
+def caches_prompt_prefix(model_name: str) -> bool:
+    """
+    True if model_name's requests use provider prompt caching, which pays off only when the
+    prompt prefix (tools, system prompt, older history) is byte-identical from turn to turn.
+    """
+    spec = _MODEL_SPECS.get(model_name)
+    return bool(spec) and spec["provider"] == "anthropic" and ANTHROPIC_PROMPT_CACHE_ENABLED
+
+
+_BUILDERS = {"deepseek": _build_deepseek, "anthropic": _build_anthropic}
+_PROVIDER_MODULES = {"deepseek": "langchain_deepseek", "anthropic": "langchain_anthropic"}
+
+
+def get_llm(model_name: str, temperature: float = None, max_tokens: int = None):
+    """
+    Returns the chat model for model_name ("DeepSeek" or "Claude"), built on first use
+    and memoized per (model_name, temperature, max_tokens).
+    """
+    spec = _MODEL_SPECS.get(model_name)
+    if spec is None:
         raise ValueError(f"Unknown model name: {model_name}")
+    temperature = spec["temperature"] if temperature is None else temperature
+    max_tokens = spec["max_tokens"] if max_tokens is None else max_tokens
+    key = (model_name, temperature, max_tokens)
+
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            provider = spec["provider"]
+            t0 = time.perf_counter()
+            importlib.import_module(_PROVIDER_MODULES[provider]) # Only slow the first time
+            t1 = time.perf_counter()
+            client = _BUILDERS[provider](spec["model"], temperature, max_tokens)
+            t2 = time.perf_counter()
+            costs = _startup_costs.setdefault(provider, {"import_seconds": 0.0, "init_seconds": 0.0, "clients": 0})
+            costs["import_seconds"] += t1 - t0
+            costs["init_seconds"] += t2 - t1
+            costs["clients"] += 1
+            logger.debug(f"Built {model_name} client {key}: import {t1 - t0:.3f}s, init {t2 - t1:.3f}s")
+            _clients[key] = client
+    return client
+
+
+def startup_report() -> dict:
+    """
+    Import and initialization cost per provider, for the providers used so far.
+    """
+    return {provider: dict(costs) for provider, costs in _startup_costs.items()}
+
+
+def __getattr__(name: str):
+    # Backwards compatible access to the former eagerly built module attributes
+    if name == "llm_deepseek":
+        return get_llm("DeepSeek")
+    if name == "llm_claude":
+        return get_llm("Claude")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import threading
+import time
+import logging
+from typing import Any, Optional, Sequence
+from langchain_core.caches import BaseCache
+from langchain_core.outputs import Generation
+
+from cache_store import TieredCache
+from config import (
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_CACHE_MAX_MEMORY_ITEMS,
+    LLM_CACHE_MAX_DISK_ITEMS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Message fields that do not influence what the model answers
+_VOLATILE_MESSAGE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+def _strip_volatile(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: _strip_volatile(v) for k, v in obj.items() if k not in _VOLATILE_MESSAGE_FIELDS}
+    if isinstance(obj, list):
+        return [_strip_volatile(v) for v in obj]
+    return obj
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """
+    Hashes the model identity (llm_string holds the model name, parameters and bound tools)
+    together with a normalized form of the serialized messages.
+    """
+    try:
+        normalized = json.dumps(_strip_volatile(json.loads(prompt)), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        normalized = " ".join(prompt.split())
+    return hashlib.sha256(f"{llm_string}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+def _generation_tokens(generations: Sequence[Generation]) -> int:
+    total = 0
+    for gen in generations:
+        usage = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+        total += usage.get("total_tokens", 0)
+    return total
+
+
+class LLMResponseCache(BaseCache):
+    """
+    LangChain cache backed by a TieredCache (in-memory LRU + SQLite) with TTL and size eviction.
+
+    Pass it as `cache=` to a chat model. Each stored response remembers how long the original
+    call took and how many tokens it used, so every hit can report what it saved.
+    """
+
+    def __init__(self, store: TieredCache):
+        self.store = store
+        self._lock = threading.Lock()
+        self._miss_started = {} # key -> perf_counter() at lookup miss, used to time the real call
+        self.stats = {"hits": 0, "misses": 0, "saved_seconds": 0.0, "saved_tokens": 0}
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = cache_key(prompt, llm_string)
+        record = self.store.get(key)
+        with self._lock:
+            if record is None:
+                self.stats["misses"] += 1
+                if len(self._miss_started) > 1000: # Calls that failed never reach update()
+                    self._miss_started.clear()
+                self._miss_started[key] = time.perf_counter()
+                return None
+            self.stats["hits"] += 1
+            self.stats["saved_seconds"] += record["latency"]
+            self.stats["saved_tokens"] += record["tokens"]
+        logger.info(f"LLM cache hit: saved {record['latency']:.2f}s and {record['tokens']} tokens")
+        # Copies flagged as cache hits, so per-call metrics can tell them from fresh responses
+        return [gen.model_copy(update={"generation_info": {**(gen.generation_info or {}), "cache_hit": True}})
+                for gen in record["generations"]]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = cache_key(prompt, llm_string)
+        with self._lock:
+            started = self._miss_started.pop(key, None)
+        latency = time.perf_counter() - started if started is not None else 0.0
+        self.store.set(key, {
+            "generations": list(return_val),
+            "latency": latency,
+            "tokens": _generation_tokens(return_val),
+        })
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+
+_llm_cache = None
+
+
+def get_llm_cache():
+    """
+    Returns the shared LLM response cache, or False when LLM_CACHE_ENABLED is off
+    (False disables caching on a LangChain model, None would fall back to a global cache).
+    """
+    global _llm_cache
+    if not LLM_CACHE_ENABLED:
+        return False
+    if _llm_cache is None:
+        _llm_cache = LLMResponseCache(TieredCache(
+            "llm_responses",
+            ttl=LLM_CACHE_TTL_SECONDS,
+            max_memory_items=LLM_CACHE_MAX_MEMORY_ITEMS,
+            max_disk_items=LLM_CACHE_MAX_DISK_ITEMS,
+        ))
+    return _llm_cache
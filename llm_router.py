@@ -0,0 +1,436 @@
+import asyncio
+import contextvars
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel, agenerate_from_stream, generate_from_stream
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+from config import (
+    LLM_BREAKER_COOLDOWN_SECONDS, LLM_BREAKER_FAILURES, LLM_FAILOVER_ORDER,
+    LLM_HEDGE_DEFAULT_DELAY_SECONDS, LLM_HEDGE_MIN_SAMPLES, LLM_HEDGING_ENABLED,
+)
+from llm_cache import get_llm_cache
+from metrics import registry
+
+# Failover and hedged requests across the LLM providers.
+# RoutedChatModel stands in for one chat model but calls an ordered list of them ("DeepSeek",
+# then "Claude"). Each attempt streams in its own thread (sync calls) or asyncio task (async calls):
+#   - Failover: an error before the first token, or an open circuit breaker, moves on to the next provider.
+#   - Hedging: if the current attempt has no first token after its provider's p95 first-token time,
+#     the next provider starts as well and whichever streams first wins; the other is cancelled.
+# First-token latencies and breaker states are kept per provider for the whole process.
+
+logger = logging.getLogger(__name__)
+
+_LATENCY_WINDOW = 200 # First-token samples kept per provider
+
+
+class ProviderHealth:
+    """
+    First-token latencies and a circuit breaker of one provider.
+    The breaker opens after LLM_BREAKER_FAILURES consecutive failures; after the cooldown one
+    trial call is let through (half-open), and its outcome closes or reopens the breaker.
+    """
+
+    def __init__(self, name: str, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN_SECONDS):
+        self.name = name
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.latencies = deque(maxlen=_LATENCY_WINDOW)
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self, first_token_seconds: float):
+        with self._lock:
+            self.latencies.append(first_token_seconds)
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.max_failures or self.opened_at is not None:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit breaker opened for {self.name} after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        # An abandoned call (a hedge that lost) neither closes nor reopens the breaker
+        with self._lock:
+            self._trial_running = False
+
+    def hedge_delay(self, min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+                    default: float = LLM_HEDGE_DEFAULT_DELAY_SECONDS) -> float:
+        """
+        Seconds to wait for a first token before hedging: the p95 of the recent first-token times.
+        """
+        with self._lock:
+            if len(self.latencies) < min_samples:
+                return default
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+_health = {} # provider name -> ProviderHealth
+_health_lock = threading.Lock()
+
+
+def provider_health(name: str) -> ProviderHealth:
+    with _health_lock:
+        health = _health.get(name)
+        if health is None:
+            health = _health[name] = ProviderHealth(name)
+        return health
+
+
+def health_report() -> dict:
+    """
+    {provider: {"state", "failures", "samples", "hedge_delay"}} for the providers used so far.
+    """
+    with _health_lock:
+        providers = list(_health.values())
+    return {h.name: {"state": h.state, "failures": h.failures, "samples": len(h.latencies),
+                     "hedge_delay": round(h.hedge_delay(), 3)} for h in providers}
+
+
+def _as_chunk(message) -> ChatGenerationChunk:
+    # Models without streaming yield their whole AIMessage once
+    if isinstance(message, AIMessageChunk):
+        return ChatGenerationChunk(message=message)
+    if isinstance(message, AIMessage):
+        return ChatGenerationChunk(message=AIMessageChunk(
+            content=message.content, tool_calls=message.tool_calls, id=message.id,
+            additional_kwargs=message.additional_kwargs, response_metadata=message.response_metadata,
+            usage_metadata=message.usage_metadata,
+        ))
+    return ChatGenerationChunk(message=AIMessageChunk(content=str(message)))
+
+
+def _model_name(model, default: str) -> str:
+    # Model id of a provider model, also when it is bound to tools
+    model = getattr(model, "bound", model)
+    return getattr(model, "model_name", None) or getattr(model, "model", None) or default
+
+
+class _Attempt:
+    """
+    One provider call of the sync path, streaming into the shared queue from a daemon thread as
+    (attempt, "chunk" | "error" | "end", payload) items.
+    """
+
+    def __init__(self, name: str, model, messages, stop, kwargs, events: queue.Queue):
+        self.name = name
+        self.model_name = _model_name(model, name)
+        self.started = time.perf_counter()
+        self.error = None
+        self._cancelled = threading.Event()
+        ctx = contextvars.copy_context()
+        thread = threading.Thread(target=ctx.run, args=(self._run, model, messages, stop, kwargs, events),
+                                  name=f"llm-{name}", daemon=True)
+        thread.start()
+
+    def _run(self, model, messages, stop, kwargs, events):
+        try:
+            # Own callbacks stay off: the routed model reports the call once
+            for message in model.stream(messages, config={"callbacks": []}, stop=stop, **kwargs):
+                if self._cancelled.is_set():
+                    return
+                events.put((self, "chunk", message))
+            events.put((self, "end", None))
+        except Exception as e:
+            events.put((self, "error", e))
+
+    def cancel(self):
+        # A thread can't be interrupted: it stops at its next chunk and its output is dropped
+        self._cancelled.set()
+
+
+class _AsyncAttempt:
+    """
+    One provider call of the async path: an asyncio task streaming into the shared queue.
+    Cancelling it cancels the task, which closes the provider's request.
+    """
+
+    def __init__(self, name: str, model, messages, stop, kwargs, events: asyncio.Queue):
+        self.name = name
+        self.model_name = _model_name(model, name)
+        self.started = time.perf_counter()
+        self.error = None
+        self._task = asyncio.get_running_loop().create_task(self._run(model, messages, stop, kwargs, events),
+                                                            name=f"llm-{name}")
+
+    async def _run(self, model, messages, stop, kwargs, events):
+        try:
+            async for message in model.astream(messages, config={"callbacks": []}, stop=stop, **kwargs):
+                events.put_nowait((self, "chunk", message))
+            events.put_nowait((self, "end", None))
+        except Exception as e:
+            events.put_nowait((self, "error", e))
+
+    def cancel(self):
+        self._task.cancel()
+
+
+class _Race:
+    """
+    The attempts of one routed call and the failover/hedging decisions, shared by the sync
+    (thread) and async (task) paths. start(name) launches an attempt of the given provider.
+    """
+
+    def __init__(self, providers: List[str], hedging: bool, start):
+        self.pending = list(providers)
+        self.hedging = hedging
+        self.start = start
+        self.attempts = []
+        self.failed = []
+        self.winner = None
+        if not self.launch():
+            # With every breaker open, trying the primary beats failing without a call
+            self.attempts.append(start(providers[0]))
+
+    def launch(self) -> bool:
+        # Next provider whose breaker lets a call through
+        while self.pending:
+            name = self.pending.pop(0)
+            if provider_health(name).allow():
+                self.attempts.append(self.start(name))
+                return True
+        return False
+
+    def timeout(self) -> Optional[float]:
+        """
+        Seconds to wait for the next event before hedging, or None to wait as long as it takes.
+        Fails over first if every running attempt has failed; raises the last error if no provider is left.
+        """
+        while True:
+            running = [a for a in self.attempts if a not in self.failed]
+            if running:
+                break
+            if not self.launch():
+                raise self.failed[-1].error
+            registry.inc("agent_llm_failovers_total", "LLM calls moved to another provider after an error",
+                         provider=self.attempts[-1].name)
+            logger.info(f"LLM call failed over to {self.attempts[-1].name}")
+        if not (self.hedging and self.pending):
+            return None
+        newest = running[-1]
+        return max(0.0, provider_health(newest.name).hedge_delay() - (time.perf_counter() - newest.started))
+
+    def hedge(self):
+        # No first token within the p95: the next provider races the slow one
+        if self.launch():
+            registry.inc("agent_llm_hedges_total", "LLM calls hedged to another provider after a slow first token",
+                         provider=self.attempts[-1].name)
+            logger.info(f"LLM call hedged to {self.attempts[-1].name}")
+
+    def on_event(self, attempt, kind: str, payload) -> bool:
+        """
+        Handles an event received before there is a winner; True once `attempt` has won.
+        An attempt ending without a single chunk has failed, like one raising an error.
+        """
+        if kind == "end":
+            kind, payload = "error", ValueError(f"LLM provider {attempt.name} returned an empty response")
+        if kind == "error":
+            attempt.error = payload
+            self.failed.append(attempt)
+            provider_health(attempt.name).record_failure()
+            registry.inc("agent_llm_provider_errors_total", "LLM calls failing before their first token",
+                         provider=attempt.name)
+            logger.warning(f"LLM provider {attempt.name} failed: {payload!r}")
+            return False
+        self.winner = attempt
+        first_token_seconds = time.perf_counter() - attempt.started
+        provider_health(attempt.name).record_success(first_token_seconds)
+        registry.observe("agent_llm_first_token_seconds", "Time to the first streamed token per provider",
+                         first_token_seconds, provider=attempt.name)
+        for other in self.attempts:
+            if other is not attempt and other not in self.failed:
+                other.cancel()
+                provider_health(other.name).release()
+        return True
+
+    def chunk(self, payload, first: bool) -> ChatGenerationChunk:
+        chunk = _as_chunk(payload)
+        if first:
+            # Once per response: string metadata is concatenated when the chunks are merged.
+            # TurnMetrics labels the call with provider_model instead of "routed(...)".
+            chunk.message.response_metadata = {**chunk.message.response_metadata, "provider": self.winner.name,
+                                               "provider_model": self.winner.model_name}
+        return chunk
+
+    def close(self):
+        # Also stops the winner when the caller stops reading the stream early
+        for attempt in self.attempts:
+            if attempt not in self.failed:
+                attempt.cancel()
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model calling the models in `providers` (names for llm.get_llm, primary first) with
+    failover, circuit breakers and optional hedging. `models` maps names to model instances,
+    overriding get_llm (tests use fake models). With bind_tools, each member is called bound to
+    the same tools. The winning provider is in the response's response_metadata["provider"],
+    and its model in response_metadata["provider_model"].
+    """
+
+    providers: List[str]
+    models: Dict[str, Any] = {}
+    hedging: bool = LLM_HEDGING_ENABLED
+
+    _bound: dict = PrivateAttr(default_factory=dict) # (provider name, tools digest) -> member model with those tools
+    _bound_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("cache", get_llm_cache())
+        super().__init__(**kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": "routed(" + ",".join(self.providers) + ")"}
+
+    def bind_tools(self, tools, **kwargs):
+        # Like the provider models: a binding of this instance, so a cache set on it later still applies.
+        # The tools reach _stream as a keyword argument (and so are part of the LLM cache key).
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], tool_kwargs=kwargs)
+
+    def _member(self, name: str, tools: List[dict] = None, tool_kwargs: dict = None):
+        key = (name, json.dumps([tools, tool_kwargs], sort_keys=True, default=str) if tools else None)
+        model = self._bound.get(key)
+        if model is not None:
+            return model
+        with self._bound_lock:
+            model = self._bound.get(key)
+            if model is None:
+                if name in self.models:
+                    model = self.models[name]
+                else:
+                    from llm import get_llm
+                    model = get_llm(name)
+                if tools:
+                    model = model.bind_tools(tools, **(tool_kwargs or {}))
+                self._bound[key] = model
+        return model
+
+    def _stream(self, messages, stop=None, run_manager=None, tools=None, tool_kwargs=None, **kwargs):
+        events = queue.Queue()
+        race = _Race(self.providers, self.hedging, lambda name: _Attempt(
+            name, self._member(name, tools, tool_kwargs), messages, stop, kwargs, events))
+        try:
+            while race.winner is None:
+                timeout = race.timeout()
+                try:
+                    attempt, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    race.hedge()
+                    continue
+                race.on_event(attempt, kind, payload)
+
+            first = True
+            while True:
+                if kind == "error":
+                    raise payload # Failed after streaming part of the answer; no clean failover left
+                if kind == "end":
+                    return
+                chunk = race.chunk(payload, first)
+                first = False
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                attempt, kind, payload = events.get()
+                while attempt is not race.winner:
+                    attempt, kind, payload = events.get()
+        finally:
+            race.close()
+
+    async def _astream(self, messages, stop=None, run_manager=None, tools=None, tool_kwargs=None, **kwargs):
+        # Same race as _stream, with the attempts as tasks of the caller's event loop
+        events = asyncio.Queue()
+        race = _Race(self.providers, self.hedging, lambda name: _AsyncAttempt(
+            name, self._member(name, tools, tool_kwargs), messages, stop, kwargs, events))
+        try:
+            while race.winner is None:
+                timeout = race.timeout()
+                try:
+                    attempt, kind, payload = await asyncio.wait_for(events.get(), timeout)
+                except asyncio.TimeoutError:
+                    race.hedge()
+                    continue
+                race.on_event(attempt, kind, payload)
+
+            first = True
+            while True:
+                if kind == "error":
+                    raise payload
+                if kind == "end":
+                    return
+                chunk = race.chunk(payload, first)
+                first = False
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                attempt, kind, payload = await events.get()
+                while attempt is not race.winner:
+                    attempt, kind, payload = await events.get()
+        finally:
+            race.close()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+
+_routed = {} # llm_name -> RoutedChatModel
+_routed_lock = threading.Lock()
+
+
+def get_routed_llm(llm_name: str) -> RoutedChatModel:
+    """
+    The routed model for llm_name: llm_name first, then its fallbacks from LLM_FAILOVER_ORDER.
+    """
+    with _routed_lock:
+        model = _routed.get(llm_name)
+        if model is None:
+            model = _routed[llm_name] = RoutedChatModel(providers=LLM_FAILOVER_ORDER.get(llm_name, [llm_name]))
+        return model
@@ -0,0 +1,470 @@
+"""
+Replay / load-test harness for chat_fn.
+
+Replays a JSONL trace of queries against chat_service.chat_fn (or achat_fn) and reports
+throughput, tail latency and a per-tool breakdown.
+
+    # Record real LLM and tool responses once...
+    python loadgen.py --trace trace.jsonl --record cassette.sqlite
+    # ...then replay them offline, as often as needed, under load
+    python loadgen.py --trace trace.jsonl --replay cassette.sqlite --concurrency 16 --requests 500
+    python loadgen.py --trace trace.jsonl --replay cassette.sqlite --rate 20 --duration 60
+
+Trace lines are JSON objects with a "query" (or "message", "body", "title") and optionally
+a "session" (turns of one session run in order, in the same conversation thread) and an
+"llm" ("DeepSeek" or "Claude"). Without --trace, tests/test_queries.USER_QUERIES is used.
+
+Closed loop (--concurrency N): N virtual users each send their next query as soon as the
+previous one finished. Open loop (--rate R): queries arrive R per second (Poisson by default)
+whether or not earlier ones finished; latency is measured from the scheduled arrival, so
+queueing delay is included.
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import BaseTool
+
+logger = logging.getLogger("loadgen")
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+# --- Trace loading ---
+
+def load_trace(path: Optional[str], default_llm: str) -> list:
+    """
+    Returns a list of {"query", "session", "llm"} items.
+    """
+    items = []
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                query = next((record[k] for k in ("query", "message", "body", "title") if record.get(k)), None)
+                if query is None:
+                    raise ValueError(f"{path}:{line_no}: no query/message/body/title field")
+                items.append({"query": query, "session": record.get("session"), "llm": record.get("llm", default_llm)})
+    else:
+        from tests.test_queries import USER_QUERIES
+        items = [{"query": q, "session": None, "llm": default_llm} for q in USER_QUERIES]
+    if not items:
+        raise ValueError("The trace is empty.")
+    return items
+
+
+# --- Recorded responses ---
+
+class ReplayMiss(RuntimeError):
+    """Raised in replay mode when the cassette has no response for a request."""
+
+
+def _make_llm_cassette(path: str, replay: bool, latency_scale: float):
+    from cache_store import TieredCache
+    from llm_cache import LLMResponseCache, cache_key
+
+    class CassetteCache(LLMResponseCache):
+        """
+        LLM cache stored in the cassette file. Recording is plain caching; replaying turns
+        misses into errors and can wait for the recorded latency of every response.
+        """
+
+        def lookup(self, prompt: str, llm_string: str):
+            record = self.store.get(cache_key(prompt, llm_string))
+            if record is None:
+                if replay:
+                    raise ReplayMiss("No recorded LLM response for this prompt; record the trace again.")
+                return super().lookup(prompt, llm_string)
+            if replay and latency_scale > 0:
+                time.sleep(record["latency"] * latency_scale)
+            return record["generations"]
+
+    return CassetteCache(TieredCache("llm_cassette", ttl=10 * 365 * 86400, max_disk_items=10 ** 9, db_path=path))
+
+
+class ToolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = {} # tool name -> list of (seconds, ok)
+
+    def add(self, name: str, seconds: float, ok: bool):
+        with self._lock:
+            self.calls.setdefault(name, []).append((seconds, ok))
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "calls": len(calls),
+                    "errors": sum(1 for _, ok in calls if not ok),
+                    "p50_ms": _percentile([s for s, _ in calls], 50) * 1000,
+                    "p95_ms": _percentile([s for s, _ in calls], 95) * 1000,
+                    "mean_ms": sum(s for s, _ in calls) / len(calls) * 1000,
+                }
+                for name, calls in sorted(self.calls.items())
+            }
+
+
+class RecordingTool(BaseTool):
+    """
+    Wraps a tool of the "action" node to time every call and, with a cassette, to record
+    its outputs or replay them. Outputs are keyed on the tool name and canonical args;
+    repeated calls replay the recorded outputs in order.
+    """
+
+    inner: Any
+    mode: str = "live" # live | record | replay
+    store: Any = None
+    stats: Any = None
+    latency_scale: float = 1.0
+    _counters: Any = None
+    _lock: Any = None
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _key(self, args: dict) -> str:
+        canonical = json.dumps(args, sort_keys=True, default=str, separators=(",", ":"))
+        return hashlib.sha256(f"{self.name}\x00{canonical}".encode("utf-8")).hexdigest()
+
+    def _next_index(self, key: str) -> int:
+        with self._lock:
+            index = self._counters.get(key, 0)
+            self._counters[key] = index + 1
+            return index
+
+    def _replay(self, tool_call: dict):
+        key = self._key(tool_call["args"])
+        recorded = self.store.get(key)
+        if not recorded:
+            raise ReplayMiss(f"No recorded output for {self.name}({tool_call['args']}); record the trace again.")
+        content, status, latency = recorded[self._next_index(key) % len(recorded)]
+        return ToolMessage(content=content, name=self.name, tool_call_id=tool_call["id"], status=status), latency
+
+    def _record(self, tool_call: dict, message: ToolMessage, latency: float):
+        key = self._key(tool_call["args"])
+        with self._lock:
+            recorded = self.store.get(key) or []
+            recorded.append((message.content, message.status, latency))
+            self.store.set(key, recorded)
+
+    def invoke(self, input, config=None, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            if self.mode == "replay":
+                message, latency = self._replay(input)
+                if self.latency_scale > 0:
+                    time.sleep(latency * self.latency_scale)
+            else:
+                message = self.inner.invoke(input, config, **kwargs)
+                if self.mode == "record":
+                    self._record(input, message, time.perf_counter() - started)
+            ok = message.status != "error"
+            return message
+        finally:
+            self.stats.add(self.name, time.perf_counter() - started, ok)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            if self.mode == "replay":
+                message, latency = self._replay(input)
+                if self.latency_scale > 0:
+                    await asyncio.sleep(latency * self.latency_scale)
+            else:
+                message = await self.inner.ainvoke(input, config, **kwargs)
+                if self.mode == "record":
+                    self._record(input, message, time.perf_counter() - started)
+            ok = message.status != "error"
+            return message
+        finally:
+            self.stats.add(self.name, time.perf_counter() - started, ok)
+
+    def _run(self, *args, **kwargs):
+        raise NotImplementedError("RecordingTool is only called with tool calls through invoke/ainvoke.")
+
+
+def install(mode: str, cassette: Optional[str], llm_names, latency_scale: float) -> ToolStats:
+    """
+    Wraps the graph's tools (and, with a cassette, the LLMs' caches) for recording or replay.
+    """
+    import lang_graph
+    from cache_store import TieredCache
+    from llm import get_llm
+    from llm_router import get_routed_llm
+
+    stats = ToolStats()
+    tool_store = None
+    if cassette:
+        tool_store = TieredCache("tool_cassette", ttl=10 * 365 * 86400, max_disk_items=10 ** 9, db_path=cassette)
+        llm_cache = _make_llm_cassette(cassette, mode == "replay", latency_scale)
+        for name in llm_names:
+            # Shared model instances, also used by the compiled graphs; the routed model is checked first
+            get_llm(name).cache = llm_cache
+            get_routed_llm(name).cache = llm_cache
+    tools_by_name = lang_graph.tool_node.tools_by_name
+    for name, tool in list(tools_by_name.items()):
+        tools_by_name[name] = RecordingTool(
+            name=tool.name, description=tool.description, inner=tool,
+            mode=mode, store=tool_store, stats=stats, latency_scale=latency_scale,
+        )
+    return stats
+
+
+# --- Load generation ---
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.errors = {}
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, latency: float, error: Optional[BaseException] = None):
+        with self._lock:
+            if error is None:
+                self.latencies.append(latency)
+            else:
+                name = type(error).__name__
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self) -> dict:
+        duration = (self.finished or time.perf_counter()) - self.started
+        completed = len(self.latencies)
+        return {
+            "requests": completed + sum(self.errors.values()),
+            "completed": completed,
+            "errors": self.errors,
+            "duration_s": duration,
+            "throughput_rps": completed / duration if duration > 0 else 0.0,
+            "latency_ms": {f"p{p}": _percentile(self.latencies, p) * 1000 for p in (50, 90, 95, 99)}
+                          | {"max": max(self.latencies, default=0.0) * 1000},
+        }
+
+
+class _Sessions:
+    """
+    Conversation threads of the trace sessions. Every pass over the trace starts new threads,
+    so each pass replays the same conversations. Turns of one session run one at a time and
+    in trace order, since each sees the history of the previous ones.
+    """
+
+    def __init__(self):
+        self.run_id = uuid.uuid4().hex[:8]
+        self._done = {} # thread id -> number of finished turns
+        self._cond = threading.Condition()
+
+    def items(self, trace: list, total: Optional[int], deadline: Optional[float]):
+        # Cycles through the trace until `total` items were produced or the deadline passed
+        count = 0
+        for pass_no in itertools.count():
+            seq = {}
+            for item in trace:
+                if (total is not None and count >= total) or (deadline is not None and time.perf_counter() >= deadline):
+                    return
+                count += 1
+                if item["session"] is None:
+                    yield {**item, "thread_id": uuid.uuid4().hex, "seq": None}
+                    continue
+                thread_id = f"{self.run_id}-{pass_no}-{item['session']}"
+                seq[thread_id] = seq.get(thread_id, -1) + 1
+                yield {**item, "thread_id": thread_id, "seq": seq[thread_id]}
+
+    def wait_turn(self, item: dict):
+        if item["seq"] is None:
+            return
+        with self._cond:
+            self._cond.wait_for(lambda: self._done.get(item["thread_id"], 0) == item["seq"])
+
+    def finish_turn(self, item: dict):
+        if item["seq"] is None:
+            return
+        with self._cond:
+            self._done[item["thread_id"]] = item["seq"] + 1
+            self._cond.notify_all()
+
+
+def _run_turn(item: dict, sessions: _Sessions, results: Results, scheduled: float):
+    from chat_service import chat_fn
+    sessions.wait_turn(item)
+    try:
+        chat_fn(item["query"], item["llm"], item["thread_id"])
+        results.add(time.perf_counter() - scheduled)
+    except Exception as e:
+        logger.debug(f"Turn failed: {e!r}")
+        results.add(time.perf_counter() - scheduled, e)
+    finally:
+        sessions.finish_turn(item)
+
+
+def run_closed_loop(trace, concurrency: int, total, duration, think_time: float) -> Results:
+    results, sessions = Results(), _Sessions()
+    deadline = time.perf_counter() + duration if duration else None
+    items = sessions.items(trace, total, deadline)
+    items_lock = threading.Lock()
+
+    def user():
+        while True:
+            with items_lock:
+                item = next(items, None)
+            if item is None:
+                return
+            _run_turn(item, sessions, results, time.perf_counter())
+            if think_time:
+                time.sleep(think_time)
+
+    users = [threading.Thread(target=user, daemon=True) for _ in range(concurrency)]
+    for t in users:
+        t.start()
+    for t in users:
+        t.join()
+    results.finished = time.perf_counter()
+    return results
+
+
+def run_open_loop(trace, rate: float, total, duration, max_inflight: int, poisson: bool, seed: int) -> Results:
+    results, sessions = Results(), _Sessions()
+    rng = random.Random(seed)
+    deadline = results.started + duration if duration else None
+    with ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="loadgen") as pool:
+        next_arrival = time.perf_counter()
+        for item in sessions.items(trace, total, deadline):
+            wait = next_arrival - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(_run_turn, item, sessions, results, next_arrival)
+            next_arrival += rng.expovariate(rate) if poisson else 1.0 / rate
+    results.finished = time.perf_counter()
+    return results
+
+
+async def _run_async(trace, concurrency: int, total, duration) -> Results:
+    from chat_service import achat_fn
+    results, sessions = Results(), _Sessions()
+    deadline = time.perf_counter() + duration if duration else None
+    items = sessions.items(trace, total, deadline)
+    turn_done = {} # thread id -> asyncio.Event per finished turn count
+
+    def done_event(item, seq):
+        return turn_done.setdefault((item["thread_id"], seq), asyncio.Event())
+
+    async def user():
+        for item in items:
+            if item["seq"]: # Wait for the session's previous turn
+                await done_event(item, item["seq"] - 1).wait()
+            started = time.perf_counter()
+            try:
+                await achat_fn(item["query"], item["llm"], item["thread_id"])
+                results.add(time.perf_counter() - started)
+            except Exception as e:
+                results.add(time.perf_counter() - started, e)
+            finally:
+                if item["seq"] is not None:
+                    done_event(item, item["seq"]).set()
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    results.finished = time.perf_counter()
+    return results
+
+
+def format_report(report: dict) -> str:
+    latency = report["latency_ms"]
+    lines = [
+        f"requests: {report['requests']}  completed: {report['completed']}  errors: {report['errors'] or 0}",
+        f"duration: {report['duration_s']:.2f}s  throughput: {report['throughput_rps']:.2f} req/s",
+        "latency ms: " + "  ".join(f"{k}={v:.1f}" for k, v in latency.items()),
+    ]
+    if report.get("tools"):
+        lines.append(f"{'tool':<28}{'calls':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+        for name, t in report["tools"].items():
+            lines.append(f"{name:<28}{t['calls']:>8}{t['errors']:>8}{t['p50_ms']:>10.1f}{t['p95_ms']:>10.1f}{t['mean_ms']:>10.1f}")
+    if report.get("prefetch", {}).get("started"):
+        p = report["prefetch"]
+        lines.append(f"prefetch: {p['started']} started  {p['hits']} used  {p['wasted']} wasted  hit rate {p['hit_rate']:.0%}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay JSONL query traces against chat_fn and report latency.")
+    parser.add_argument("--trace", help="JSONL trace file (default: tests/test_queries.USER_QUERIES)")
+    parser.add_argument("--llm", default="DeepSeek", help="Model for trace items without an \"llm\" field")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", metavar="CASSETTE", help="Record LLM and tool responses to this SQLite file")
+    cassette.add_argument("--replay", metavar="CASSETTE", help="Replay recorded responses offline from this file")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Replay: wait recorded latency x this factor (0 = no waiting)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Closed loop: number of concurrent users")
+    parser.add_argument("--rate", type=float, help="Open loop: arrivals per second")
+    parser.add_argument("--uniform", action="store_true", help="Open loop: fixed instead of Poisson inter-arrival times")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Open loop: max turns running at once")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Closed loop: pause between a user's turns")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Closed loop on one event loop with achat_fn")
+    parser.add_argument("--requests", type=int, help="Number of turns to send (default: one pass over the trace)")
+    parser.add_argument("--duration", type=float, help="Stop sending after this many seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report-json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.replay:
+        # Model clients are still constructed; replay never sends a request with these keys
+        for key in ("DEEPSEEK_API_KEY", "ANTHROPIC_API_KEY", "TAVILY_API_KEY"):
+            os.environ.setdefault(key, "replay")
+        if not os.path.exists(args.replay):
+            parser.error(f"cassette {args.replay} does not exist")
+
+    trace = load_trace(args.trace, args.llm)
+    total = args.requests if args.requests is not None else (None if args.duration else len(trace))
+    mode = "replay" if args.replay else "record" if args.record else "live"
+    tool_stats = install(mode, args.replay or args.record, sorted({item["llm"] for item in trace}), args.latency_scale)
+    import lang_graph
+    prefetch_before = dict(lang_graph.prefetcher.stats) if lang_graph.prefetcher is not None else None
+
+    if args.rate:
+        results = run_open_loop(trace, args.rate, total, args.duration, args.max_inflight, not args.uniform, args.seed)
+    elif args.use_async:
+        results = asyncio.run(_run_async(trace, args.concurrency, total, args.duration))
+    else:
+        results = run_closed_loop(trace, args.concurrency, total, args.duration, args.think_time)
+
+    report = results.report()
+    report["mode"] = mode
+    report["tools"] = tool_stats.report()
+    if prefetch_before is not None:
+        prefetch = {k: v - prefetch_before[k] for k, v in lang_graph.prefetcher.stats.items()}
+        settled = prefetch["hits"] + prefetch["wasted"]
+        report["prefetch"] = {**prefetch, "hit_rate": prefetch["hits"] / settled if settled else 0.0}
+    print(format_report(report))
+    if args.report_json:
+        with open(args.report_json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import asyncio
+import sqlite3
+import logging
+from typing import Any, AsyncIterator, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from config import CHECKPOINT_DB_PATH, CONTEXT_TOKEN_BUDGET, CONTEXT_TRIM_STEP_TOKENS
+
+logger = logging.getLogger(__name__)
+
+_checkpointer = None
+
+
+class ThreadedSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver whose async methods run the sync ones in a worker thread.
+
+    The stock SqliteSaver refuses async use, and the graphs are compiled once with one
+    checkpointer, so this lets the same graph and database serve both invoke/stream and
+    ainvoke/astream. SqliteSaver serializes access to its connection with a lock.
+    """
+
+    async def aget_tuple(self, config: RunnableConfig):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[dict] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Any, metadata: Any, new_versions: Any) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence, task_id: str, task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def get_checkpointer() -> SqliteSaver:
+    """
+    Returns the process-wide SQLite checkpointer that stores one thread per chat session.
+    """
+    global _checkpointer
+    if _checkpointer is None:
+        # Streamlit reruns the script on other threads, so the connection must not be thread-bound
+        conn = sqlite3.connect(CHECKPOINT_DB_PATH, check_same_thread=False)
+        _checkpointer = ThreadedSqliteSaver(conn)
+    return _checkpointer
+
+
+def trim_context(messages: Sequence[BaseMessage], max_tokens: int = CONTEXT_TOKEN_BUDGET,
+                 step_tokens: int = CONTEXT_TRIM_STEP_TOKENS) -> list:
+    """
+    Drops the oldest turns so the history sent to the LLM stays within max_tokens.
+    The trimmed history always starts on a HumanMessage, so no ToolMessage is left
+    without the AIMessage that requested it. The current turn is never dropped.
+
+    Turns are dropped in steps of about step_tokens rather than one per new turn: the cut
+    only moves to fixed points of the thread, so the kept history starts the same way for
+    several turns and the provider's prompt cache (see llm.add_cache_breakpoints) keeps hitting.
+    """
+    messages = list(messages)
+    if count_tokens_approximately(messages) <= max_tokens:
+        return messages
+
+    leading_system = messages[:1] if messages and isinstance(messages[0], SystemMessage) else []
+    sizes = [count_tokens_approximately([m]) for m in messages]
+    budget = max_tokens - sum(sizes[:len(leading_system)])
+    turn_starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    if not turn_starts:
+        return messages
+
+    # Tokens before each turn start; fixed once the turn exists, since the thread only grows
+    before, offsets, starts = 0, {}, set(turn_starts)
+    for i, size in enumerate(sizes):
+        if i in starts:
+            offsets[i] = before
+        before += size
+    total = before
+
+    # The oldest turn start whose suffix fits, else the current turn alone (kept whole)
+    needed = next((i for i in turn_starts if total - offsets[i] <= budget), turn_starts[-1])
+    # Cut points: the first turn start of every step_tokens-sized stretch of the thread
+    step = max(1, step_tokens)
+    cut_points = [i for k, i in enumerate(turn_starts)
+                  if k == 0 or offsets[i] // step > offsets[turn_starts[k - 1]] // step]
+    cut = next((i for i in cut_points if i >= needed), needed)
+
+    trimmed = leading_system + messages[cut:]
+    logger.debug(f"Trimmed context from {len(messages)} to {len(trimmed)} messages (budget {max_tokens} tokens)")
+    return trimmed
@@ -1,17 +1,39 @@
 import streamlit as st
 from streamlit_mermaid import st_mermaid
-from typing import List
+from collections import OrderedDict
+from itertools import count
+from typing import List, Optional
+import hashlib
+import json
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
-# Counter for generating unique node IDs for Mermaid
-_node_id_counter = 0
+# Characters that define shapes or structures in Mermaid become "_", quotes become "'",
+# and newlines (not allowed in simple text nodes) become spaces; one str.translate pass.
+_MINDMAP_TRANSLATION = str.maketrans({
+    "`": "'", '"': "'", "\n": " ",
+    **{char: "_" for char in "(){}[]:;#"},
+})
+
+_MAX_CACHED_DIAGRAMS = 128
+_diagram_cache = OrderedDict() # digest of the rendered fields of tool_entries -> Mermaid code, shared by all sessions
+
+# The only fields of a step build_mermaid renders. Metrics, payload refs and token counts differ on
+# every turn and stay out of the diagram and its digest, so identical tool chains share one diagram.
+_RENDERED_FIELDS = ("name", "tool_input", "tool_output", "router_llm_prompt", "router_llm_raw_response",
+                    "selected_tools_list", "router_method", "confidence", "threshold")
+_diagram_cache_lock = threading.Lock()
+
+
+def sanitize_for_simple_mindmap_node(text, max_len: int = 0) -> str:
+    s = str(text)
+    if max_len > 0 and len(s) > max_len:
+        # Only the visible prefix needs translating; cutting first keeps long outputs cheap
+        return s[:max_len - 3].translate(_MINDMAP_TRANSLATION) + "..."
+    return s.translate(_MINDMAP_TRANSLATION)
 
-def _get_unique_node_id():
-    global _node_id_counter
-    _node_id_counter += 1
-    return f"mmnode{_node_id_counter}" # mmnode for mindmap node
 
 def build_mermaid(tool_entries: List[dict]) -> str:
     if not tool_entries:
@@ -20,94 +42,84 @@ def build_mermaid(tool_entries: List[dict]) -> str:
     mermaid_lines = ["mindmap"]
     mermaid_lines.append("  root((Tool Invocation Flow))")
 
-    global _node_id_counter
-    _node_id_counter = 0
-
-    def sanitize_for_simple_mindmap_node(text: str, max_len: int = 0) -> str:
-        s = str(text)
-
-        s = s.replace("`", "'") # Replace backticks with single quotes
-        s = s.replace('"', "'") # Replace double quotes with single quotes
-
-        # Replace characters that define shapes or structures in Mermaid
-        for char_to_replace in "(){}[]:;#":
-            s = s.replace(char_to_replace, "_")
-
-        # Newlines are not allowed in simple text node definitions, replace with space or similar
-        s = s.replace("\n", " ")
-
-        if max_len > 0 and len(s) > max_len:
-            s = s[:max_len - 3] + "..."
-        return s
-
-    # parent_node_level is the indent level of the parent under which the current entries_subset will be added.
-    def build_nodes_recursively(entries_subset: List[dict], parent_node_level: int):
-        if not entries_subset:
-            return
+    # Unique node IDs for this diagram only, so concurrent sessions don't share a counter
+    node_ids = (f"mmnode{i}" for i in count(1)) # mmnode for mindmap node
 
-        entry = entries_subset[0]
-        remaining_entries = entries_subset[1:]
-        
-        # Current tool's node level
-        tool_node_level = parent_node_level + 1
+    # Each tool is a child of the previous tool's node, so the level grows by one per step.
+    # Built iteratively: long tool chains neither copy the list nor hit the recursion limit.
+    for tool_node_level, entry in enumerate(tool_entries, start=2): # "root" is at level 1
         tool_node_indent = "  " * tool_node_level
-        
+
         # Tool name as a simple node (less likely to have problematic characters)
-        tool_node_id = _get_unique_node_id()
         entry_name = sanitize_for_simple_mindmap_node(str(entry.get("name", "Unknown Step")), 50)
-        mermaid_lines.append(f"{tool_node_indent}{tool_node_id}[{entry_name}]")
+        mermaid_lines.append(f"{tool_node_indent}{next(node_ids)}[{entry_name}]")
 
         # Details as children of this tool node
-        detail_node_level = tool_node_level + 1
-        detail_node_indent = "  " * detail_node_level
-        
+        detail_node_indent = "  " * (tool_node_level + 1)
+
         original_entry_name = entry.get("name", "Unknown Step")
         if original_entry_name == "tool_determination_router":
             prompt = sanitize_for_simple_mindmap_node(entry.get("router_llm_prompt", "N/A"), 60)
             raw_resp = sanitize_for_simple_mindmap_node(entry.get("router_llm_raw_response", "N/A"), 60)
             selected_tools = sanitize_for_simple_mindmap_node(str(entry.get("selected_tools_list", [])), 60)
-            
-            mermaid_lines.append(f'{detail_node_indent}{_get_unique_node_id()}[LLM Prompt: {prompt}]')
-            mermaid_lines.append(f'{detail_node_indent}{_get_unique_node_id()}[LLM Raw Resp: {raw_resp}]')
-            mermaid_lines.append(f'{detail_node_indent}{_get_unique_node_id()}[Selected Tools: {selected_tools}]')
+
+            mermaid_lines.append(f'{detail_node_indent}{next(node_ids)}[LLM Prompt: {prompt}]')
+            mermaid_lines.append(f'{detail_node_indent}{next(node_ids)}[LLM Raw Resp: {raw_resp}]')
+            mermaid_lines.append(f'{detail_node_indent}{next(node_ids)}[Selected Tools: {selected_tools}]')
+            if "confidence" in entry:
+                decision = sanitize_for_simple_mindmap_node(
+                    f"{entry.get('router_method')}, confidence {entry['confidence']} / threshold {entry.get('threshold')}", 80)
+                mermaid_lines.append(f'{detail_node_indent}{next(node_ids)}[Decision: {decision}]')
         else: # Standard tool
-            tool_input_str = str(entry.get("tool_input", "N/A"))
-            tool_output_str = str(entry.get("tool_output", "N/A"))
-            
             # Add "Input:" and "Output:" as simple text parent nodes for clarity
-            input_parent_id = _get_unique_node_id()
-            mermaid_lines.append(f'{detail_node_indent}{input_parent_id}[Input Details:]')
-            input_lines = tool_input_str.split('\n')
-            for line_num, line_content in enumerate(input_lines[:5]): # Show first 5 lines of input
-                line_id = _get_unique_node_id()
+            mermaid_lines.append(f'{detail_node_indent}{next(node_ids)}[Input Details:]')
+            # Show first 5 lines of input; split stops early so large inputs are not split entirely
+            for line_content in str(entry.get("tool_input", "N/A")).split('\n', 5)[:5]:
                 sanitized_line = sanitize_for_simple_mindmap_node(line_content, 70)
-                mermaid_lines.append(f'{detail_node_indent}  {line_id}[{sanitized_line}]')
+                mermaid_lines.append(f'{detail_node_indent}  {next(node_ids)}[{sanitized_line}]')
 
-            output_parent_id = _get_unique_node_id()
-            mermaid_lines.append(f'{detail_node_indent}{output_parent_id}[Output Details:]')
-            output_lines = tool_output_str.split('\n')
-            for line_num, line_content in enumerate(output_lines[:8]): # Show first 8 lines of output
-                line_id = _get_unique_node_id()
+            mermaid_lines.append(f'{detail_node_indent}{next(node_ids)}[Output Details:]')
+            for line_content in str(entry.get("tool_output", "N/A")).split('\n', 8)[:8]: # Show first 8 lines of output
                 sanitized_line = sanitize_for_simple_mindmap_node(line_content, 70)
-                mermaid_lines.append(f'{detail_node_indent}  {line_id}[{sanitized_line}]')
+                mermaid_lines.append(f'{detail_node_indent}  {next(node_ids)}[{sanitized_line}]')
 
-        # Add next tool as a child of the current tool node
-        if remaining_entries:
-            # The next tool is a child of the current tool node.
-            build_nodes_recursively(remaining_entries, tool_node_level)
+    return "\n".join(mermaid_lines)
 
-    if tool_entries:
-        build_nodes_recursively(tool_entries, 1) # Initial parent is "root" at level 1
 
-    return "\n".join(mermaid_lines)
+def tool_entries_digest(tool_entries: List[dict]) -> str:
+    rendered = [{k: entry[k] for k in _RENDERED_FIELDS if k in entry} for entry in tool_entries]
+    canonical = json.dumps(rendered, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def cached_mermaid(tool_entries: List[dict], digest: Optional[str] = None):
+    """
+    Returns (digest, Mermaid code) for tool_entries, building the diagram only on a cache miss.
+    A digest already computed for tool_entries (e.g. kept in the session state) skips the hashing.
+    """
+    if digest is None:
+        digest = tool_entries_digest(tool_entries)
+    with _diagram_cache_lock:
+        mermaid_code = _diagram_cache.get(digest)
+        if mermaid_code is not None:
+            _diagram_cache.move_to_end(digest)
+            return digest, mermaid_code
+    mermaid_code = build_mermaid(tool_entries)
+    with _diagram_cache_lock:
+        _diagram_cache[digest] = mermaid_code
+        while len(_diagram_cache) > _MAX_CACHED_DIAGRAMS:
+            _diagram_cache.popitem(last=False)
+    return digest, mermaid_code
+
 
-def render_graph(tool_entries: List[dict]):
+def render_graph(tool_entries: List[dict], digest: Optional[str] = None):
     if not tool_entries: # Add a check for empty tool_entries
         st.caption("No tool invocation steps to graph.")
         return
-    mermaid_code = build_mermaid(tool_entries)
-
+    digest, mermaid_code = cached_mermaid(tool_entries, digest)
 
-    st.text_area("Generated Mermaid Code:", value=mermaid_code, height=300)
+    # Keys derived from the diagram let Streamlit keep the same widgets (and the mounted
+    # Mermaid component) across reruns instead of re-creating them for an identical diagram.
+    st.text_area("Generated Mermaid Code:", value=mermaid_code, height=300, key=f"mermaid_code_{digest[:16]}")
     st.caption("Invocation Graph")
-    st_mermaid(mermaid_code, height="800px") # Added height parameter
\ No newline at end of file
+    st_mermaid(mermaid_code, height="800px", key=f"mermaid_{digest[:16]}") # Added height parameter
@@ -0,0 +1,403 @@
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+
+from compaction import estimate_tokens
+from config import METRICS_HOST, METRICS_PORT
+
+# Per-turn instrumentation of the agent graph and a process-wide metrics registry.
+#   - TurnMetrics is a LangChain callback handler attached to every turn's run config. It times
+#     the graph nodes, every LLM call (with token usage and cache hits) and every tool call
+#     (wall time, time queued behind the "action" node's start, nested LLM tokens).
+#     chat_service merges these figures into tool_entries.
+#   - The same observations feed a small Prometheus registry, exposed as text on
+#     http://METRICS_HOST:METRICS_PORT/metrics (also scrapeable by an OpenTelemetry collector).
+
+logger = logging.getLogger(__name__)
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Metric:
+    def __init__(self, name: str, help_text: str, kind: str):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.values = {} # sorted label items -> value (counter) or [bucket counts, sum, count] (histogram)
+
+
+class MetricsRegistry:
+    """
+    Minimal thread-safe registry of counters and histograms with Prometheus text output.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _metric(self, name: str, help_text: str, kind: str) -> _Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = _Metric(name, help_text, kind)
+        return metric
+
+    def inc(self, name: str, help_text: str, amount: float = 1.0, **labels):
+        with self._lock:
+            metric = self._metric(name, help_text, "counter")
+            key = tuple(sorted(labels.items()))
+            metric.values[key] = metric.values.get(key, 0.0) + amount
+
+    def observe(self, name: str, help_text: str, value: float, **labels):
+        with self._lock:
+            metric = self._metric(name, help_text, "histogram")
+            key = tuple(sorted(labels.items()))
+            state = metric.values.setdefault(key, [[0] * len(_BUCKETS), 0.0, 0])
+            for i, bound in enumerate(_BUCKETS):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for metric in self._metrics.values():
+                lines.append(f"# HELP {metric.name} {metric.help_text}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                for key, value in metric.values.items():
+                    if metric.kind == "counter":
+                        lines.append(f"{metric.name}{_labels(key)} {value}")
+                        continue
+                    buckets, total, count = value
+                    for bound, bucket_count in zip(_BUCKETS, buckets):
+                        lines.append(f"{metric.name}_bucket{_labels(key + (('le', str(bound)),))} {bucket_count}")
+                    lines.append(f"{metric.name}_bucket{_labels(key + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{metric.name}_sum{_labels(key)} {total}")
+                    lines.append(f"{metric.name}_count{_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_value(value) -> str:
+    # Exposition format: backslash, double quote and line feed are escaped inside label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in key) + "}"
+
+
+registry = MetricsRegistry()
+
+
+def _estimate_tokens(value) -> int:
+    text = value if isinstance(value, str) else json.dumps(value, default=str, ensure_ascii=False)
+    return estimate_tokens(text)
+
+
+def _usage(response) -> dict:
+    # Token counts and cache hit of an LLMResult. The prompt cache figures are the provider's
+    # (Anthropic prompt caching), unlike cache_hit, which is our own response cache (llm_cache.py).
+    usage = {"input_tokens": 0, "output_tokens": 0, "cache_hit": False,
+             "prompt_cache_read_tokens": 0, "prompt_cache_creation_tokens": 0}
+    for generations in response.generations:
+        for gen in generations:
+            usage_metadata = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+            usage["input_tokens"] += usage_metadata.get("input_tokens", 0)
+            usage["output_tokens"] += usage_metadata.get("output_tokens", 0)
+            details = usage_metadata.get("input_token_details") or {}
+            usage["prompt_cache_read_tokens"] += details.get("cache_read") or 0
+            # Written tokens are reported in total or split by cache lifetime
+            usage["prompt_cache_creation_tokens"] += sum(
+                details.get(k) or 0 for k in ("cache_creation", "ephemeral_5m_input_tokens", "ephemeral_1h_input_tokens")
+            )
+            usage["cache_hit"] = usage["cache_hit"] or bool((gen.generation_info or {}).get("cache_hit"))
+    return usage
+
+
+def _provider_model(response) -> Optional[str]:
+    # The member model that answered a llm_router.RoutedChatModel call, whose own label is "routed(...)"
+    for generations in response.generations:
+        for gen in generations:
+            metadata = getattr(getattr(gen, "message", None), "response_metadata", None) or {}
+            if metadata.get("provider_model"):
+                return metadata["provider_model"]
+    return None
+
+
+class TurnMetrics(BaseCallbackHandler):
+    """
+    Collects the timings and token counts of one graph run (one chat turn).
+    Results are read with llm_calls (agent LLM calls in order), tool_metrics(tool_call_id)
+    and summary(); every observation is also recorded in the process-wide registry.
+    """
+
+    run_inline = True # Called in the context that runs the graph, also for async runs
+
+    def __init__(self, llm_name: str = ""):
+        self.llm_name = llm_name
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self._parents = {} # run_id -> parent_run_id
+        self._starts = {} # run_id -> perf_counter() at start
+        self._node_starts = {} # checkpoint namespace -> perf_counter() at the node's start
+        self._node_runs = {} # run_id of a node run -> its checkpoint namespace
+        self._node_seconds = {} # node name -> total seconds
+        self._tool_runs = {} # tool run_id -> metrics dict
+        self._llm_runs = {} # llm run_id -> {"node", "messages"}
+        self.llm_calls = [] # metrics of the agent node's LLM calls, in order
+        self._prompt_cache = {"read": 0, "creation": 0} # Provider prompt cache tokens of every LLM call of the turn
+        self._tools_by_call_id = {}
+
+    # --- callbacks ---
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        now = time.perf_counter()
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+            # The first chain of a checkpoint namespace ("<node>:<task id>") is the node run itself
+            namespace = (metadata or {}).get("langgraph_checkpoint_ns")
+            if namespace and namespace not in self._node_starts:
+                self._node_starts[namespace] = now
+                self._node_runs[run_id] = namespace
+
+    def on_chain_end(self, outputs, *, run_id, metadata=None, **kwargs):
+        self._end_node(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_node(run_id)
+
+    def _end_node(self, run_id):
+        with self._lock:
+            namespace = self._node_runs.pop(run_id, None)
+            if namespace is None:
+                return
+            node = namespace.split(":")[0]
+            seconds = time.perf_counter() - self._node_starts[namespace]
+            self._node_seconds[node] = self._node_seconds.get(node, 0.0) + seconds
+        registry.observe("agent_node_seconds", "Wall time of one graph node run", seconds, node=node)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+            self._starts[run_id] = time.perf_counter()
+            self._llm_runs[run_id] = {
+                "node": (metadata or {}).get("langgraph_node"),
+                "messages": sum(len(batch) for batch in messages),
+                "model": ((kwargs.get("invocation_params") or {}).get("model")
+                          or (kwargs.get("invocation_params") or {}).get("model_name") or self.llm_name),
+            }
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        seconds = time.perf_counter() - self._starts.pop(run_id, time.perf_counter())
+        usage = _usage(response)
+        with self._lock:
+            run = self._llm_runs.pop(run_id, {})
+            run["model"] = _provider_model(response) or run.get("model")
+            self._prompt_cache["read"] += usage["prompt_cache_read_tokens"]
+            self._prompt_cache["creation"] += usage["prompt_cache_creation_tokens"]
+            tool_run = self._tool_ancestor(run_id)
+            if tool_run is not None:
+                # An LLM called by a tool (e.g. define_tool): its cost belongs to that tool call
+                tool_run["llm_input_tokens"] += usage["input_tokens"]
+                tool_run["llm_output_tokens"] += usage["output_tokens"]
+                tool_run["llm_prompt_cache_read_tokens"] += usage["prompt_cache_read_tokens"]
+                tool_run["llm_prompt_cache_creation_tokens"] += usage["prompt_cache_creation_tokens"]
+            elif run.get("node") == "agent":
+                self.llm_calls.append({
+                    "model": run.get("model"),
+                    "wall_seconds": seconds,
+                    "context_messages": run.get("messages", 0),
+                    **usage,
+                })
+        model = run.get("model") or "unknown"
+        registry.observe("agent_llm_seconds", "Wall time of one LLM call", seconds, model=model)
+        cache = "hit" if usage["cache_hit"] else "miss"
+        registry.inc("agent_llm_calls_total", "LLM calls", model=model, cache=cache)
+        for direction, key in (("input", "input_tokens"), ("output", "output_tokens"),
+                               ("prompt_cache_read", "prompt_cache_read_tokens"),
+                               ("prompt_cache_creation", "prompt_cache_creation_tokens")):
+            registry.inc("agent_llm_tokens_total", "LLM tokens", usage[key], model=model, direction=direction, cache=cache)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._starts.pop(run_id, None)
+            run = self._llm_runs.pop(run_id, {})
+        registry.inc("agent_llm_errors_total", "Failed LLM calls", model=run.get("model") or "unknown")
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        registry.inc("agent_retries_total", "Retries of runnables configured with with_retry")
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, inputs=None, **kwargs):
+        now = time.perf_counter()
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+            # Speculative calls (prefetch.py) are queued from their submission, other calls from their node's start
+            node_start = (metadata or {}).get("tool_submitted_at") or self._node_starts.get(
+                (metadata or {}).get("langgraph_checkpoint_ns"))
+            self._tool_runs[run_id] = {
+                "started": now,
+                "queue_seconds": now - node_start if node_start is not None else 0.0,
+                "input_tokens": _estimate_tokens(inputs if inputs is not None else input_str),
+                "llm_input_tokens": 0,
+                "llm_output_tokens": 0,
+                "llm_prompt_cache_read_tokens": 0,
+                "llm_prompt_cache_creation_tokens": 0,
+            }
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id, output, ok=getattr(output, "status", "success") != "error")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, None, ok=False)
+
+    def _end_tool(self, run_id, output, ok: bool):
+        now = time.perf_counter()
+        with self._lock:
+            run = self._tool_runs.pop(run_id, None)
+        if run is None:
+            return
+        name = getattr(output, "name", None) or "unknown"
+        content = getattr(output, "content", output)
+        run["wall_seconds"] = now - run.pop("started")
+        run["output_tokens"] = _estimate_tokens(content) if content is not None else 0
+        tool_call_id = getattr(output, "tool_call_id", None)
+        if tool_call_id:
+            with self._lock:
+                self._tools_by_call_id[tool_call_id] = run
+        registry.observe("agent_tool_seconds", "Wall time of one tool call", run["wall_seconds"], tool=name)
+        registry.observe("agent_tool_queue_seconds", "Time from the action node's start to the tool's start",
+                         run["queue_seconds"], tool=name)
+        registry.inc("agent_tool_calls_total", "Tool calls", tool=name, status="ok" if ok else "error")
+
+    def _tool_ancestor(self, run_id) -> Optional[dict]:
+        # Walks up the parent runs (lock held by the caller)
+        parent = self._parents.get(run_id)
+        while parent is not None:
+            if parent in self._tool_runs:
+                return self._tool_runs[parent]
+            parent = self._parents.get(parent)
+        return None
+
+    # --- results ---
+
+    def tool_metrics(self, tool_call_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._tools_by_call_id.get(tool_call_id)
+
+    def summary(self) -> dict:
+        turn_seconds = time.perf_counter() - self.started
+        registry.observe("agent_turn_seconds", "Wall time of one chat turn", turn_seconds)
+        with self._lock:
+            return {
+                "turn_seconds": turn_seconds,
+                "node_seconds": dict(self._node_seconds),
+                "llm_calls": len(self.llm_calls),
+                "llm_input_tokens": sum(c["input_tokens"] for c in self.llm_calls),
+                "llm_output_tokens": sum(c["output_tokens"] for c in self.llm_calls),
+                # Including LLMs called by tools
+                "prompt_cache_read_tokens": self._prompt_cache["read"],
+                "prompt_cache_creation_tokens": self._prompt_cache["creation"],
+            }
+
+
+def format_step_cost(step_metrics: dict) -> str:
+    """
+    One-line summary of a tool_entries item's "metrics", e.g. for the log.
+    """
+    if not step_metrics:
+        return ""
+    parts = []
+    if "wall_seconds" in step_metrics:
+        parts.append(f"{step_metrics['wall_seconds'] * 1000:.0f} ms")
+    if step_metrics.get("queue_seconds"):
+        parts.append(f"queued {step_metrics['queue_seconds'] * 1000:.0f} ms")
+    if "input_tokens" in step_metrics:
+        parts.append(f"{step_metrics['input_tokens']} in / {step_metrics.get('output_tokens', 0)} out tokens")
+    if step_metrics.get("llm_input_tokens") or step_metrics.get("llm_output_tokens"):
+        parts.append(f"nested LLM {step_metrics.get('llm_input_tokens', 0)} in / "
+                     f"{step_metrics.get('llm_output_tokens', 0)} out tokens")
+    cache_read = step_metrics.get("prompt_cache_read_tokens", 0) + step_metrics.get("llm_prompt_cache_read_tokens", 0)
+    cache_written = (step_metrics.get("prompt_cache_creation_tokens", 0)
+                     + step_metrics.get("llm_prompt_cache_creation_tokens", 0))
+    if cache_read or cache_written:
+        parts.append(f"prompt cache {cache_read} read / {cache_written} written tokens")
+    if step_metrics.get("retries"):
+        parts.append(f"{step_metrics['retries']} retries")
+    if step_metrics.get("cache_hit"):
+        parts.append("cache hit")
+    if step_metrics.get("prefetched"):
+        parts.append("prefetched while the LLM was deciding")
+    if step_metrics.get("memo_hit"):
+        parts.append("repeated call, answered from the turn's memo")
+    return ", ".join(parts)
+
+
+def render_prometheus() -> str:
+    """
+    All metrics in the Prometheus text format, including the HTTP layer's per-host figures.
+    """
+    from tools.http_client import http_metrics
+    lines = [registry.render().rstrip("\n")]
+    host_metrics = http_metrics()
+    if host_metrics:
+        for name, field, kind, help_text in (
+            ("tool_http_requests_total", "requests", "counter", "HTTP requests made by the tools, per host."),
+            ("tool_http_errors_total", "errors", "counter", "Tool HTTP requests that failed after their retries, per host."),
+            ("tool_http_retries_total", "retries", "counter", "Retries of tool HTTP requests, per host."),
+            ("tool_http_p95_seconds", "p95_seconds", "gauge", "95th percentile tool HTTP latency, per host."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{_labels((('host', host),))} {m[field]}" for host, m in host_metrics.items())
+    return "\n".join(line for line in lines if line) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[Any]:
+    """
+    Serves /metrics on a daemon thread, once per process. Returns the server, or None
+    when disabled (port 0) or when the port is taken (e.g. by another worker).
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+            logger.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+    return _server
@@ -0,0 +1,107 @@
+import logging
+import re
+import threading
+import time
+import uuid
+from langchain_core.runnables import RunnableConfig
+
+from config import PREFETCH_TOOLS, PREFETCH_MAX_CALLS
+from metrics import registry
+from router import REFERENCE_WORDS
+
+# Speculative tool calls. While the agent LLM decides what to do, likely tool calls parsed from
+# the user message (a place next to weather words, a term after "define", a news topic) already
+# run on the tool node's thread pool. If the LLM then issues a call with the same memo key
+# (tool name + canonical args), the tool node takes over the running call instead of starting
+# its own, so the LLM's latency and the tool's network latency overlap. Unclaimed calls are
+# discarded at the end of the turn and counted as wasted.
+
+logger = logging.getLogger(__name__)
+
+_WEATHER_WORDS_RE = re.compile(r"\b(?:weather|forecast|temperature|rain(?:ing|y)?|snow(?:ing|y)?|wind(?:y)?|sunny|cloudy)\b", re.I)
+# A capitalized place after in/for/at/near, optionally followed by ", State": "Rolla, MO", "St. Louis"
+_PLACE_RE = re.compile(r"\b(?:in|for|at|near)\s+((?:[A-Z][\w.'-]*\s?)+?(?:,\s*[A-Z][\w.'-]*(?:\s[A-Z][\w.'-]*)?)?)(?=[\s?!.,]|$)")
+_DEFINE_RE = re.compile(
+    r"\b(?:define|definition\s+of|meaning\s+of)\s+(?:the\s+(?:word|term)\s+)?[\"']?([\w-]+(?:\s[\w-]+){0,3}?)[\"']?"
+    r"(?=\s*(?:[?!.,;]|\s+and\b|\s+in\b|$))", re.I)
+_NEWS_RE = re.compile(r"\b(?:news|latest|updates?)\s+(?:about|on|for)\s+([^?!.;]+)", re.I)
+
+
+def candidate_calls(query: str) -> list:
+    """
+    Likely (tool name, args) calls for a user message, most likely first.
+    """
+    calls = []
+    if _WEATHER_WORDS_RE.search(query):
+        for place in _PLACE_RE.findall(query):
+            place = place.strip(" ,")
+            if place and place.lower() not in REFERENCE_WORDS:
+                calls.append(("weather_tool", {"location": place}))
+    for term in _DEFINE_RE.findall(query):
+        if term.lower() not in REFERENCE_WORDS:
+            calls.append(("define_tool", {"term": term}))
+    for topic in _NEWS_RE.findall(query):
+        calls.append(("tavily_search_results_json", {"query": f"{topic.strip()} news"}))
+    return calls
+
+
+class Prefetcher:
+    """
+    Starts speculative calls for a turn (start) and settles them when it ends (finish).
+    Only tools in PREFETCH_TOOLS are speculated on; stats counts started calls, hits and waste.
+    """
+
+    def __init__(self, tool_node, tools=PREFETCH_TOOLS, max_calls: int = PREFETCH_MAX_CALLS):
+        self.tool_node = tool_node
+        self.tools = frozenset(tools)
+        self.max_calls = max_calls
+        self.stats = {"started": 0, "hits": 0, "wasted": 0}
+        self._lock = threading.Lock()
+
+    def start(self, query: str, config: RunnableConfig) -> int:
+        memo = self.tool_node.memo.turn(config)
+        if memo is None:
+            return 0
+        started = 0
+        for name, args in candidate_calls(query):
+            if started >= self.max_calls:
+                break
+            if name not in self.tools:
+                continue
+            tool_call = {"name": name, "args": args, "id": f"prefetch_{uuid.uuid4().hex}", "type": "tool_call"}
+            key = self.tool_node.memo.key(tool_call)
+            if key is None:
+                continue
+            # The call runs under the router node's config: its queue time counts from here, not
+            # from the router node's start (see TurnMetrics.on_tool_start)
+            submitted = {**config, "metadata": {**(config.get("metadata") or {}), "tool_submitted_at": time.perf_counter()}}
+            future = self.tool_node.submit(tool_call, submitted)
+            if not self.tool_node.memo.add_prefetched(memo, key, future, tool_call["id"]):
+                future.cancel() # Same call already known for this turn
+                continue
+            started += 1
+            logger.debug(f"Prefetching {name}({args})")
+        return started
+
+    def finish(self, turn_id: str) -> dict:
+        """
+        Discards the turn's unclaimed speculative calls and returns {"started", "hits", "wasted"}.
+        """
+        memo = self.tool_node.memo.get(turn_id)
+        if memo is None:
+            return {"started": 0, "hits": 0, "wasted": 0}
+        started, unclaimed = self.tool_node.memo.take_prefetched(memo)
+        for future, _ in unclaimed.values():
+            future.cancel() # Calls already running finish in the background; their results are dropped
+        result = {"started": started, "hits": started - len(unclaimed), "wasted": len(unclaimed)}
+        with self._lock:
+            for k in self.stats:
+                self.stats[k] += result[k]
+        registry.inc("agent_prefetch_calls_total", "Speculative tool calls by outcome", result["hits"], outcome="hit")
+        registry.inc("agent_prefetch_calls_total", "Speculative tool calls by outcome", result["wasted"], outcome="wasted")
+        return result
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            settled = self.stats["hits"] + self.stats["wasted"]
+            return self.stats["hits"] / settled if settled else 0.0
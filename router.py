@@ -0,0 +1,182 @@
+import math
+import re
+from collections import Counter
+from typing import List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from config import ROUTER_DISPATCH_THRESHOLD, ROUTER_SUBSET_THRESHOLD, ROUTER_SUBSET_RATIO
+
+# Local intent router, run before the "agent" node of every turn. It never calls an LLM:
+#   - Patterns: a query that is obviously one tool call ("define X", "weather in X", "recipe for X")
+#     is dispatched straight to that tool, which saves the LLM step that would only emit the call.
+#   - Nearest neighbors: otherwise the query is scored against a TF-IDF index of the tool names,
+#     descriptions and a few hint words, and the agent LLM is bound to the closest tools only,
+#     which keeps the other tools' schemas out of the prompt. Low scores keep every tool bound.
+# Each decision is logged as a "tool_determination_router" entry of the turn's tool_entries.
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from get give how i in is it me my of on or please "
+    "show tell that the this to use what when where which who why will with you your".split()
+)
+# Words that refer back to the conversation; a pattern capturing one of them needs the LLM
+REFERENCE_WORDS = frozenset("it this that them there these those here he she they".split())
+
+# Extra words for the index, so common phrasings match tools whose descriptions don't use them
+_TOOL_HINTS = {
+    "weather_tool": "weather forecast temperature rain snow wind sunny cloudy hot cold outside",
+    "weather_batch_tool": "weather forecast temperature compare cities locations several",
+    "define_tool": "define definition meaning mean term concept explain",
+    "recipe_tool": "recipe cook cooking bake dish ingredients meal servings",
+    "summarize_tool": "summarize summary shorten condense tldr text",
+    "tavily_search_tool": "search web news latest current find look online",
+    "tavily_search_results_json": "search web news latest current events find look online",
+}
+
+# (tool name, argument, pattern); a pattern must match the whole query
+_PATTERNS = [
+    ("define_tool", "term", re.compile(r"(?:please\s+)?(?:define|definition\s+of)\s+(?P<arg>[^?!.]+)[?!.]*", re.I)),
+    ("define_tool", "term", re.compile(r"what\s+does\s+(?P<arg>[^?]+?)\s+mean\??", re.I)),
+    ("weather_tool", "location", re.compile(
+        r"(?:what(?:'s|\s+is)\s+the\s+)?(?:weather|forecast)(?:\s+like)?\s+(?:in|for|at)\s+(?P<arg>[^?!]+?)"
+        r"(?:\s+(?:today|tonight|tomorrow|now|right\s+now|this\s+week))?\s*[?!.]*", re.I)),
+    ("recipe_tool", "dish", re.compile(
+        r"(?:(?:give\s+me|find|show\s+me|i\s+need)\s+)?(?:an?\s+)?recipe\s+for\s+(?P<arg>[^?!.]+)[?!.]*", re.I)),
+    ("tavily_search_tool", "query", re.compile(r"(?:search(?:\s+the\s+web)?|look\s+up)\s+(?:for\s+)?(?P<arg>.+)", re.I)),
+]
+
+
+def _stem(word: str) -> str:
+    # Crude suffix stripping, enough to match "definitions"/"define", "recipes"/"recipe"
+    for suffix in ("ing", "ions", "ion", "es", "s", "e"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[: -len(suffix)]
+    return word
+
+
+def _terms(text: str) -> List[str]:
+    return [_stem(w) for w in _WORD_RE.findall(text.lower().replace("_", " ")) if w not in _STOPWORDS]
+
+
+def message_text(msg) -> str:
+    if isinstance(msg.content, str):
+        return msg.content
+    return " ".join(part.get("text", "") for part in msg.content if isinstance(part, dict))
+
+
+class ToolRouter:
+    """
+    Picks tools for a query without an LLM. route() returns a decision dict:
+      method          - "pattern", "nearest_tools" or "all_tools"
+      tool_call       - the call to dispatch directly (pattern matches only), else None
+      selected_tools  - names of the tools to bind to the agent LLM for this turn
+      confidence, threshold, scores
+    """
+
+    def __init__(self, tools: Sequence):
+        self.tool_names = [t.name for t in tools]
+        docs = {t.name: _terms(f"{t.name} {t.description} {_TOOL_HINTS.get(t.name, '')}") for t in tools}
+        df = Counter(term for terms in docs.values() for term in set(terms))
+        n = len(docs)
+        self.idf = {term: math.log((n + 1) / (count + 1)) + 1 for term, count in df.items()}
+        self.vectors = {name: self._vector(terms) for name, terms in docs.items()}
+
+    def _vector(self, terms: List[str]) -> dict:
+        weights = {term: count * self.idf[term] for term, count in Counter(terms).items() if term in self.idf}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {term: w / norm for term, w in weights.items()}
+
+    def scores(self, query: str) -> dict:
+        q = self._vector(_terms(query))
+        return {name: sum(w * vec.get(term, 0.0) for term, w in q.items()) for name, vec in self.vectors.items()}
+
+    def _match_pattern(self, query: str):
+        for tool_name, arg_name, pattern in _PATTERNS:
+            if tool_name not in self.tool_names:
+                continue
+            match = pattern.fullmatch(query)
+            if not match:
+                continue
+            arg = match.group("arg").strip(" \"'")
+            words = arg.lower().split()
+            if not words or set(words) & REFERENCE_WORDS:
+                return None # "define it", "weather there": depends on the conversation
+            # Several items ("in Rolla and Chicago") or long arguments are better left to the LLM
+            ambiguous = len(words) > 8 or any(sep in f" {arg.lower()} " for sep in (" and ", " or ", ";"))
+            return tool_name, {arg_name: arg}, 0.6 if ambiguous else 0.95
+        return None
+
+    def route(self, query: str) -> dict:
+        query = " ".join(query.split())
+        scores = self.scores(query)
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        decision = {"scores": {name: round(score, 3) for name, score in ranked}, "tool_call": None}
+
+        matched = self._match_pattern(query)
+        if matched and matched[2] >= ROUTER_DISPATCH_THRESHOLD:
+            tool_name, args, confidence = matched
+            # The agent phrases the answer next; keep the similar tools bound for follow-up calls
+            similar = [name for name, score in ranked if score >= ROUTER_SUBSET_THRESHOLD and name != tool_name]
+            decision.update(method="pattern", confidence=confidence, threshold=ROUTER_DISPATCH_THRESHOLD,
+                            selected_tools=[tool_name] + similar,
+                            tool_call={"name": tool_name, "args": args, "type": "tool_call"})
+            return decision
+
+        top_score = ranked[0][1] if ranked else 0.0
+        if top_score >= ROUTER_SUBSET_THRESHOLD:
+            selected = [name for name, score in ranked if score >= top_score * ROUTER_SUBSET_RATIO]
+            decision.update(method="nearest_tools", confidence=round(top_score, 3),
+                            threshold=ROUTER_SUBSET_THRESHOLD, selected_tools=selected)
+        else:
+            decision.update(method="all_tools", confidence=round(top_score, 3),
+                            threshold=ROUTER_SUBSET_THRESHOLD, selected_tools=list(self.tool_names))
+        return decision
+
+
+def router_entry(query: str, decision: dict) -> dict:
+    """
+    The tool_entries item describing a routing decision (shown by the log and the mindmap).
+    """
+    if decision["tool_call"]:
+        response = f"pattern match: {decision['tool_call']['name']}({decision['tool_call']['args']})"
+    else:
+        response = f"{decision['method']}: " + ", ".join(f"{n} {s:.2f}" for n, s in decision["scores"].items())
+    return {
+        "name": "tool_determination_router",
+        "router_llm_prompt": query, # Kept name: the log has always shown the router's input here
+        "router_llm_raw_response": response,
+        "selected_tools_list": decision["selected_tools"],
+        "router_method": decision["method"],
+        "confidence": decision["confidence"],
+        "threshold": decision["threshold"],
+    }
+
+
+def route_node(router: Optional[ToolRouter]):
+    """
+    Builds the graph's "router" node. Its update carries the decision ("route") and the tools
+    to bind ("selected_tools"), plus an AIMessage with the tool call when dispatching directly.
+    """
+
+    def route(state: dict) -> dict:
+        messages = state["messages"]
+        last = messages[-1] if messages else None
+        if router is None or not isinstance(last, HumanMessage):
+            return {"selected_tools": None, "route": None}
+        query = message_text(last)
+        decision = router.route(query)
+        update = {"selected_tools": decision["selected_tools"], "route": router_entry(query, decision)}
+        if decision["tool_call"]:
+            # Unique within the thread, whose history only grows, and the same on every replay of it
+            tool_call = {**decision["tool_call"], "id": f"route_{len(messages)}"}
+            update["messages"] = [AIMessage(content="", tool_calls=[tool_call])]
+        return update
+
+    return route
+
+
+def after_route(state: dict) -> str:
+    # A dispatched tool call goes straight to the tools; anything else to the agent LLM
+    last = state["messages"][-1]
+    return "action" if isinstance(last, AIMessage) and last.tool_calls else "agent"
@@ -0,0 +1,202 @@
+import asyncio
+import contextlib
+import json
+import logging
+import uuid
+from typing import Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from config import SERVER_HOST, SERVER_PORT, SERVER_QUEUE_SIZE, SERVER_WORKERS
+from metrics import registry, render_prometheus
+
+# Headless HTTP API for the chat agent (run with `python server.py` or `uvicorn server:app`).
+#   POST /chat         {"message", "llm_name", "session_id"} -> the chat_fn result as JSON
+#   POST /chat/stream  the same request, answered with the stream_chat_fn events as server-sent events
+#   GET  /healthz      pool load; GET /metrics the Prometheus metrics
+# Turns run on a fixed pool of worker tasks fed by a bounded queue. When the queue is full the
+# request is refused with 429 instead of piling up; a session with a turn already queued or running
+# gets 409, so one conversation thread never runs two turns at once. The compiled graphs and the
+# tool node are shared; everything per turn is keyed by thread_id (session) and turn_id.
+# Each process has its own pool: scale out with more processes or nodes, routing a session to
+# the process that has its checkpoint (or sharing CHECKPOINT_DB_PATH).
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class SessionBusy(Exception):
+    pass
+
+
+class _Job:
+    def __init__(self, message: str, llm_name: str, session_id: str):
+        self.message = message
+        self.llm_name = llm_name
+        self.session_id = session_id
+        self.events = asyncio.Queue() # Events of the turn, then None
+
+
+class ChatPool:
+    """
+    `workers` tasks running astream_chat_fn for the jobs of a queue holding at most `queue_size`.
+    submit() raises PoolSaturated when the queue is full and SessionBusy when the session
+    already has a turn queued or running.
+    """
+
+    def __init__(self, workers: int = SERVER_WORKERS, queue_size: int = SERVER_QUEUE_SIZE, stream_fn=None):
+        if stream_fn is None:
+            from chat_service import astream_chat_fn as stream_fn
+        self.stream_fn = stream_fn
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=max(1, queue_size)) # maxsize 0 would be unbounded
+        self.running = 0
+        self._sessions = set() # Sessions with a turn queued or running
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work(), name=f"chat-worker-{i}") for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def status(self) -> dict:
+        return {"workers": self.workers, "running": self.running,
+                "queued": self.queue.qsize(), "queue_size": self.queue.maxsize}
+
+    def submit(self, message: str, llm_name: str, session_id: str) -> _Job:
+        if session_id in self._sessions:
+            raise SessionBusy(session_id)
+        job = _Job(message, llm_name, session_id)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise PoolSaturated() from None
+        self._sessions.add(session_id)
+        return job
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            self.running += 1
+            try:
+                async for event in self.stream_fn(job.message, job.llm_name, job.session_id):
+                    job.events.put_nowait(event)
+            except Exception as e:
+                logger.exception(f"Turn of session {job.session_id} failed")
+                job.events.put_nowait({"type": "error", "message": str(e)})
+            finally:
+                job.events.put_nowait(None)
+                self.running -= 1
+                self._sessions.discard(job.session_id)
+                self.queue.task_done()
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+async def _submit(request: Request):
+    """
+    The queued job for a chat request, or the error response refusing it.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        return None, JSONResponse({"error": "Request body must be JSON."}, status_code=400)
+    message = body.get("message") if isinstance(body, dict) else None
+    if not isinstance(message, str) or not message.strip():
+        return None, JSONResponse({"error": "\"message\" must be a non-empty string."}, status_code=400)
+    session_id = body.get("session_id") or str(uuid.uuid4())
+    pool = request.app.state.pool
+    try:
+        job = pool.submit(message, body.get("llm_name") or "DeepSeek", session_id)
+    except PoolSaturated:
+        registry.inc("agent_server_requests_total", "Chat API requests by outcome", outcome="rejected")
+        return None, JSONResponse({"error": "Server is busy, retry later."}, status_code=429, headers={"Retry-After": "1"})
+    except SessionBusy:
+        registry.inc("agent_server_requests_total", "Chat API requests by outcome", outcome="session_busy")
+        return None, JSONResponse({"error": "This session already has a turn in progress."}, status_code=409)
+    registry.inc("agent_server_requests_total", "Chat API requests by outcome", outcome="accepted")
+    return job, None
+
+
+async def chat(request: Request):
+    job, refused = await _submit(request)
+    if refused is not None:
+        return refused
+    while (event := await job.events.get()) is not None:
+        if event["type"] == "final":
+            return PlainTextResponse(_dumps(event["entry"]), media_type="application/json",
+                                     headers={"X-Session-Id": job.session_id})
+        if event["type"] == "error":
+            return JSONResponse({"error": event["message"]}, status_code=500)
+    return JSONResponse({"error": "Agent stream ended without a final event."}, status_code=500)
+
+
+async def chat_stream(request: Request):
+    job, refused = await _submit(request)
+    if refused is not None:
+        return refused
+
+    async def events():
+        # A client that disconnects only stops reading; the turn still finishes and is checkpointed
+        while (event := await job.events.get()) is not None:
+            yield f"event: {event['type']}\ndata: {_dumps(event)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"X-Session-Id": job.session_id, "Cache-Control": "no-cache"})
+
+
+async def healthz(request: Request):
+    return JSONResponse(request.app.state.pool.status())
+
+
+async def metrics(request: Request):
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+def create_app(workers: int = SERVER_WORKERS, queue_size: int = SERVER_QUEUE_SIZE, stream_fn=None) -> Starlette:
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette):
+        app.state.pool = ChatPool(workers, queue_size, stream_fn)
+        app.state.pool.start()
+        yield
+        await app.state.pool.stop()
+
+    return Starlette(routes=[
+        Route("/chat", chat, methods=["POST"]),
+        Route("/chat/stream", chat_stream, methods=["POST"]),
+        Route("/healthz", healthz),
+        Route("/metrics", metrics),
+    ], lifespan=lifespan)
+
+
+app = create_app()
+
+
+def main(host: str = SERVER_HOST, port: int = SERVER_PORT, processes: Optional[int] = None):
+    import uvicorn
+    if processes and processes > 1:
+        uvicorn.run("server:app", host=host, port=port, workers=processes)
+    else:
+        uvicorn.run(app, host=host, port=port)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Headless chat API")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--processes", type=int, default=1, help="Server processes, each with its own worker pool")
+    args = parser.parse_args()
+    main(args.host, args.port, args.processes)
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+import pytest
+
+# Offline stand-ins for the LLM providers and the tools' web services, shared by the
+# headless tests and benchmarks. Importing the app modules needs API keys to be set,
+# but nothing here ever sends them anywhere.
+for _key in ("DEEPSEEK_API_KEY", "ANTHROPIC_API_KEY", "TAVILY_API_KEY"):
+    os.environ.setdefault(_key, "offline")
+
+
+class FakeToolCallingModel(BaseChatModel):
+    """
+    Deterministic chat model that emits scripted tool calls.
+
+    steps[i] is the list of (tool_name, args) calls made at the i-th LLM call of a turn;
+    once the steps are used up it answers with `answer`. The step is derived from the
+    messages of the current turn, so one instance can serve many sessions at once.
+    `latency` simulates the provider's response time in seconds.
+    """
+
+    steps: List[List[Tuple[str, dict]]] = []
+    answer: str = "Here is what I found."
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-tool-calling"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _next_message(self, messages) -> AIMessage:
+        turn_start = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+        step = sum(1 for m in messages[turn_start:] if isinstance(m, AIMessage))
+        if step >= len(self.steps):
+            return AIMessage(content=self.answer)
+        # Ids must be unique within the session's thread, whose history only grows
+        tool_calls = [
+            {"name": name, "args": args, "id": f"call_{len(messages)}_{j}", "type": "tool_call"}
+            for j, (name, args) in enumerate(self.steps[step])
+        ]
+        return AIMessage(content="", tool_calls=tool_calls)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real services
+    disable_nagle_algorithm = True # Headers and body are written separately; don't wait on delayed ACKs
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, body: Any, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _hit(self, service: str):
+        services = self.server.services
+        with services.lock:
+            services.hits[service] = services.hits.get(service, 0) + 1
+        if services.latency:
+            time.sleep(services.latency)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        base = self.server.services.url
+        if url.path == "/nominatim/search":
+            self._hit("nominatim")
+            query = parse_qs(url.query).get("q", [""])[0]
+            seed = zlib.crc32(query.lower().encode()) # Different places get different grid points
+            self._send_json([{"lat": f"{30 + seed % 1500 / 100:.4f}", "lon": f"{-120 + seed % 4000 / 100:.4f}",
+                              "display_name": query}])
+        elif url.path.startswith("/nws/points/"):
+            self._hit("nws_points")
+            grid = url.path.rsplit("/", 1)[1]
+            self._send_json({"properties": {"forecast": f"{base}/nws/gridpoints/{grid}/forecast"}})
+        elif url.path.startswith("/nws/gridpoints/"):
+            self._hit("nws_forecast")
+            self._send_json(
+                {"properties": {"periods": [{"name": "Tonight", "shortForecast": "Clear", "temperature": 54,
+                                             "temperatureUnit": "F", "startTime": "2025-05-16T18:00:00-05:00"}]}},
+                {"Cache-Control": self.server.services.forecast_cache_control},
+            )
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/tavily/search":
+            self.send_error(404)
+            return
+        self._hit("tavily")
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        query = payload.get("query", "")
+        results = [
+            {"title": f"Result {i} for {query}", "url": f"https://example.com/{zlib.crc32(query.encode())}/{i}",
+             "content": f"Snippet {i} about {query}. " * 5, "score": 1 - i / 10,
+             "raw_content": "Full page text. " * 200}
+            for i in range(payload.get("max_results", 5))
+        ]
+        self._send_json({"query": query, "results": results, "images": [], "follow_up_questions": None,
+                         "response_time": 0.01})
+
+
+class StubServices:
+    """
+    Local HTTP server standing in for Nominatim, the NWS API and Tavily.
+    `latency` delays every response, `hits` counts requests per service.
+    `forecast_cache_control` is the Cache-Control header of the NWS forecasts.
+    """
+
+    def __init__(self, latency: float = 0.0, forecast_cache_control: str = "public, max-age=600"):
+        self.latency = latency
+        self.forecast_cache_control = forecast_cache_control
+        self.hits = {}
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.services = self
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "StubServices":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def patch_endpoints(self, monkeypatch):
+        """
+        Points the weather and search tools at this server.
+        """
+        import tools.search_backend
+        import tools.weather
+        monkeypatch.setattr(tools.weather, "NOMINATIM_URL", f"{self.url}/nominatim/search")
+        monkeypatch.setattr(tools.weather, "NWS_POINTS_URL_TEMPLATE", f"{self.url}/nws/points/{{lat}},{{lon}}")
+        monkeypatch.setattr(tools.search_backend, "TAVILY_SEARCH_URL", f"{self.url}/tavily/search")
+
+
+def isolate_state(monkeypatch, tmp_path):
+    """
+    Gives the tool caches, the tool payload store and the checkpointer fresh SQLite files
+    under tmp_path, so runs neither read nor pollute the real cache and checkpoint databases.
+    """
+    import sqlite3
+    import cache_store
+    import compaction
+    import memory
+    import tools.search_backend
+    import tools.weather_cache
+
+    db_path = str(tmp_path / "cache.sqlite")
+    monkeypatch.setattr(tools.weather_cache, "_caches", {
+        namespace: cache_store.TieredCache(namespace, ttl=ttl, db_path=db_path)
+        for namespace, ttl in tools.weather_cache._SPECS.items()
+    })
+    monkeypatch.setattr(tools.search_backend, "_cache", cache_store.TieredCache("web_search", ttl=3600, db_path=db_path))
+    monkeypatch.setattr(compaction, "_payloads", cache_store.TieredCache("tool_payloads", ttl=3600, db_path=db_path))
+    conn = sqlite3.connect(str(tmp_path / "checkpoints.sqlite"), check_same_thread=False)
+    monkeypatch.setattr(memory, "_checkpointer", memory.ThreadedSqliteSaver(conn))
+
+
+
+@pytest.fixture
+def run_turn(monkeypatch, tmp_path):
+    """
+    Fixture running whole chat turns offline: isolated state, the tools pointed at StubServices and
+    the agent LLM replaced by a FakeToolCallingModel. Yields (run, services), where
+    run(query, steps, latency=0.0) returns chat_fn's entry for one turn of a new session.
+    Use it by importing it into the test module.
+    """
+    import chat_service
+    import lang_graph
+    isolate_state(monkeypatch, tmp_path)
+    services = StubServices().start()
+    services.patch_endpoints(monkeypatch)
+
+    def run(query: str, steps, latency: float = 0.0) -> dict:
+        model = FakeToolCallingModel(steps=steps, latency=latency)
+        monkeypatch.setitem(lang_graph._agent_graphs, "Fake", lang_graph.build_agent_graph(model))
+        return chat_service.chat_fn(query, "Fake", uuid.uuid4().hex)
+
+    yield run, services
+    services.stop()
+
+def clear_tool_caches():
+    import tools.search_backend
+    import tools.weather_cache
+    for cache in tools.weather_cache._caches.values():
+        cache.clear()
+    tools.search_backend._get_cache().clear()
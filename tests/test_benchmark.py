@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+
+from tests.fakes import FakeToolCallingModel, StubServices, clear_tool_caches, isolate_state
+
+# Headless benchmark of the agent loop: chat_service.chat_fn and the compiled graph run against
+# FakeToolCallingModel and local stubs of Nominatim, NWS and Tavily, so only our own code is timed.
+# Each scenario reports p50/p95 turn latency, graph overhead per node run and memory per turn,
+# and fails when a metric exceeds its baseline (tests/benchmark_baseline.json) times BENCH_TOLERANCE.
+#
+# The timings are absolute and machine dependent, so the benchmark only runs when asked for:
+#
+#   BENCH_ENABLE=1 pytest -s tests/test_benchmark.py                         # print the report
+#   BENCH_ENABLE=1 BENCH_UPDATE_BASELINE=1 pytest tests/test_benchmark.py    # record new baselines
+#   BENCH_ENABLE=1 BENCH_REPORT_PATH=bench.json pytest tests/test_benchmark.py
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "2.0"))
+TURNS = int(os.getenv("BENCH_TURNS", "30"))
+WARMUP_TURNS = 3
+MEMORY_TURNS = 5
+
+LONG_TEXT = " ".join(f"Sentence {i} talks about topic {i % 7} and detail {i % 13}." for i in range(400))
+
+SCENARIOS = {
+    "answer_only": [],
+    "weather": [[("weather_tool", {"location": "Rolla, MO"})]],
+    "search": [[("tavily_search_tool", {"query": "self-driving cars news", "top_n": 2})]],
+    "multi_tool": [
+        [("weather_tool", {"location": "Rolla, MO"}), ("tavily_search_results_json", {"query": "Rolla events"})],
+        [("summarize_tool", {"text": LONG_TEXT, "max_words": 60})],
+    ],
+}
+
+_report = {}
+
+pytestmark = pytest.mark.skipif(os.getenv("BENCH_ENABLE") != "1", reason="benchmark; set BENCH_ENABLE=1 to run it")
+
+
+class _StepTimer(BaseCallbackHandler):
+    """
+    Sums the time spent inside the LLM and the tools, and counts graph node runs.
+    """
+
+    def __init__(self):
+        self.starts = {}
+        self.llm_seconds = 0.0
+        self.tool_seconds = 0.0
+        self.node_runs = 0
+        self.namespaces = set()
+        self._lock = threading.Lock()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        # Every node run has its own checkpoint namespace ("<node>:<task id>"), shared by its nested chains
+        namespace = (metadata or {}).get("langgraph_checkpoint_ns")
+        if namespace:
+            with self._lock:
+                if namespace not in self.namespaces:
+                    self.namespaces.add(namespace)
+                    self.node_runs += 1
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            self.llm_seconds += time.perf_counter() - self.starts.pop(run_id, time.perf_counter())
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.starts[run_id] = time.perf_counter()
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        with self._lock:
+            self.tool_seconds += time.perf_counter() - self.starts.pop(run_id, time.perf_counter())
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+@pytest.fixture(scope="module")
+def stub_services():
+    services = StubServices().start()
+    yield services
+    services.stop()
+
+
+@pytest.fixture
+def fake_agent(monkeypatch, tmp_path, stub_services):
+    """
+    Returns a function that registers a graph for a scripted model under the name "Fake".
+    """
+    import lang_graph
+    isolate_state(monkeypatch, tmp_path)
+    stub_services.patch_endpoints(monkeypatch)
+
+    def register(steps):
+        graph = lang_graph.build_agent_graph(FakeToolCallingModel(steps=steps))
+        monkeypatch.setitem(lang_graph._agent_graphs, "Fake", graph)
+        return graph
+
+    return register
+
+
+def _measure(graph, chat_fn) -> dict:
+    def turn():
+        clear_tool_caches() # Every turn takes the full path through the tools and the stubs
+        return chat_fn("Benchmark question", "Fake", uuid.uuid4().hex)
+
+    for _ in range(WARMUP_TURNS):
+        turn()
+
+    latencies = []
+    for _ in range(TURNS):
+        started = time.perf_counter()
+        entry = turn()
+        latencies.append(time.perf_counter() - started)
+    assert not any(str(step.get("tool_output")).startswith("Error") for step in entry["tool_entries"])
+
+    timer = _StepTimer()
+    overheads = []
+    for _ in range(TURNS):
+        clear_tool_caches()
+        before = (timer.llm_seconds, timer.tool_seconds, timer.node_runs)
+        started = time.perf_counter()
+        graph.invoke({"messages": [HumanMessage(content="Benchmark question")]},
+                     {"configurable": {"thread_id": uuid.uuid4().hex}, "callbacks": [timer]})
+        elapsed = time.perf_counter() - started
+        llm, tool, runs = (timer.llm_seconds - before[0], timer.tool_seconds - before[1], timer.node_runs - before[2])
+        overheads.append((elapsed - llm - tool) / max(1, runs))
+
+    tracemalloc.start()
+    try:
+        peaks = []
+        retained_start = tracemalloc.get_traced_memory()[0]
+        for _ in range(MEMORY_TURNS):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            turn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        retained = (tracemalloc.get_traced_memory()[0] - retained_start) / MEMORY_TURNS
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "overhead_per_step_ms": _percentile(overheads, 50) * 1000,
+        "node_runs_per_turn": timer.node_runs / TURNS,
+        "peak_kb_per_turn": max(peaks) / 1024,
+        "retained_kb_per_turn": retained / 1024,
+    }
+
+
+# Metrics checked against the baseline; the others are only reported
+GATED_METRICS = ("p95_ms", "overhead_per_step_ms", "peak_kb_per_turn")
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("scenario", list(SCENARIOS))
+def test_agent_turn_benchmark(scenario, fake_agent):
+    import chat_service
+    graph = fake_agent(SCENARIOS[scenario])
+    result = _measure(graph, chat_service.chat_fn)
+    _report[scenario] = result
+    print(f"\n[benchmark] {scenario}: " + ", ".join(f"{k}={v:.2f}" for k, v in result.items()))
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+    if os.getenv("BENCH_UPDATE_BASELINE") == "1":
+        baselines[scenario] = {metric: round(result[metric], 2) for metric in GATED_METRICS}
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if os.getenv("BENCH_REPORT_PATH"):
+        with open(os.environ["BENCH_REPORT_PATH"], "w", encoding="utf-8") as f:
+            json.dump(_report, f, indent=2, sort_keys=True)
+
+    regressions = [
+        f"{metric}: {result[metric]:.2f} > {baselines[scenario][metric]:.2f} x {TOLERANCE}"
+        for metric in GATED_METRICS
+        if metric in baselines.get(scenario, {}) and result[metric] > baselines[scenario][metric] * TOLERANCE
+    ]
+    assert not regressions, f"{scenario} regressed: " + "; ".join(regressions)
@@ -0,0 +1,28 @@
+from langchain_core.messages import AIMessage, ToolMessage
+
+import tests.fakes # noqa: F401 (dummy API keys)
+from chat_service import _TurnEvents
+
+
+def test_final_entry_uses_the_last_agent_text():
+    turn = _TurnEvents("define entropy")
+    turn.handle("updates", {"agent": {"messages": [AIMessage(content=[{"type": "text", "text": "Entropy is..."}])]}})
+    turn.handle("updates", {"compact": {"messages": [ToolMessage(content="summary", tool_call_id="c1")]}})
+    assert turn.final()["entry"]["parsed"] == "Entropy is..."
+
+
+def test_final_entry_without_agent_text_is_empty():
+    turn = _TurnEvents("weather in Rolla")
+    call = {"name": "weather_tool", "args": {"location": "Rolla"}, "id": "c1", "type": "tool_call"}
+    turn.handle("updates", {"router": {"messages": [AIMessage(content="", tool_calls=[call])]}})
+    turn.handle("updates", {"action": {"messages": [ToolMessage(content="sunny", tool_call_id="c1")]}})
+    assert turn.final()["entry"]["parsed"] == ""
+
+
+def test_final_entry_names_the_answering_provider():
+    turn = _TurnEvents("define entropy", "DeepSeek")
+    answer = AIMessage(content="Entropy is...", response_metadata={"provider": "Claude"})
+    turn.handle("updates", {"agent": {"messages": [answer]}})
+    entry = turn.final()["entry"]
+    assert entry["llm"] == "DeepSeek"
+    assert entry["tool_entries"][0]["provider"] == "Claude"
@@ -0,0 +1,38 @@
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from tests.fakes import isolate_state
+import compaction
+
+
+def _state(*outputs) -> dict:
+    calls = [{"name": "tavily_search_results_json", "args": {"query": "q"}, "id": f"call_{i}", "type": "tool_call"}
+             for i in range(len(outputs))]
+    return {"messages": [HumanMessage(content="q"), AIMessage(content="", tool_calls=calls)] + [
+        ToolMessage(content=output, tool_call_id=f"call_{i}", name="tavily_search_results_json", id=f"tool_{i}")
+        for i, output in enumerate(outputs)
+    ]}
+
+
+def test_outputs_over_budget_are_compacted(monkeypatch, tmp_path):
+    isolate_state(monkeypatch, tmp_path)
+    monkeypatch.setattr(compaction, "TOOL_OUTPUT_TOKEN_BUDGET", 50)
+    monkeypatch.setattr(compaction, "TOOL_OUTPUT_TOKEN_BUDGETS", {})
+    output = json.dumps({"results": [{"title": "Rolla", "content": "Farmers market. " * 100,
+                                      "raw_content": "Full page. " * 500}], "images": []})
+    replaced, = compaction.compact_tool_outputs(_state(output))["messages"]
+    assert replaced.id == "tool_0" # Replaces the original in the checkpointed history
+    assert "raw_content" not in replaced.content and replaced.content.endswith("...[truncated]")
+    assert compaction.estimate_tokens(replaced.content) <= 50
+    metadata = replaced.response_metadata
+    assert metadata["original_tokens"] > metadata["context_tokens"]
+    assert compaction.get_full_payload(metadata["payload_ref"]) == output
+
+
+def test_outputs_under_budget_are_left_alone(monkeypatch, tmp_path):
+    isolate_state(monkeypatch, tmp_path)
+    monkeypatch.setattr(compaction, "TOOL_OUTPUT_TOKEN_BUDGET", 500)
+    monkeypatch.setattr(compaction, "TOOL_OUTPUT_TOKEN_BUDGETS", {})
+    output = json.dumps({"results": [{"title": "Rolla", "content": "Farmers market."}]}, separators=(",", ":"))
+    assert compaction.compact_tool_outputs(_state(output, "Clear, 54°F")) == {"messages": []}
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+import requests
+
+from tools import http_client
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    /flaky/<n> fails with 503 the first n times it is requested, then returns JSON.
+    /ok always returns JSON.
+    """
+    hits = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        count = StubHandler.hits.get(self.path, 0)
+        StubHandler.hits[self.path] = count + 1
+        if self.path.startswith("/flaky/") and count < int(self.path.rsplit("/", 1)[1]):
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({"path": self.path, "hit": count + 1}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(http_client, "HTTP_BACKOFF_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(http_client, "HTTP_MAX_RETRIES", 3)
+    StubHandler.hits.clear()
+    http_client.reset_http_metrics()
+
+
+def test_retries_until_success(stub_url):
+    data = http_client.get_json(f"{stub_url}/flaky/2")
+    assert data["hit"] == 3
+    host = stub_url.split("//")[1]
+    assert http_client.http_metrics()[host]["retries"] == 2
+
+
+def test_gives_up_after_max_retries(stub_url):
+    with pytest.raises(requests.exceptions.HTTPError):
+        http_client.get_json(f"{stub_url}/flaky/10")
+    assert StubHandler.hits["/flaky/10"] == 4 # First attempt + 3 retries
+
+
+def test_rate_limit_per_host(stub_url, monkeypatch):
+    host = stub_url.split("//")[1]
+    monkeypatch.setattr(http_client, "HTTP_HOST_RATE_LIMITS", {host: 10.0})
+    monkeypatch.setattr(http_client, "_buckets", {})
+    started = time.perf_counter()
+    for _ in range(4):
+        http_client.get_json(f"{stub_url}/ok")
+    # One token is available immediately, the other three wait 0.1s each
+    assert time.perf_counter() - started >= 0.28
+
+
+def test_async_retries_until_success(stub_url):
+    data = asyncio.run(http_client.aget_json(f"{stub_url}/flaky/1"))
+    assert data["hit"] == 2
+
+
+def test_async_gives_up_after_max_retries(stub_url):
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(http_client.aget_json(f"{stub_url}/flaky/10"))
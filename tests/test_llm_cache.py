@@ -0,0 +1,45 @@
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from cache_store import TieredCache
+from llm_cache import LLMResponseCache
+from tests.fakes import FakeToolCallingModel
+
+
+class MeteredModel(FakeToolCallingModel):
+    calls: int = 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        message = AIMessage(content=self.answer, usage_metadata={"input_tokens": 90, "output_tokens": 10, "total_tokens": 100})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _cache(tmp_path) -> LLMResponseCache:
+    return LLMResponseCache(TieredCache("llm_responses", ttl=60, db_path=str(tmp_path / "cache.sqlite")))
+
+
+def test_hit_reports_the_saved_latency_and_tokens(tmp_path):
+    cache = _cache(tmp_path)
+    model = MeteredModel(answer="cached answer", latency=0.2, cache=cache)
+    first = model.invoke([HumanMessage(content="What is entropy?", id="a")])
+
+    started = time.perf_counter()
+    second = model.invoke([HumanMessage(content="What is entropy?", id="b")]) # Message ids aren't part of the key
+    assert time.perf_counter() - started < 0.1
+    assert second.content == first.content and model.calls == 1
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+    assert cache.stats["saved_seconds"] >= 0.2
+    assert cache.stats["saved_tokens"] == 100
+
+
+def test_miss_on_other_messages_or_parameters(tmp_path):
+    cache = _cache(tmp_path)
+    model = MeteredModel(answer="a", cache=cache)
+    model.invoke([HumanMessage(content="What is entropy?")])
+    model.invoke([HumanMessage(content="What is enthalpy?")])
+    model.invoke([HumanMessage(content="What is entropy?")], stop=["."]) # Call parameters are part of the key
+    assert cache.stats["hits"] == 0 and cache.stats["misses"] == 3
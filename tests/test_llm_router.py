@@ -0,0 +1,135 @@
+import asyncio
+import time
+import uuid
+
+from langchain_core.messages import AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_core.tools import tool
+
+from tests.fakes import FakeToolCallingModel
+from llm_router import RoutedChatModel, provider_health
+from metrics import TurnMetrics
+
+
+class FailingModel(FakeToolCallingModel):
+    calls: int = 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        raise ConnectionError("provider down")
+
+
+class CancellableModel(FakeToolCallingModel):
+    cancelled: bool = False
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        try:
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+class ChunkedModel(FakeToolCallingModel):
+    model_name: str = "chunked-1"
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for word in self.answer.split():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+class EmptyModel(FakeToolCallingModel):
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        return iter(())
+
+
+@tool
+def lookup(term: str) -> str:
+    """Looks up a term."""
+    return term
+
+
+def _names(*labels):
+    # Provider health is process-wide; fresh names keep the tests independent
+    return [f"{label}-{uuid.uuid4().hex[:8]}" for label in labels]
+
+
+def test_hedge_answers_from_the_faster_provider():
+    slow, fast = _names("slow", "fast")
+    provider_health(slow).latencies.extend([0.05] * 20) # p95 of 50ms, so the hedge fires early
+    model = RoutedChatModel(providers=[slow, fast], cache=False, hedging=True, models={
+        slow: FakeToolCallingModel(answer="slow", latency=2.0),
+        fast: FakeToolCallingModel(answer="fast", latency=0.05),
+    })
+    started = time.perf_counter()
+    response = model.invoke([HumanMessage(content="hi")])
+    assert response.content == "fast"
+    assert response.response_metadata["provider"] == fast
+    assert time.perf_counter() - started < 1.0
+
+
+def test_failover_and_circuit_breaker():
+    down, backup = _names("down", "backup")
+    failing = FailingModel()
+    model = RoutedChatModel(providers=[down, backup], cache=False, hedging=False, models={
+        down: failing, backup: FakeToolCallingModel(answer="backup"),
+    })
+    for _ in range(3):
+        assert model.invoke([HumanMessage(content="hi")]).content == "backup"
+    assert failing.calls == 3
+    assert provider_health(down).state == "open"
+    model.invoke([HumanMessage(content="hi")]) # Skips the open provider
+    assert failing.calls == 3
+
+
+def test_bind_tools_reaches_the_members():
+    primary, = _names("primary")
+    model = RoutedChatModel(providers=[primary], cache=False, models={
+        primary: FakeToolCallingModel(steps=[[("lookup", {"term": "x"})]]),
+    })
+    response = model.bind_tools([lookup]).invoke([HumanMessage(content="look up x")])
+    assert response.tool_calls[0]["name"] == "lookup"
+    assert response.tool_calls[0]["args"] == {"term": "x"}
+
+
+def test_async_hedge_cancels_the_slower_provider():
+    slow, fast = _names("slow", "fast")
+    provider_health(slow).latencies.extend([0.05] * 20)
+    slow_model = CancellableModel(answer="slow", latency=2.0)
+    model = RoutedChatModel(providers=[slow, fast], cache=False, hedging=True, models={
+        slow: slow_model, fast: FakeToolCallingModel(answer="fast", latency=0.05),
+    })
+
+    async def run():
+        started = time.perf_counter()
+        response = await model.ainvoke([HumanMessage(content="hi")])
+        await asyncio.sleep(0) # Let the cancelled task unwind
+        return response, time.perf_counter() - started
+
+    response, seconds = asyncio.run(run())
+    assert response.content == "fast"
+    assert seconds < 1.0
+    assert slow_model.cancelled
+
+
+def test_metrics_report_the_winning_model():
+    primary, = _names("primary")
+    model = RoutedChatModel(providers=[primary], cache=False, models={primary: ChunkedModel(answer="one two three")})
+    metrics = TurnMetrics("Routed")
+    response = model.invoke([HumanMessage(content="hi")], config={"callbacks": [metrics],
+                                                                  "metadata": {"langgraph_node": "agent"}})
+    assert response.content == "one two three "
+    assert response.response_metadata["provider"] == primary # Once, not once per chunk
+    assert metrics.llm_calls[0]["model"] == "chunked-1"
+
+
+def test_empty_stream_fails_over():
+    empty, backup = _names("empty", "backup")
+    model = RoutedChatModel(providers=[empty, backup], cache=False, models={
+        empty: EmptyModel(), backup: FakeToolCallingModel(answer="backup"),
+    })
+    response = model.invoke([HumanMessage(content="hi")])
+    assert response.content == "backup"
+    assert response.response_metadata["provider"] == backup
+    assert provider_health(empty).failures == 1
+    assert asyncio.run(model.ainvoke([HumanMessage(content="hi")])).content == "backup"
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from tests.fakes import FakeToolCallingModel, StubServices, isolate_state
+
+import lang_graph
+import llm
+import loadgen
+
+
+@pytest.fixture
+def trace(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(4):
+            f.write(json.dumps({"query": f"Weather in town {i % 2}?", "session": f"s{i % 2}"}) + "\n")
+    return str(path)
+
+
+def _use_model(monkeypatch, model):
+    key = ("DeepSeek", 0.25, 8192)
+    monkeypatch.setitem(llm._clients, key, model)
+    monkeypatch.setitem(lang_graph._agent_graphs, "DeepSeek", lang_graph.build_agent_graph(model))
+    # install() wraps the shared tool node; restore it afterwards
+    monkeypatch.setattr(lang_graph.tool_node, "tools_by_name", dict(lang_graph.tool_node.tools_by_name))
+
+
+def test_record_then_replay_offline(monkeypatch, tmp_path, trace, capsys):
+    isolate_state(monkeypatch, tmp_path)
+    cassette = str(tmp_path / "cassette.sqlite")
+    steps = [[("weather_tool", {"location": "Rolla, MO"})]]
+
+    services = StubServices().start()
+    try:
+        services.patch_endpoints(monkeypatch)
+        _use_model(monkeypatch, FakeToolCallingModel(steps=steps))
+        assert loadgen.main(["--trace", trace, "--record", cassette, "--concurrency", "2"]) == 0
+    finally:
+        services.stop()
+    recorded_hits = dict(services.hits)
+
+    class Unreachable(FakeToolCallingModel):
+        def _generate(self, *args, **kwargs):
+            raise AssertionError("the model was called during replay")
+
+    _use_model(monkeypatch, Unreachable(steps=steps))
+    report_path = tmp_path / "report.json"
+    assert loadgen.main(["--trace", trace, "--replay", cassette, "--concurrency", "3", "--requests", "12",
+                         "--latency-scale", "0", "--report-json", str(report_path)]) == 0
+
+    report = json.loads(report_path.read_text())
+    assert report["completed"] == 12 and not report["errors"]
+    assert report["tools"]["weather_tool"]["calls"] == 12
+    assert services.hits == recorded_hits # Replay sent no HTTP requests
+    assert "throughput" in capsys.readouterr().out
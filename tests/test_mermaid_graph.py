@@ -0,0 +1,22 @@
+from mermaid_graph import cached_mermaid, tool_entries_digest
+
+
+def _entries(wall_seconds: float) -> list:
+    return [
+        {"name": "call_model", "tool_input": "2 messages in context", "tool_output": "",
+         "metrics": {"wall_seconds": wall_seconds, "input_tokens": 120, "output_tokens": 12}},
+        {"name": "weather_tool", "tool_input": "{'location': 'Rolla, MO'}", "tool_output": "Tonight: Clear, 54°F",
+         "metrics": {"wall_seconds": wall_seconds / 2, "retries": 0}, "payload_ref": f"ref{wall_seconds}"},
+    ]
+
+
+def test_turns_with_the_same_tool_chain_share_a_diagram():
+    first, second = _entries(1.2), _entries(3.4)
+    assert tool_entries_digest(first) == tool_entries_digest(second)
+    digest, mermaid_code = cached_mermaid(first)
+    assert cached_mermaid(second, digest) == (digest, mermaid_code)
+    assert "Clear" in mermaid_code and "Cost" not in mermaid_code
+
+    other = _entries(1.2)
+    other[1]["tool_output"] = "Tonight: Rain, 48°F"
+    assert tool_entries_digest(other) != digest
@@ -0,0 +1,66 @@
+import time
+import uuid
+
+from tests.fakes import FakeToolCallingModel, StubServices, isolate_state
+
+import lang_graph
+import metrics
+
+
+def test_turn_metrics_in_tool_entries_and_endpoint(monkeypatch, tmp_path):
+    import chat_service
+    isolate_state(monkeypatch, tmp_path)
+    steps = [[("weather_tool", {"location": "Rolla, MO"}), ("tavily_search_results_json", {"query": "Rolla events"})]]
+    monkeypatch.setitem(lang_graph._agent_graphs, "Fake", lang_graph.build_agent_graph(FakeToolCallingModel(steps=steps)))
+    monkeypatch.setattr(metrics, "registry", metrics.MetricsRegistry())
+    monkeypatch.setattr(lang_graph, "prefetcher", None) # Only the calls the model makes
+
+    services = StubServices().start()
+    try:
+        services.patch_endpoints(monkeypatch)
+        entry = chat_service.chat_fn("Weather and events in Rolla?", "Fake", uuid.uuid4().hex)
+    finally:
+        services.stop()
+
+    names = [step["name"] for step in entry["tool_entries"]]
+    assert names == ["tool_determination_router", "call_model", "weather_tool", "tavily_search_results_json", "call_model"]
+    assert sorted(entry["used_tools"]) == ["tavily_search_results_json", "weather_tool"]
+    for step in entry["tool_entries"][1:]:
+        assert step["metrics"]["wall_seconds"] > 0
+        assert "input_tokens" in step["metrics"] and "output_tokens" in step["metrics"]
+    weather = entry["tool_entries"][2]["metrics"]
+    assert weather["retries"] == 0 and weather["output_tokens"] > 0 and weather["queue_seconds"] >= 0
+    assert entry["tool_entries"][4]["tool_input"] == "4 messages in context"
+    assert entry["metrics"]["llm_calls"] == 2 and set(entry["metrics"]["node_seconds"]) == {"router", "agent", "action", "compact"}
+    assert "ms" in metrics.format_step_cost(weather)
+
+    text = metrics.render_prometheus()
+    assert 'agent_tool_calls_total{status="ok",tool="weather_tool"} 1.0' in text
+    assert 'agent_node_seconds_count{node="agent"} 2' in text
+
+
+def test_label_values_are_escaped():
+    registry = metrics.MetricsRegistry()
+    registry.inc("agent_tool_calls_total", "Tool calls.", tool='say "hi"\\now\n')
+    assert 'agent_tool_calls_total{tool="say \\"hi\\"\\\\now\\n"} 1.0' in registry.render()
+
+
+def test_http_metrics_have_help_and_type(monkeypatch):
+    import tools.http_client
+    monkeypatch.setattr(tools.http_client, "http_metrics",
+                        lambda: {"api.weather.gov": {"requests": 3, "errors": 0, "retries": 1, "p95_seconds": 0.2}})
+    text = metrics.render_prometheus()
+    for name in ("tool_http_requests_total", "tool_http_p95_seconds"):
+        assert f"# HELP {name} " in text and f"# TYPE {name} " in text
+    assert 'tool_http_p95_seconds{host="api.weather.gov"} 0.2' in text
+
+
+def test_prefetched_tool_is_queued_from_its_submission():
+    turn = metrics.TurnMetrics()
+    node_run, tool_run = uuid.uuid4(), uuid.uuid4()
+    metadata = {"langgraph_checkpoint_ns": "router:1"}
+    turn.on_chain_start({}, {}, run_id=node_run, metadata=metadata)
+    time.sleep(0.2) # The rest of the router node, before the speculative call is submitted
+    submitted = {**metadata, "tool_submitted_at": time.perf_counter()}
+    turn.on_tool_start({}, "Rolla, MO", run_id=tool_run, parent_run_id=node_run, metadata=submitted)
+    assert turn._tool_runs[tool_run]["queue_seconds"] < 0.1
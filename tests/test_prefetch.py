@@ -0,0 +1,34 @@
+from tests.fakes import run_turn # noqa: F401 (fixture)
+
+import lang_graph
+from prefetch import candidate_calls
+
+
+def test_candidate_calls():
+    assert candidate_calls("weather in Rolla, MO tonight") == [("weather_tool", {"location": "Rolla, MO"})]
+    assert candidate_calls("Will it rain in St. Louis? Also define entropy.") == [
+        ("weather_tool", {"location": "St. Louis"}), ("define_tool", {"term": "entropy"})]
+    assert candidate_calls("How is the weather there?") == []
+
+
+def test_matching_call_takes_over_the_prefetched_result(run_turn):
+    run, services = run_turn
+    services.latency = 0.05 # The prefetch has to overlap the LLM call
+    hits_before = lang_graph.prefetcher.stats["hits"]
+    entry = run("Weather in Rolla, MO tonight and any events?", [[("weather_tool", {"location": "Rolla, MO"})]],
+                latency=0.2)
+    weather = next(step for step in entry["tool_entries"] if step["name"] == "weather_tool")
+    assert weather["metrics"]["prefetched"] and weather["metrics"]["wall_seconds"] > 0
+    assert "Clear" in str(weather["tool_output"])
+    assert entry["metrics"]["prefetch"] == {"started": 1, "hits": 1, "wasted": 0}
+    assert services.hits["nominatim"] == 1 # The tool ran once, during the LLM call
+    assert lang_graph.prefetcher.stats["hits"] == hits_before + 1
+
+
+def test_unused_prefetch_is_counted_as_wasted(run_turn):
+    run, services = run_turn
+    services.latency = 0.05 # The prefetch has to overlap the LLM call
+    entry = run("Weather in Rolla, MO tonight and any events?", [[("tavily_search_tool", {"query": "Rolla events"})]],
+                latency=0.2)
+    assert entry["metrics"]["prefetch"] == {"started": 1, "hits": 0, "wasted": 1}
+    assert all(step["name"] != "weather_tool" for step in entry["tool_entries"])
@@ -0,0 +1,66 @@
+import json
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.tools import tool
+
+import tests.fakes # noqa: F401 (dummy API keys)
+from llm import get_llm
+from memory import trim_context
+from metrics import TurnMetrics
+
+
+@tool
+def lookup(term: str) -> str:
+    """Looks up a term."""
+    return term
+
+
+def _turn(i: int) -> list:
+    call = {"name": "lookup", "args": {"term": f"t{i}"}, "id": f"call_{i}", "type": "tool_call"}
+    return [HumanMessage(content=f"question {i} " * 40), AIMessage(content="", tool_calls=[call]),
+            ToolMessage(content=f"result {i} " * 60, tool_call_id=f"call_{i}"), AIMessage(content=f"answer {i} " * 30)]
+
+
+def _breakpoints(payload: dict) -> list:
+    marks = [("tools", i) for i, t in enumerate(payload.get("tools") or []) if "cache_control" in t]
+    for i, message in enumerate(payload["messages"]):
+        if isinstance(message["content"], list):
+            marks += [("messages", i) for block in message["content"] if "cache_control" in block]
+    return marks
+
+
+def test_claude_requests_carry_breakpoints_on_the_stable_prefix():
+    model = get_llm("Claude").bind_tools([lookup])
+    messages = _turn(1) + _turn(2)[:3] # Second turn: the tool result came back, the LLM is called again
+    payload = model.bound._get_request_payload(messages, **model.kwargs)
+    # The tools, the history before the current turn (ends at index 3) and the whole prompt
+    assert _breakpoints(payload) == [("tools", 0), ("messages", 3), ("messages", 6)]
+
+
+def test_trimmed_history_keeps_its_prefix_for_several_turns():
+    thread, prefixes = [], []
+    for i in range(40):
+        thread += _turn(i)
+        kept = trim_context(thread[:-1], max_tokens=2000, step_tokens=1000)
+        assert isinstance(kept[0], HumanMessage)
+        prefixes.append(kept[0].content)
+    changes = sum(1 for a, b in zip(prefixes, prefixes[1:]) if a != b)
+    assert changes <= 15 # A one-turn sliding window would change the prefix on almost every turn
+
+
+def test_prompt_cache_tokens_in_turn_metrics():
+    metrics = TurnMetrics("Claude")
+    run_id = uuid.uuid4()
+    metrics.on_chat_model_start({}, [[HumanMessage(content="hi")]], run_id=run_id, metadata={"langgraph_node": "agent"})
+    message = AIMessage(content="ok", usage_metadata={
+        "input_tokens": 1200, "output_tokens": 10, "total_tokens": 1210,
+        "input_token_details": {"cache_read": 1000, "cache_creation": 150},
+    })
+    metrics.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]), run_id=run_id)
+    summary = metrics.summary()
+    assert summary["prompt_cache_read_tokens"] == 1000
+    assert summary["prompt_cache_creation_tokens"] == 150
+    assert metrics.llm_calls[0]["prompt_cache_read_tokens"] == 1000
+    json.dumps(summary) # Reported with the turn's entry
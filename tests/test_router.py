@@ -0,0 +1,53 @@
+import uuid
+
+from tests.fakes import FakeToolCallingModel, StubServices, isolate_state
+
+import lang_graph
+from router import ToolRouter
+
+
+class CountingModel(FakeToolCallingModel):
+    calls: list = []
+    bound: list = []
+
+    def bind_tools(self, tools, **kwargs):
+        self.bound.append(sorted(t.name for t in tools))
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(len(messages))
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+def test_router_decisions():
+    router = ToolRouter(lang_graph.available_tools)
+    define = router.route("Define photosynthesis")
+    assert define["method"] == "pattern" and define["tool_call"]["args"] == {"term": "photosynthesis"}
+    assert router.route("What's the weather in Rolla, MO?")["tool_call"]["args"] == {"location": "Rolla, MO"}
+    # Several places, or a reference to the conversation, are left to the LLM
+    several = router.route("weather in Rolla and Chicago")
+    assert several["tool_call"] is None and "weather_batch_tool" in several["selected_tools"]
+    assert router.route("define it")["tool_call"] is None
+    assert router.route("tell me a joke")["method"] == "all_tools"
+
+
+def test_obvious_query_skips_the_tool_calling_llm_step(monkeypatch, tmp_path):
+    import chat_service
+    isolate_state(monkeypatch, tmp_path)
+    model = CountingModel(calls=[], bound=[])
+    monkeypatch.setitem(lang_graph._agent_graphs, "Fake", lang_graph.build_agent_graph(model))
+    services = StubServices().start()
+    try:
+        services.patch_endpoints(monkeypatch)
+        entry = chat_service.chat_fn("What's the weather in Rolla, MO?", "Fake", uuid.uuid4().hex)
+    finally:
+        services.stop()
+
+    router_step, weather_step, answer_step = entry["tool_entries"]
+    assert router_step["name"] == "tool_determination_router" and router_step["router_method"] == "pattern"
+    assert router_step["confidence"] >= router_step["threshold"]
+    assert weather_step["name"] == "weather_tool" and weather_step["tool_input"] == {"location": "Rolla, MO"}
+    assert answer_step["name"] == "call_model"
+    assert len(model.calls) == 1 # Only the answer was generated by the LLM
+    assert model.bound[-1] == sorted(router_step["selected_tools_list"]) # Bound to the routed tools only
+    assert entry["used_tools"] == ["weather_tool"]
@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+from langchain_core.runnables import RunnableLambda
+
+from tests.fakes import isolate_state
+import tools.search_backend as search_backend
+
+
+RESPONSE = {
+    "query": "rolla events",
+    "results": [
+        {"title": "Events in Rolla", "url": "https://example.com/a", "content": "Farmers market.", "score": 0.9,
+         "raw_content": "Full page. " * 100},
+        {"title": "Events in Rolla (mirror)", "url": "https://example.com/a", "content": "Farmers market."},
+        {"title": "Rolla calendar", "url": "https://example.com/b", "content": "Concert on Friday.", "score": 0.8},
+        {"title": "Things to do", "url": "https://example.com/c", "content": "", "score": 0.7},
+    ],
+    "images": ["https://example.com/a.png"],
+    "follow_up_questions": None,
+}
+
+
+def _stub_http(monkeypatch) -> list:
+    requests = []
+
+    def post_json(url, payload, headers=None, timeout=None):
+        requests.append(payload)
+        return RESPONSE
+
+    async def apost_json(url, payload, headers=None, timeout=None):
+        return post_json(url, payload, headers, timeout)
+
+    monkeypatch.setattr(search_backend, "post_json", post_json)
+    monkeypatch.setattr(search_backend, "apost_json", apost_json)
+    return requests
+
+
+def test_results_are_compacted_and_cached_per_normalized_query(monkeypatch, tmp_path):
+    isolate_state(monkeypatch, tmp_path)
+    requests = _stub_http(monkeypatch)
+    output = json.loads(search_backend.search("Rolla  events?", top_n=5))
+    assert output["results"] == [
+        {"title": "Events in Rolla", "url": "https://example.com/a", "content": "Farmers market."},
+        {"title": "Rolla calendar", "url": "https://example.com/b", "content": "Concert on Friday."},
+        {"title": "Things to do", "url": "https://example.com/c"},
+    ]
+    assert len(json.loads(search_backend.search("rolla events", top_n=1))["results"]) == 1
+    assert len(json.loads(asyncio.run(search_backend.asearch("ROLLA EVENTS", top_n=2)))["results"]) == 2
+    assert len(requests) == 1
+
+
+def test_a_url_is_returned_once_per_turn(monkeypatch, tmp_path):
+    isolate_state(monkeypatch, tmp_path)
+    _stub_http(monkeypatch)
+    search = RunnableLambda(lambda query: json.loads(search_backend.search(query, top_n=2)))
+    first = search.invoke("rolla events", config={"metadata": {"turn_id": "turn-1"}})
+    second = search.invoke("rolla events", config={"metadata": {"turn_id": "turn-1"}})
+    assert [r["url"] for r in first["results"]] == ["https://example.com/a", "https://example.com/b"]
+    assert [r["url"] for r in second["results"]] == ["https://example.com/c"]
+    assert second["omitted"].startswith("2 result(s)")
+    other_turn = search.invoke("rolla events", config={"metadata": {"turn_id": "turn-2"}})
+    assert [r["url"] for r in other_turn["results"]] == ["https://example.com/a", "https://example.com/b"]
@@ -0,0 +1,56 @@
+import asyncio
+import json
+import threading
+
+from starlette.testclient import TestClient
+
+from server import create_app
+
+
+async def _fake_turn(message, llm_name, session_id):
+    # Stands in for chat_service.astream_chat_fn
+    if message == "slow":
+        await asyncio.sleep(0.5)
+    if message == "fail":
+        raise ValueError("boom")
+    yield {"type": "token", "content": f"echo {message}"}
+    yield {"type": "final", "entry": {"query": message, "parsed": f"echo {message}", "tool_entries": [],
+                                      "session_id": session_id}}
+
+
+def test_json_and_sse_endpoints():
+    with TestClient(create_app(workers=2, queue_size=4, stream_fn=_fake_turn)) as client:
+        response = client.post("/chat", json={"message": "hi", "session_id": "s1"})
+        assert response.status_code == 200
+        assert response.json()["parsed"] == "echo hi"
+
+        with client.stream("POST", "/chat/stream", json={"message": "hello", "session_id": "s1"}) as response:
+            events = [json.loads(line[len("data: "):]) for line in response.iter_lines() if line.startswith("data: ")]
+        assert [e["type"] for e in events] == ["token", "final"]
+
+        assert client.post("/chat", json={"message": "fail"}).status_code == 500
+        assert client.post("/chat", json={"message": ""}).status_code == 400
+        assert client.get("/healthz").json()["running"] == 0
+
+
+def test_backpressure_and_session_isolation():
+    with TestClient(create_app(workers=1, queue_size=1, stream_fn=_fake_turn)) as client:
+        statuses = {}
+
+        def post(session_id):
+            statuses[session_id] = client.post("/chat", json={"message": "slow", "session_id": session_id}).status_code
+
+        threads = [threading.Thread(target=post, args=(f"s{i}",)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+            thread.join(0.1) # One running, one queued, the third finds the queue full
+        for thread in threads:
+            thread.join()
+        assert sorted(statuses.values()) == [200, 200, 429]
+
+        thread = threading.Thread(target=post, args=("same",))
+        thread.start()
+        thread.join(0.1)
+        assert client.post("/chat", json={"message": "hi", "session_id": "same"}).status_code == 409
+        thread.join()
+        assert statuses["same"] == 200
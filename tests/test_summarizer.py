@@ -0,0 +1,79 @@
+import os
+import random
+import subprocess
+import sys
+import time
+
+from tools.extractive_summary import split_sentences, summarize
+
+
+ARTICLE = (
+    "The city council approved the new transit budget on Monday. "
+    "The transit budget adds bus routes and extends light rail service to the airport. "
+    "Council members debated the transit budget for three hours before the vote. "
+    "A local bakery celebrated its tenth anniversary with free cookies. "
+    "Supporters said the expanded transit service will cut commute times across the city. "
+    "The weather was mild and sunny for most of the week."
+)
+
+
+def test_split_sentences_keeps_order_and_line_breaks():
+    sentences = [s for _, s in split_sentences("First one. Second one!\nA heading\nThird one?")]
+    assert sentences == ["First one.", "Second one!", "A heading", "Third one?"]
+
+
+def test_summary_picks_central_sentences_in_document_order():
+    summary = summarize(ARTICLE, max_words=30)
+    assert len(summary.split()) <= 30
+    assert "transit budget" in summary
+    assert "bakery" not in summary and "weather" not in summary
+    positions = [ARTICLE.index(s.strip()) for s in summary.split(". ") if s.strip()]
+    assert positions == sorted(positions)
+
+
+def test_long_sentence_is_cut_to_max_words():
+    summary = summarize("word " * 500, max_words=20)
+    assert summary.endswith("...")
+    assert len(summary.split()) == 20
+
+
+def test_megabyte_input_is_fast():
+    rng = random.Random(0)
+    vocabulary = [f"term{i}" for i in range(3000)]
+    text = " ".join(
+        " ".join(rng.choice(vocabulary) for _ in range(rng.randint(8, 25))) + "."
+        for _ in range(20000)
+    )
+    assert len(text) > 2_000_000
+    started = time.perf_counter()
+    summary = summarize(text, max_words=150)
+    assert time.perf_counter() - started < 1.0
+    assert 0 < len(summary.split()) <= 150
+
+
+def test_repeated_sentences_are_one_candidate():
+    text = ARTICLE + " " + " ".join(["Subscribe to our newsletter for transit budget news."] * 5)
+    summary = summarize(text, max_words=60)
+    assert summary.count("Subscribe") <= 1
+
+
+def test_final_ranking_is_capped(monkeypatch):
+    import tools.extractive_summary as extractive_summary
+    sizes = []
+    textrank = extractive_summary.textrank
+    monkeypatch.setattr(extractive_summary, "CHUNK_SENTENCES", 10)
+    monkeypatch.setattr(extractive_summary, "MAX_CANDIDATES", 15)
+    monkeypatch.setattr(extractive_summary, "textrank", lambda sentences: sizes.append(len(sentences)) or textrank(sentences))
+    text = " ".join(f"Sentence number {i} talks about topic {i % 7}." for i in range(200))
+    assert summarize(text, max_words=1000)
+    assert max(sizes) <= 15
+
+
+def test_summary_is_the_same_in_every_process():
+    code = "from tests.test_summarizer import ARTICLE; from tools.extractive_summary import summarize; print(summarize(ARTICLE, 30))"
+    outputs = {
+        subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                       env={**os.environ, "PYTHONHASHSEED": seed}).stdout
+        for seed in ("1", "2", "3")
+    }
+    assert len(outputs) == 1
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+
+from tool_executor import ParallelToolNode
+
+
+@tool
+def sleepy_tool(seconds: float, label: str) -> str:
+    """Sleeps, then returns the label."""
+    time.sleep(seconds)
+    return label
+
+
+def _state(*calls):
+    tool_calls = [{"name": "sleepy_tool", "args": {"seconds": s, "label": label}, "id": f"call_{i}", "type": "tool_call"}
+                  for i, (s, label) in enumerate(calls)]
+    return {"messages": [AIMessage(content="", tool_calls=tool_calls)]}
+
+
+def test_results_keep_call_order_and_calls_overlap():
+    node = ParallelToolNode([sleepy_tool], max_workers=4, timeout=5)
+    started = time.perf_counter()
+    messages = node(_state((0.3, "slow"), (0.05, "fast"), (0.2, "medium")), {})["messages"]
+    elapsed = time.perf_counter() - started
+    assert [m.content for m in messages] == ["slow", "fast", "medium"]
+    assert [m.tool_call_id for m in messages] == ["call_0", "call_1", "call_2"]
+    assert elapsed < 0.5 # Sequential runs would take 0.55s
+
+
+def test_async_results_keep_call_order_and_calls_overlap():
+    node = ParallelToolNode([sleepy_tool], max_workers=4, timeout=5)
+    started = time.perf_counter()
+    messages = asyncio.run(node.acall(_state((0.3, "slow"), (0.05, "fast"), (0.2, "medium")), {}))["messages"]
+    assert [m.content for m in messages] == ["slow", "fast", "medium"]
+    assert time.perf_counter() - started < 0.5
+
+
+def test_timed_out_call_returns_an_error_message():
+    node = ParallelToolNode([sleepy_tool], max_workers=2, timeout=0.2)
+    messages = node(_state((1.0, "late"), (0.01, "quick")), {})["messages"]
+    assert messages[0].status == "error" and "timed out" in messages[0].content
+    assert messages[0].tool_call_id == "call_0"
+    assert messages[1].content == "quick"
@@ -0,0 +1,27 @@
+import tools
+
+
+def test_failed_tool_modules_are_scanned_again(monkeypatch, tmp_path):
+    weather_path = tools._source_files()["weather"]
+    monkeypatch.setattr(tools, "TOOL_MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(tools, "_source_files", lambda: {"weather": weather_path})
+    real_scan = tools._scan_module
+    scans = []
+
+    def scan(module_name):
+        scans.append(module_name)
+        if len(scans) == 1:
+            return [], "ModuleNotFoundError('templates')" # e.g. a dependency missing at the first start
+        return real_scan(module_name)
+
+    monkeypatch.setattr(tools, "_scan_module", scan)
+    first = tools._refresh_manifest()["modules"]["weather"]
+    assert first["tools"] == [] and first["error"]
+
+    second = tools._refresh_manifest()["modules"]["weather"] # Same source, but the failure isn't trusted
+    assert scans == ["weather", "weather"]
+    assert "error" not in second
+    assert "weather_tool" in [t["name"] for t in second["tools"]]
+
+    tools._refresh_manifest()
+    assert len(scans) == 2 # A successful scan is cached as before
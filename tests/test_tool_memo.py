@@ -0,0 +1,41 @@
+from tests.fakes import run_turn # noqa: F401 (fixture)
+
+
+def test_repeated_call_in_turn_is_answered_from_memo(run_turn):
+    run, services = run_turn
+    entry = run("How is Rolla looking?", [
+        [("weather_tool", {"location": "Rolla, MO"}), ("weather_tool", {"location": "Rolla, MO"})],
+        [("tavily_search_tool", {"query": "Rolla events"})],
+        [("weather_tool", {"location": " Rolla,  MO "}), ("tavily_search_tool", {"query": "Rolla events", "top_n": 2})],
+    ])
+    tools = [step for step in entry["tool_entries"] if step["name"] in entry["used_tools"]]
+    # The second search repeats the previous step (top_n=2 is the default), so it is dropped;
+    # the weather call repeats an earlier step and is answered from the memo
+    assert [step["name"] for step in tools] == ["weather_tool", "weather_tool", "tavily_search_tool", "weather_tool"]
+    assert [bool(step["metrics"].get("memo_hit")) for step in tools] == [False, True, False, True]
+    assert len({str(step["tool_output"]) for step in tools if step["name"] == "weather_tool"}) == 1
+    assert services.hits["nominatim"] == 1 and services.hits["tavily"] == 1
+
+
+def test_call_repeating_the_previous_step_is_suppressed(run_turn):
+    run, services = run_turn
+    entry = run("How is Rolla looking?",
+                [[("weather_tool", {"location": "Rolla, MO"})], [("weather_tool", {"location": "Rolla, MO"})]])
+    assert [step["name"] for step in entry["tool_entries"][1:]] == ["call_model", "weather_tool", "call_model"]
+    assert "previously retrieved" in entry["parsed"]
+    assert services.hits["nominatim"] == 1
+
+
+def test_memo_key_fills_defaults_of_pydantic_schemas():
+    from langchain_core.tools import tool
+    from tool_executor import ParallelToolNode
+
+    @tool
+    def lookup_tool(query: str, top_n: int = 2) -> str:
+        """Looks something up."""
+        return query
+
+    memo = ParallelToolNode([lookup_tool]).memo
+    call = {"name": "lookup_tool", "id": "a", "type": "tool_call"}
+    assert memo.key({**call, "args": {"query": "x"}}) == memo.key({**call, "args": {"query": " x ", "top_n": 2}})
+    assert memo.key({**call, "args": {"query": "x"}}) != memo.key({**call, "args": {"query": "x", "top_n": 3}})
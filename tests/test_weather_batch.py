@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from tests.fakes import StubServices, isolate_state
+from tools.weather import weather_batch_tool
+from tools.weather_cache import geocode_cache, point_key, points_cache
+
+
+@pytest.fixture
+def services(monkeypatch, tmp_path):
+    isolate_state(monkeypatch, tmp_path)
+    services = StubServices().start()
+    services.patch_endpoints(monkeypatch)
+    # Two spellings of one town geocode to the same coordinates; a neighbouring town has other
+    # coordinates on the same NWS grid point
+    geocode_cache().set("rolla, mo", (37.9514, -91.7713))
+    geocode_cache().set("rolla, missouri", (37.9514, -91.7713))
+    geocode_cache().set("st. james, mo", (37.9973, -91.6143))
+    grid_forecast = f"{services.url}/nws/gridpoints/LSX/70,40/forecast"
+    points_cache().set(point_key(37.9514, -91.7713), grid_forecast)
+    points_cache().set(point_key(37.9973, -91.6143), grid_forecast)
+    yield services
+    services.stop()
+
+
+LOCATIONS = ["Rolla, MO", "Rolla, Missouri", "St. James, MO", "Rolla, MO", "Salem, MO"]
+
+
+def _check(result: str, services):
+    lines = result.splitlines()
+    assert [line.split(":")[0] for line in lines] == ["Rolla, MO", "Rolla, Missouri", "St. James, MO", "Salem, MO"]
+    assert all("Clear" in line for line in lines)
+    # Salem is the only new coordinate; the four other locations share one forecast
+    assert services.hits == {"nominatim": 1, "nws_points": 1, "nws_forecast": 2}
+
+
+def test_batch_shares_coordinates_and_grid_points(services):
+    _check(weather_batch_tool.invoke({"locations": LOCATIONS}), services)
+
+
+def test_async_batch_shares_coordinates_and_grid_points(services):
+    _check(asyncio.run(weather_batch_tool.ainvoke({"locations": LOCATIONS})), services)
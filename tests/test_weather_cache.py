@@ -0,0 +1,54 @@
+import email.utils
+import time
+
+from cache_store import TieredCache
+from tests.fakes import StubServices, isolate_state
+from tools.http_client import cache_ttl_from_headers
+from tools.weather import weather_tool
+from tools.weather_cache import forecast_cache, normalize_location
+
+
+def test_ttl_from_cache_headers():
+    assert cache_ttl_from_headers({"Cache-Control": "public, max-age=600"}, 60) == 600
+    assert cache_ttl_from_headers({"Cache-Control": "no-store"}, 60) == 0
+    expires = email.utils.formatdate(time.time() + 300, usegmt=True)
+    assert 290 <= cache_ttl_from_headers({"Expires": expires}, 60) <= 300
+    assert cache_ttl_from_headers({"Expires": "not a date"}, 60) == 60
+    assert cache_ttl_from_headers({}, 60) == 60
+
+
+def test_entries_expire_in_both_tiers(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite")
+    cache = TieredCache("weather_forecast", ttl=60, db_path=db_path)
+    cache.set("short", "value", ttl=0.2)
+    cache.set("long", "value")
+    assert TieredCache("weather_forecast", ttl=60, db_path=db_path).get("short") == "value" # From disk
+    time.sleep(0.3)
+    assert cache.get("short") is None
+    assert TieredCache("weather_forecast", ttl=60, db_path=db_path).get("short") is None
+    assert cache.get("long") == "value"
+
+
+def _run(monkeypatch, tmp_path, cache_control: str, locations) -> dict:
+    isolate_state(monkeypatch, tmp_path)
+    services = StubServices(forecast_cache_control=cache_control).start()
+    try:
+        services.patch_endpoints(monkeypatch)
+        for location in locations:
+            assert "Clear" in weather_tool.invoke({"location": location})
+    finally:
+        services.stop()
+    return services.hits
+
+
+def test_forecast_expiry_follows_the_nws_headers(monkeypatch, tmp_path):
+    hits = _run(monkeypatch, tmp_path, "public, max-age=600", ["Rolla, MO", " rolla ,  mo."])
+    assert hits == {"nominatim": 1, "nws_points": 1, "nws_forecast": 1}
+    assert normalize_location(" rolla ,  mo.") == "rolla, mo"
+    (expires_at, _), = forecast_cache()._memory.values()
+    assert 590 <= expires_at - time.time() <= 600
+
+
+def test_uncacheable_forecast_is_fetched_again(monkeypatch, tmp_path):
+    hits = _run(monkeypatch, tmp_path, "no-store", ["Rolla, MO", "Rolla, MO"])
+    assert hits == {"nominatim": 1, "nws_points": 1, "nws_forecast": 2}
@@ -0,0 +1,294 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from typing import Optional, Sequence
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+
+from config import TOOL_MAX_WORKERS, TOOL_TIMEOUT_SECONDS, TOOL_MEMO_EXCLUDED_TOOLS, TOOL_MEMO_MAX_TURNS
+from tools.http_client import count_retries
+
+logger = logging.getLogger(__name__)
+
+
+def _with_retries(msg, retries: int):
+    # HTTP retries made by the tool, shown in the tool's log entry
+    if isinstance(msg, ToolMessage):
+        msg.response_metadata["http_retries"] = retries
+    return msg
+
+
+def _canonical(value):
+    # Insignificant whitespace in string args doesn't change a tool's result
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def _arg_defaults(tool) -> dict:
+    # Defaults from the tool's JSON schema: a dict for manifest (LazyTool) schemas, a pydantic model otherwise
+    try:
+        schema = tool.tool_call_schema
+        if not isinstance(schema, dict):
+            schema = schema.model_json_schema()
+    except Exception: # Tools without a usable schema just get no defaults filled in
+        return {}
+    return {name: spec["default"] for name, spec in schema.get("properties", {}).items() if "default" in spec}
+
+
+class _TurnMemo:
+    def __init__(self):
+        self.results = {} # (tool name, canonical args) -> output content
+        self.call_keys = {} # tool_call_id -> (tool name, canonical args), filled as calls finish
+        self.prefetched = {} # key -> (Future, tool_call_id) of speculative calls not claimed yet, see prefetch.py
+        self.prefetch_started = 0
+
+
+class ToolResultMemo:
+    """
+    Per-turn memo of tool results keyed by (tool name, canonical args).
+
+    A tool call repeated within one agent turn (metadata "turn_id" of the run config) is
+    answered from the memo instead of running the tool again. Errors are not memoized, and
+    tools in TOOL_MEMO_EXCLUDED_TOOLS (non-deterministic ones) always run.
+    """
+
+    def __init__(self, tool_node: "ParallelToolNode", max_turns: int = TOOL_MEMO_MAX_TURNS):
+        self.tool_node = tool_node # Its tools_by_name may be swapped, e.g. by loadgen's recording wrappers
+        self.max_turns = max_turns
+        self._turns = OrderedDict() # turn_id -> _TurnMemo
+        self._defaults = {} # tool name -> (tool, its argument defaults)
+        self._lock = threading.Lock()
+
+    def key(self, tool_call: dict) -> Optional[tuple]:
+        """
+        Returns the memo key of a tool call, or None if its results must not be reused.
+        """
+        name = tool_call["name"]
+        tool = self.tool_node.tools_by_name.get(name)
+        if tool is None or name in TOOL_MEMO_EXCLUDED_TOOLS:
+            return None
+        # Omitted args with a default are the same call as passing the default explicitly
+        args = {**self._arg_defaults(name, tool), **(tool_call.get("args") or {})}
+        return name, json.dumps(_canonical(args), sort_keys=True, default=str, separators=(",", ":"))
+
+    def _arg_defaults(self, name: str, tool) -> dict:
+        cached = self._defaults.get(name)
+        if cached is None or cached[0] is not tool: # Built once per tool object; the tool may be swapped
+            cached = self._defaults[name] = (tool, _arg_defaults(tool))
+        return cached[1]
+
+    def turn(self, config: RunnableConfig) -> Optional[_TurnMemo]:
+        turn_id = (config or {}).get("metadata", {}).get("turn_id")
+        if turn_id is None:
+            return None
+        with self._lock:
+            memo = self._turns.get(turn_id)
+            if memo is None:
+                memo = self._turns[turn_id] = _TurnMemo()
+                while len(self._turns) > self.max_turns:
+                    self._turns.popitem(last=False)
+            else:
+                self._turns.move_to_end(turn_id)
+            return memo
+
+    def get(self, turn_id: str) -> Optional[_TurnMemo]:
+        with self._lock:
+            return self._turns.get(turn_id)
+
+    def add_prefetched(self, memo: _TurnMemo, key: tuple, future, tool_call_id: str) -> bool:
+        with self._lock:
+            if key in memo.results or key in memo.prefetched:
+                return False
+            memo.prefetched[key] = (future, tool_call_id)
+            memo.prefetch_started += 1
+            return True
+
+    def claim_prefetched(self, memo: Optional[_TurnMemo], key: Optional[tuple]):
+        # The (Future, tool_call_id) of a speculative call with this key, at most once
+        if memo is None or key is None:
+            return None
+        with self._lock:
+            return memo.prefetched.pop(key, None)
+
+    def take_prefetched(self, memo: _TurnMemo):
+        # (number started, unclaimed {key: (Future, tool_call_id)}), resetting both
+        with self._lock:
+            started, unclaimed = memo.prefetch_started, memo.prefetched
+            memo.prefetch_started, memo.prefetched = 0, {}
+        return started, unclaimed
+
+    def keys_for(self, config: RunnableConfig, tool_call_ids) -> set:
+        """
+        Memo keys of tool calls already answered in this turn, looked up by tool_call_id.
+        """
+        memo = self.turn(config)
+        if memo is None:
+            return set()
+        with self._lock:
+            return {memo.call_keys[i] for i in tool_call_ids if i in memo.call_keys}
+
+    def plan(self, memo: Optional[_TurnMemo], tool_calls: list):
+        """
+        Splits the tool calls of one step into memo hits and calls to run.
+        Returns (keys, hits, to_run): hits maps an index in tool_calls to its answer,
+        to_run maps an index to the index of the first identical call in this step.
+        """
+        keys = [self.key(tc) for tc in tool_calls]
+        hits, to_run, first_of = {}, {}, {}
+        for i, (tc, key) in enumerate(zip(tool_calls, keys)):
+            if key is not None and memo is not None and key in memo.results:
+                hits[i] = ToolMessage(content=memo.results[key], name=tc["name"], tool_call_id=tc["id"],
+                                      response_metadata={"memo_hit": True, "http_retries": 0})
+            elif key is not None:
+                to_run[i] = first_of.setdefault(key, i) # Identical calls in one step run once
+            else:
+                to_run[i] = i
+        return keys, hits, to_run
+
+    def record(self, memo: Optional[_TurnMemo], tool_calls: list, keys: list, results: list):
+        if memo is None:
+            return
+        with self._lock:
+            for tc, key, msg in zip(tool_calls, keys, results):
+                if key is None:
+                    continue
+                memo.call_keys[tc["id"]] = key
+                if getattr(msg, "status", "success") != "error" and key not in memo.results:
+                    memo.results[key] = msg.content
+
+
+def _answer(msg: ToolMessage, tool_call: dict) -> ToolMessage:
+    # Result of an identical call in the same step (or of a speculative call), addressed to this tool_call
+    if msg.tool_call_id == tool_call["id"]:
+        return msg
+    if msg.tool_call_id.startswith("prefetch_"):
+        flag = {"prefetched": True, "prefetch_call_id": msg.tool_call_id}
+    else:
+        flag = {"memo_hit": True}
+    return msg.model_copy(update={"tool_call_id": tool_call["id"], "response_metadata": {**msg.response_metadata, **flag}})
+
+
+class ParallelToolNode:
+    """
+    Graph node that executes every tool_call of the last AIMessage concurrently.
+
+    Replaces the prebuilt ToolNode for the "action" step: independent calls (e.g. weather
+    for two cities plus a web search) run on a shared thread pool, each call gets its own
+    timeout, and the resulting ToolMessages keep the order of the tool_calls.
+    """
+
+    def __init__(self, tools: Sequence, max_workers: int = TOOL_MAX_WORKERS, timeout: float = TOOL_TIMEOUT_SECONDS):
+        self.tools_by_name = {t.name: t for t in tools}
+        self.memo = ToolResultMemo(self)
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+
+    def _error_message(self, tool_call: dict, content: str) -> ToolMessage:
+        return ToolMessage(content=content, name=tool_call["name"], tool_call_id=tool_call["id"], status="error")
+
+    def _run_one(self, tool_call: dict, config: RunnableConfig) -> ToolMessage:
+        tool = self.tools_by_name.get(tool_call["name"])
+        if tool is None:
+            return self._error_message(tool_call, f"Error: {tool_call['name']} is not a valid tool, try one of {list(self.tools_by_name)}.")
+        with count_retries() as retries:
+            try:
+                # Passing a full tool_call makes the tool return a ToolMessage with the matching id
+                msg = tool.invoke({**tool_call, "type": "tool_call"}, config)
+            except Exception as e:
+                logger.warning(f"Tool {tool_call['name']} raised: {e}")
+                msg = self._error_message(tool_call, f"Error: {e!r}\n Please fix your mistakes.")
+        return _with_retries(msg, retries[0])
+
+    def _tool_calls(self, state: dict) -> list:
+        messages = state["messages"]
+        last_message = messages[-1] if messages else None
+        if not isinstance(last_message, AIMessage) or not last_message.tool_calls:
+            return []
+        return last_message.tool_calls
+
+    async def _arun_one(self, tool_call: dict, config: RunnableConfig, semaphore: asyncio.Semaphore) -> ToolMessage:
+        tool = self.tools_by_name.get(tool_call["name"])
+        if tool is None:
+            return self._run_one(tool_call, config) # Builds the invalid-tool error message
+        async with semaphore:
+            with count_retries() as retries:
+                try:
+                    msg = await asyncio.wait_for(tool.ainvoke({**tool_call, "type": "tool_call"}, config), self.timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Tool {tool_call['name']} timed out after {self.timeout}s")
+                    msg = self._error_message(tool_call, f"Error: {tool_call['name']} timed out after {self.timeout} seconds.")
+                except Exception as e:
+                    logger.warning(f"Tool {tool_call['name']} raised: {e}")
+                    msg = self._error_message(tool_call, f"Error: {e!r}\n Please fix your mistakes.")
+        return _with_retries(msg, retries[0])
+
+    async def _await_prefetched(self, tool_call: dict, future) -> ToolMessage:
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Tool {tool_call['name']} timed out after {self.timeout}s")
+            return self._error_message(tool_call, f"Error: {tool_call['name']} timed out after {self.timeout} seconds.")
+
+    async def acall(self, state: dict, config: RunnableConfig) -> dict:
+        """
+        Async version of __call__: tools run via ainvoke on the event loop, at most
+        max_workers at a time. Tools without a coroutine fall back to a worker thread.
+        """
+        tool_calls = self._tool_calls(state)
+        memo = self.memo.turn(config)
+        keys, hits, to_run = self.memo.plan(memo, tool_calls)
+        semaphore = asyncio.Semaphore(self.max_workers)
+        unique = sorted(set(to_run.values()))
+        runs = []
+        for i in unique:
+            prefetched = self.memo.claim_prefetched(memo, keys[i])
+            if prefetched is not None:
+                runs.append(self._await_prefetched(tool_calls[i], prefetched[0]))
+            else:
+                runs.append(self._arun_one(tool_calls[i], config, semaphore))
+        ran = dict(zip(unique, await asyncio.gather(*runs)))
+        results = [hits[i] if i in hits else _answer(ran[to_run[i]], tc) for i, tc in enumerate(tool_calls)]
+        self.memo.record(memo, tool_calls, keys, results)
+        return {"messages": results}
+
+    def submit(self, tool_call: dict, config: RunnableConfig):
+        # Each call runs in a copy of the current context so LangChain callbacks/config propagate
+        return self.executor.submit(contextvars.copy_context().run, self._run_one, tool_call, config)
+
+    def __call__(self, state: dict, config: RunnableConfig) -> dict:
+        tool_calls = self._tool_calls(state)
+        if not tool_calls:
+            return {"messages": []}
+
+        memo = self.memo.turn(config)
+        keys, hits, to_run = self.memo.plan(memo, tool_calls)
+        futures = {}
+        for i in sorted(set(to_run.values())):
+            # A speculative call already started with the same key is taken over as is
+            prefetched = self.memo.claim_prefetched(memo, keys[i])
+            futures[i] = prefetched[0] if prefetched is not None else self.submit(tool_calls[i], config)
+        deadline = time.monotonic() + self.timeout
+        ran = {}
+        for i, future in futures.items():
+            tc = tool_calls[i]
+            try:
+                ran[i] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                # The worker thread cannot be interrupted; its late result is simply dropped.
+                future.cancel()
+                logger.warning(f"Tool {tc['name']} timed out after {self.timeout}s")
+                ran[i] = self._error_message(tc, f"Error: {tc['name']} timed out after {self.timeout} seconds.")
+        results = [hits[i] if i in hits else _answer(ran[to_run[i]], tc) for i, tc in enumerate(tool_calls)]
+        self.memo.record(memo, tool_calls, keys, results)
+        return {"messages": results}
@@ -1,29 +1,177 @@
-import pkgutil
+import hashlib
 import importlib
 import inspect
+import json
+import logging
+import os
+import pkgutil
+import threading
+from typing import Any, Optional
 from langchain_core.tools import BaseTool # Import BaseTool for isinstance check
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from config import TOOL_MANIFEST_PATH
+
+# Tool discovery is manifest based: the name, description and JSON schema of every tool are
+# cached in a manifest, which is enough to bind the tools to an LLM. A tool's module is only
+# imported the first time that tool is executed. The manifest is rebuilt for a module when its
+# source changes (mtime/size first, then content hash), which is the only time discovery imports it.
+# Modules that failed to import are recorded with their error and scanned again on every start.
+
+logger = logging.getLogger(__name__)
 
 __all__ = []
-tool_box = {} # Initialize tool_box as a dictionary
+tool_box = {} # Initialize tool_box as a dictionary: python name -> LazyTool
+
+_PACKAGE_DIR = os.path.dirname(__file__)
+_MANIFEST_VERSION = 1
+
+
+class LazyTool(BaseTool):
+    """
+    Stand-in for a tool described by the manifest. It exposes the tool's name, description
+    and JSON schema for bind_tools, and imports the real tool on first execution.
+    """
+
+    module: str
+    attr: str
+    _tool: Optional[BaseTool] = None
+    _lock: Any = None
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self._lock = threading.Lock()
+
+    def load(self) -> BaseTool:
+        if self._tool is None:
+            with self._lock:
+                if self._tool is None:
+                    module = importlib.import_module(f"{__name__}.{self.module}")
+                    self._tool = getattr(module, self.attr)
+        return self._tool
+
+    # Delegate whole invocations so the real tool handles ToolCall inputs, callbacks and errors
+    def invoke(self, input, config=None, **kwargs):
+        return self.load().invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self.load().ainvoke(input, config, **kwargs)
+
+    def _run(self, *args, **kwargs):
+        return self.load()._run(*args, **kwargs)
+
 
+def _source_files() -> dict:
+    files = {}
+    for _, module_name, is_pkg in pkgutil.iter_modules(__path__):
+        if is_pkg:
+            continue
+        path = os.path.join(_PACKAGE_DIR, f"{module_name}.py")
+        if os.path.exists(path):
+            files[module_name] = path
+    return files
 
-for _, module_name, is_pkg in pkgutil.iter_modules(__path__):
-    if is_pkg:
-        continue
+
+def _file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _scan_module(module_name: str) -> tuple:
+    """
+    Imports one module and describes the tools it defines. Returns (tools, error), where error
+    is the repr of the import failure, or None.
+    """
     full_module_name = f"{__name__}.{module_name}"
     try:
         module = importlib.import_module(full_module_name)
-        for name, obj in inspect.getmembers(module):
-            # Check if the object is an instance of BaseTool (which @tool decorated functions become)
-            if isinstance(obj, BaseTool):
-                tool_lc_name = getattr(obj, 'name', 'N/A')
-                if name.endswith("_tool"): # Convention based on Python function/identifier name
-                    tool_desc_attr = getattr(obj, 'description', 'N/A')
-                    tool_args_schema_attr = getattr(obj, 'args_schema', None)
-                    args_schema_str = tool_args_schema_attr.schema() if tool_args_schema_attr else 'None'
-                    tool_box[name] = obj # Add to tool_box dictionary
-                    __all__.append(name)
-    except ImportError as e: # Catch ImportError specifically
-        pass
     except Exception as e:
+        logger.warning(f"Skipping tools module {full_module_name}: {e!r}")
+        return [], repr(e)
+    entries = []
+    for name, obj in inspect.getmembers(module):
+        # Check if the object is an instance of BaseTool (which @tool decorated functions become)
+        if isinstance(obj, BaseTool) and name.endswith("_tool"): # Convention based on Python function/identifier name
+            entries.append({
+                "attr": name,
+                "name": obj.name,
+                "description": obj.description,
+                "args_schema": convert_to_openai_tool(obj)["function"]["parameters"],
+            })
+    return entries, None
+
+
+def _load_manifest() -> dict:
+    try:
+        with open(TOOL_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == _MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
         pass
+    return {"version": _MANIFEST_VERSION, "modules": {}}
+
+
+def _refresh_manifest() -> dict:
+    manifest = _load_manifest()
+    cached_modules = manifest["modules"]
+    modules = {}
+    changed = False
+    for module_name, path in _source_files().items():
+        stat = os.stat(path)
+        cached = cached_modules.get(module_name)
+        if cached and cached.get("error"):
+            # A failed import may depend on more than the source (a missing package or env var):
+            # scan it again, and log the failure again, on every start until it imports
+            cached = None
+        if cached and cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            modules[module_name] = cached
+            continue
+        digest = _file_hash(path)
+        if cached and cached["sha256"] == digest:
+            # Touched but unchanged: keep the tools, remember the new mtime
+            modules[module_name] = {**cached, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        else:
+            logger.debug(f"Rebuilding tool manifest entry for {module_name}")
+            tools, error = _scan_module(module_name)
+            modules[module_name] = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha256": digest,
+                "tools": tools,
+            }
+            if error:
+                modules[module_name]["error"] = error
+        changed = True
+    if set(cached_modules) != set(modules):
+        changed = True
+
+    manifest = {"version": _MANIFEST_VERSION, "modules": modules}
+    if changed:
+        try:
+            tmp_path = f"{TOOL_MANIFEST_PATH}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, TOOL_MANIFEST_PATH)
+        except OSError as e:
+            logger.warning(f"Could not write tool manifest {TOOL_MANIFEST_PATH}: {e}")
+    return manifest
+
+
+def get_tool(name: str) -> BaseTool:
+    """
+    Returns the real (imported) tool registered under its python name.
+    """
+    return tool_box[name].load()
+
+
+for module_name, module_entry in sorted(_refresh_manifest()["modules"].items()):
+    for entry in module_entry["tools"]:
+        tool_box[entry["attr"]] = LazyTool(
+            name=entry["name"],
+            description=entry["description"],
+            args_schema=entry["args_schema"],
+            module=module_name,
+            attr=entry["attr"],
+        )
+        __all__.append(entry["attr"])
@@ -16,4 +16,15 @@ def define_tool(term: str) -> str:
     prompt_content = f"Please provide a concise definition for the term: {term}"
     
     # Assuming get_llm returns a LangChain LLM object that can be invoked with a string
-    return llm.invoke(prompt_content).content
\ No newline at end of file
+    return llm.invoke(prompt_content).content
+
+async def adefine_tool(term: str) -> str:
+    """
+    Async version of define_tool.
+    """
+    llm = get_llm("Claude")
+    prompt_content = f"Please provide a concise definition for the term: {term}"
+    return (await llm.ainvoke(prompt_content)).content
+
+
+define_tool.coroutine = adefine_tool # Used by define_tool.ainvoke
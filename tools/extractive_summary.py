@@ -0,0 +1,127 @@
+import re
+import zlib
+from itertools import islice
+import numpy as np
+
+# Local extractive summarizer (no network, no LLM).
+#   - Sentences are split lazily and scored in chunks of CHUNK_SENTENCES, so the matrices stay
+#     small however long the input is: each chunk is TF-IDF vectorized into HASH_DIM hashed
+#     buckets and ranked with TextRank over the cosine similarity of its sentences.
+#   - Each chunk keeps only its best sentences as candidates. Repeated sentences (boilerplate)
+#     count once, and at most MAX_CANDIDATES of the best candidates are ranked once more; the
+#     best ones that fit max_words are returned in document order.
+#   - Words are hashed with crc32, not hash(), so a text gets the same summary in every process.
+
+CHUNK_SENTENCES = 800
+MAX_CANDIDATES = 800
+HASH_DIM = 2048
+DAMPING = 0.85
+TEXTRANK_ITERATIONS = 30
+
+_SENTENCE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+[\"')\]]*|\n|$)")
+_WORD_RE = re.compile(r"[a-z0-9']{2,}")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i in is it its of on or she that the their "
+    "them they this to was we were what when which who will with you your not no so if than then there".split()
+)
+
+
+def split_sentences(text: str):
+    """
+    Yields (position, sentence) pairs; a line break also ends a sentence.
+    """
+    for position, match in enumerate(_SENTENCE_RE.finditer(text)):
+        sentence = match.group().strip()
+        if sentence:
+            yield position, sentence
+
+
+def _vectorize(sentences: list) -> np.ndarray:
+    # Hashed TF-IDF rows, L2-normalized so x @ x.T is the cosine similarity
+    tokens = [[w for w in _WORD_RE.findall(sentence.lower()) if w not in _STOPWORDS] for sentence in sentences]
+    words = [word for sentence_tokens in tokens for word in sentence_tokens]
+    buckets = {word: zlib.crc32(word.encode()) % HASH_DIM for word in set(words)}
+    rows = np.repeat(np.arange(len(sentences)), [len(t) for t in tokens])
+    cols = np.fromiter(map(buckets.__getitem__, words), dtype=np.int64, count=len(words))
+    tf = np.bincount(rows * HASH_DIM + cols, minlength=len(sentences) * HASH_DIM)
+    tf = tf.reshape(len(sentences), HASH_DIM).astype(np.float32)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log((1 + len(sentences)) / (1 + df)).astype(np.float32) + 1.0
+    x = tf * idf
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms == 0, 1.0, norms)
+
+
+def textrank(sentences: list) -> np.ndarray:
+    """
+    TextRank score of each sentence (PageRank over the cosine-similarity graph of the sentences).
+    The n x n similarity matrix is never built: with S = x @ x.T, every step computes
+    (w @ x) @ x.T, which costs O(n * HASH_DIM) instead of O(n^2 * HASH_DIM).
+    """
+    n = len(sentences)
+    if n <= 2:
+        return np.ones(n, dtype=np.float32)
+    x = _vectorize(sentences)
+    self_similarity = (x.any(axis=1)).astype(np.float32) # Diagonal of S, excluded from the graph
+    out_weight = x @ x.sum(axis=0) - self_similarity
+    dangling = out_weight <= 1e-9 # Sentences similar to no other one jump to any sentence
+    inverse_weight = np.where(dangling, 0.0, 1.0 / np.where(dangling, 1.0, out_weight)).astype(np.float32)
+    scores = np.full(n, 1.0 / n, dtype=np.float32)
+    for _ in range(TEXTRANK_ITERATIONS):
+        w = scores * inverse_weight
+        spread = (w @ x) @ x.T - w * self_similarity + scores[dangling].sum() / n
+        updated = (1 - DAMPING) / n + DAMPING * spread
+        if np.abs(updated - scores).sum() < 1e-6:
+            return updated
+        scores = updated
+    return scores
+
+
+def _best(candidates: list, scores: np.ndarray, max_words: int) -> list:
+    # (score, candidate) pairs, highest scores first, until max_words is filled
+    chosen, words = [], 0
+    for i in np.argsort(-scores, kind="stable"):
+        length = len(candidates[i][1].split())
+        if words and words + length > max_words:
+            continue
+        chosen.append((float(scores[i]), candidates[i]))
+        words += length
+        if words >= max_words:
+            break
+    return chosen
+
+
+def _sentence_key(sentence: str) -> str:
+    return " ".join(sentence.lower().split())
+
+
+def summarize(text: str, max_words: int = 150) -> str:
+    """
+    Returns the most central sentences of text, in document order, within max_words words.
+    """
+    if max_words <= 0:
+        return ""
+    sentences = split_sentences(text)
+    best = {} # Normalized sentence -> (score, (position, sentence)) of its first occurrence
+    while True:
+        chunk = list(islice(sentences, CHUNK_SENTENCES))
+        if not chunk:
+            break
+        # Scores sum to 1 per chunk: scale them by its size so the chunks are comparable
+        for score, candidate in _best(chunk, textrank([s for _, s in chunk]) * len(chunk), max_words):
+            key = _sentence_key(candidate[1])
+            if key in best:
+                best[key] = (max(score, best[key][0]), min(candidate, best[key][1]))
+            else:
+                best[key] = (score, candidate)
+
+    ranked = sorted(best.values(), key=lambda item: (-item[0], item[1][0]))[:MAX_CANDIDATES]
+    candidates = [candidate for _, candidate in ranked]
+    if len(candidates) > 1:
+        candidates = [c for _, c in _best(candidates, textrank([s for _, s in candidates]), max_words)]
+    candidates.sort()
+
+    words = " ".join(s for _, s in candidates).split()
+    if len(words) > max_words: # A single sentence longer than max_words
+        return " ".join(words[:max_words]) + "..."
+    return " ".join(words)
@@ -0,0 +1,321 @@
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import random
+import re
+import threading
+import time
+import weakref
+import logging
+from collections import deque
+from urllib.parse import urlsplit
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE_SECONDS,
+    HTTP_BACKOFF_MAX_SECONDS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_HOST_RATE_LIMITS,
+)
+
+# Shared HTTP layer for the tools. Every tool request goes through request()/arequest(), which add:
+#   - keep-alive connection pooling per host (one requests.Session, one httpx.AsyncClient per loop)
+#   - retries with jittered exponential backoff on 429/5xx and connection errors
+#   - a token-bucket rate limit per host (HTTP_HOST_RATE_LIMITS, e.g. Nominatim's 1 req/s)
+#   - per-host latency/retry metrics, see http_metrics(), and per-caller retry counts, see count_retries()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second with bursts up to `capacity`.
+    reserve() takes a token and returns how long the caller must wait before using it,
+    so the same bucket works for blocking (time.sleep) and async (asyncio.sleep) callers.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def _bucket_for(host: str):
+    rate = HTTP_HOST_RATE_LIMITS.get(host)
+    if not rate:
+        return None
+    with _buckets_lock:
+        if host not in _buckets:
+            _buckets[host] = TokenBucket(rate)
+        return _buckets[host]
+
+
+_retry_counter = contextvars.ContextVar("http_retry_counter", default=None)
+
+
+@contextlib.contextmanager
+def count_retries():
+    """
+    Counts the retries of the requests sent inside the block (in this context and its copies,
+    e.g. worker threads started with contextvars.copy_context()). Yields a one-item list.
+    """
+    counter = [0]
+    token = _retry_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _retry_counter.reset(token)
+
+
+def _record(host: str, latency: float, retries: int, ok: bool):
+    counter = _retry_counter.get()
+    if counter is not None:
+        counter[0] += retries
+    with _metrics_lock:
+        m = _metrics.setdefault(host, {"requests": 0, "errors": 0, "retries": 0, "latencies": deque(maxlen=1000)})
+        m["requests"] += 1
+        m["retries"] += retries
+        m["errors"] += 0 if ok else 1
+        m["latencies"].append(latency)
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def http_metrics() -> dict:
+    """
+    Per-host request count, errors, retries and latency percentiles
+    (seconds, including retries and rate-limit waits).
+    """
+    with _metrics_lock:
+        return {
+            host: {
+                "requests": m["requests"],
+                "errors": m["errors"],
+                "retries": m["retries"],
+                "p50_seconds": _percentile(m["latencies"], 50),
+                "p95_seconds": _percentile(m["latencies"], 95),
+            }
+            for host, m in _metrics.items()
+        }
+
+
+def reset_http_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def _backoff_delay(attempt: int, retry_after=None) -> float:
+    # Honor a numeric Retry-After, otherwise "full jitter" exponential backoff
+    if retry_after:
+        try:
+            return min(HTTP_BACKOFF_MAX_SECONDS, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(HTTP_BACKOFF_MAX_SECONDS, HTTP_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Process-wide requests.Session; its adapter keeps a pool of keep-alive connections per host.
+    Retries are handled by request(), so the adapter itself does not retry.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=32, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def request(method: str, url: str, timeout: float = DEFAULT_TIMEOUT, **kwargs) -> requests.Response:
+    """
+    Sends a request through the shared session with rate limiting and retries.
+    Raises requests.exceptions.RequestException once retries are exhausted or on a non-retryable error status.
+    """
+    host = urlsplit(url).netloc
+    bucket = _bucket_for(host)
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        if bucket is not None:
+            wait = bucket.reserve()
+            if wait > 0:
+                time.sleep(wait)
+        try:
+            resp = get_session().request(method, url, timeout=timeout, **kwargs)
+            retry_after = resp.headers.get("Retry-After")
+            retryable = resp.status_code in RETRY_STATUSES
+            error = None
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            resp, retry_after, retryable, error = None, None, True, e
+
+        if not retryable or attempt >= HTTP_MAX_RETRIES:
+            _record(host, time.perf_counter() - started, attempt, error is None and resp.ok)
+            if error is not None:
+                raise error
+            resp.raise_for_status() # Will raise an HTTPError for bad responses (4XX or 5XX)
+            return resp
+
+        delay = _backoff_delay(attempt, retry_after)
+        logger.debug(f"Retrying {method} {url} in {delay:.2f}s (attempt {attempt + 1}, {error or resp.status_code})")
+        time.sleep(delay)
+        attempt += 1
+
+
+# Async HTTP clients keep connections that belong to the event loop that opened them,
+# so async clients are shared per running loop rather than per process.
+_loop_locals = weakref.WeakKeyDictionary() # loop -> {name: object}
+
+
+def get_loop_local(name: str, factory):
+    """
+    Returns the object registered under name for the running event loop, creating it with factory().
+    """
+    objects = _loop_locals.setdefault(asyncio.get_running_loop(), {})
+    if name not in objects:
+        objects[name] = factory()
+    return objects[name]
+
+
+def get_async_client() -> httpx.AsyncClient:
+    return get_loop_local("httpx", lambda: httpx.AsyncClient(
+        timeout=DEFAULT_TIMEOUT,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=HTTP_POOL_MAXSIZE),
+    ))
+
+
+async def arequest(method: str, url: str, timeout: float = DEFAULT_TIMEOUT, **kwargs) -> httpx.Response:
+    """
+    Async version of request(), using the shared per-loop httpx.AsyncClient.
+    Raises httpx.HTTPError once retries are exhausted or on a non-retryable error status.
+    """
+    host = urlsplit(url).netloc
+    bucket = _bucket_for(host)
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        if bucket is not None:
+            wait = bucket.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        try:
+            resp = await get_async_client().request(method, url, timeout=timeout, **kwargs)
+            retry_after = resp.headers.get("Retry-After")
+            retryable = resp.status_code in RETRY_STATUSES
+            error = None
+        except httpx.TransportError as e:
+            resp, retry_after, retryable, error = None, None, True, e
+
+        if not retryable or attempt >= HTTP_MAX_RETRIES:
+            _record(host, time.perf_counter() - started, attempt, error is None and resp.is_success)
+            if error is not None:
+                raise error
+            resp.raise_for_status()
+            return resp
+
+        delay = _backoff_delay(attempt, retry_after)
+        logger.debug(f"Retrying {method} {url} in {delay:.2f}s (attempt {attempt + 1}, {error or resp.status_code})")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def get_json_response(url: str, params: dict = None, headers: dict = None, timeout: float = DEFAULT_TIMEOUT):
+    """
+    GET url and return (decoded JSON body, response headers).
+    Raises requests.exceptions.RequestException on network/HTTP errors and ValueError on bad JSON.
+    """
+    resp = request("GET", url, params=params, headers=headers, timeout=timeout)
+    return resp.json(), resp.headers
+
+
+def get_json(url: str, params: dict = None, headers: dict = None, timeout: float = DEFAULT_TIMEOUT):
+    """
+    GET url and decode the JSON body.
+    """
+    return get_json_response(url, params=params, headers=headers, timeout=timeout)[0]
+
+
+def post_json(url: str, payload: dict, headers: dict = None, timeout: float = DEFAULT_TIMEOUT):
+    """
+    POST a JSON payload and decode the JSON response.
+    """
+    return request("POST", url, json=payload, headers=headers, timeout=timeout).json()
+
+
+async def aget_json_response(url: str, params: dict = None, headers: dict = None, timeout: float = DEFAULT_TIMEOUT):
+    """
+    Async version of get_json_response.
+    Raises httpx.HTTPError on network/HTTP errors and ValueError on bad JSON.
+    """
+    resp = await arequest("GET", url, params=params, headers=headers, timeout=timeout)
+    return resp.json(), resp.headers
+
+
+async def aget_json(url: str, params: dict = None, headers: dict = None, timeout: float = DEFAULT_TIMEOUT):
+    """
+    Async version of get_json.
+    """
+    return (await aget_json_response(url, params=params, headers=headers, timeout=timeout))[0]
+
+
+async def apost_json(url: str, payload: dict, headers: dict = None, timeout: float = DEFAULT_TIMEOUT):
+    """
+    Async version of post_json.
+    """
+    return (await arequest("POST", url, json=payload, headers=headers, timeout=timeout)).json()
+
+
+def cache_ttl_from_headers(headers, default: float) -> float:
+    """
+    Seconds a response may be cached according to Cache-Control (max-age / no-store)
+    or Expires, falling back to default when neither is present.
+    """
+    cache_control = (headers or {}).get("Cache-Control", "")
+    if re.search(r"no-store|no-cache", cache_control):
+        return 0.0
+    max_age = re.search(r"max-age=(\d+)", cache_control)
+    if max_age:
+        return float(max_age.group(1))
+    expires = (headers or {}).get("Expires")
+    if expires:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(expires).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return default
@@ -14,3 +14,18 @@ def recipe_tool(dish: str, servings: int = 2) -> str:
     # Ensure your PROMPTS["recipe"] can handle 'dish' and 'servings'
     messages = prompt_template.format_messages(dish=dish, servings=servings)
     return llm.invoke(messages).content
+
+
+async def arecipe_tool(dish: str, servings: int = 2) -> str:
+    """
+    Async version of recipe_tool.
+    """
+    llm = get_llm("Claude")
+    prompt_template = PROMPTS.get("recipe")
+    if not prompt_template:
+        return "Error: Recipe prompt template not found."
+    messages = prompt_template.format_messages(dish=dish, servings=servings)
+    return (await llm.ainvoke(messages)).content
+
+
+recipe_tool.coroutine = arecipe_tool # Used by recipe_tool.ainvoke
@@ -0,0 +1,110 @@
+import json
+import threading
+from collections import OrderedDict
+from langchain_core.runnables.config import ensure_config
+
+from cache_store import TieredCache
+from config import TAVILY_API_KEY, TAVILY_API_URL, SEARCH_CACHE_TTL_SECONDS, SEARCH_FETCH_RESULTS
+from tools.http_client import post_json, apost_json
+
+# Single web search backend behind every search tool.
+#   - Tavily is queried through the shared HTTP layer for SEARCH_FETCH_RESULTS results and the
+#     compacted response is cached per normalized query, so every top_n is served from one entry.
+#   - Only title/url/content are kept; raw_content, images, follow_up_questions etc. are dropped.
+#   - Within one agent turn (metadata "turn_id" of the run config) a URL is returned at most
+#     once, across all search tools and queries.
+
+TAVILY_SEARCH_URL = f"{TAVILY_API_URL.rstrip('/')}/search"
+_RESULT_FIELDS = ("title", "url", "content")
+_MAX_TRACKED_TURNS = 256
+
+_cache = None
+_turn_urls = OrderedDict() # turn_id -> set of URLs already returned in that turn
+_turn_lock = threading.Lock()
+
+
+def _get_cache() -> TieredCache:
+    global _cache
+    if _cache is None:
+        _cache = TieredCache("web_search", ttl=SEARCH_CACHE_TTL_SECONDS)
+    return _cache
+
+
+def normalize_query(query: str) -> str:
+    """
+    'Latest  news on X?' and 'latest news on x' share a cache entry.
+    """
+    return " ".join(str(query).lower().split()).strip(" ?!.")
+
+
+def _search_request(query: str):
+    payload = {"query": query, "max_results": SEARCH_FETCH_RESULTS}
+    headers = {"Authorization": f"Bearer {TAVILY_API_KEY}"}
+    return payload, headers
+
+
+def _compact(response) -> list:
+    """
+    Keeps the fields the LLM needs and drops duplicate URLs within one response.
+    """
+    results = response.get("results", []) if isinstance(response, dict) else response
+    compact, seen = [], set()
+    for result in results or []:
+        if not isinstance(result, dict) or result.get("url") in seen:
+            continue
+        seen.add(result.get("url"))
+        compact.append({k: result[k] for k in _RESULT_FIELDS if result.get(k)})
+    return compact
+
+
+def _current_turn_id():
+    return ensure_config().get("metadata", {}).get("turn_id")
+
+
+def _select(query: str, results: list, top_n: int) -> str:
+    turn_id = _current_turn_id()
+    omitted = 0
+    if turn_id is not None:
+        with _turn_lock:
+            seen = _turn_urls.setdefault(turn_id, set())
+            _turn_urls.move_to_end(turn_id)
+            while len(_turn_urls) > _MAX_TRACKED_TURNS:
+                _turn_urls.popitem(last=False)
+            fresh = [r for r in results if r.get("url") not in seen]
+            omitted = len(results) - len(fresh)
+            results = fresh[:top_n] if top_n > 0 else fresh
+            seen.update(r.get("url") for r in results)
+    elif top_n > 0:
+        results = results[:top_n]
+
+    output = {"query": query, "results": results}
+    if omitted:
+        output["omitted"] = f"{omitted} result(s) already returned earlier in this turn"
+    return json.dumps(output, separators=(",", ":"), ensure_ascii=False)
+
+
+def search(query: str, top_n: int = 2) -> str:
+    """
+    Returns compact JSON with up to top_n results for query.
+    Raises requests.exceptions.RequestException / ValueError on failures.
+    """
+    key = normalize_query(query)
+    results = _get_cache().get(key)
+    if results is None:
+        payload, headers = _search_request(query)
+        results = _compact(post_json(TAVILY_SEARCH_URL, payload, headers=headers, timeout=60))
+        _get_cache().set(key, results)
+    return _select(query, results, top_n)
+
+
+async def asearch(query: str, top_n: int = 2) -> str:
+    """
+    Async version of search.
+    """
+    key = normalize_query(query)
+    results = _get_cache().get(key)
+    if results is None:
+        payload, headers = _search_request(query)
+        results = _compact(await apost_json(TAVILY_SEARCH_URL, payload, headers=headers, timeout=60))
+        _get_cache().set(key, results)
+    return _select(query, results, top_n)
@@ -1,13 +1,15 @@
 from langchain_core.tools import tool
+from tools.extractive_summary import summarize
 
 @tool(
     description="Summarize the input text to at most max_words words."
 )
 def summarize_tool(text: str, max_words: int = 150) -> str:
     """
-    Summarize the input text by returning up to max_words words.
+    Summarize the input text by extracting its most important sentences, up to max_words words.
+    Runs locally (TF-IDF + TextRank, see tools/extractive_summary.py) without another LLM call.
     """
     words = text.split()
     if len(words) <= max_words:
         return text
-    return " ".join(words[:max_words]) + "..."
+    return summarize(text, max_words)
@@ -1,70 +1,51 @@
+import asyncio
+import httpx
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 from langchain_core.tools import tool
 
-from config import NOMINATIM_URL, NWS_POINTS_URL_TEMPLATE, NWS_USER_AGENT
+from config import NOMINATIM_URL, NWS_POINTS_URL_TEMPLATE, NWS_USER_AGENT, WEATHER_FORECAST_TTL_SECONDS
+from tools.http_client import get_json_response, aget_json_response, cache_ttl_from_headers
+from tools.weather_cache import geocode_cache, points_cache, forecast_cache, normalize_location, point_key
 
-@tool(
-    description="Get current weather for a location using the National Weather Service API."
-)
-def weather_tool(location: str) -> str:
-    """
-    Retrieve current weather for the given location (e.g. 'Maryville, MO' or ZIP code)
-    using the NWS Points and Forecast endpoints.
-    """
+# Network errors of the sync (requests) and async (httpx) clients
+_HTTP_ERRORS = (requests.exceptions.RequestException, httpx.HTTPError)
+_HEADERS = {"User-Agent": NWS_USER_AGENT}
+
+
+class WeatherError(Exception):
+    """Carries the user-facing message returned by weather_tool when a step fails."""
+
+
+def _geocode_params(location: str) -> dict:
     # Geocode the location via Nominatim OpenStreetMap
-    geocode_url = NOMINATIM_URL
-    params = {"q": location, "format": "json", "limit": 1}
-    try: # Add try-except for network requests
-        geocode_resp = requests.get(geocode_url, params=params,
-                                    headers={"User-Agent": NWS_USER_AGENT}, timeout=10)
-        geocode_resp.raise_for_status() # Will raise an HTTPError for bad responses (4XX or 5XX)
-        geo = geocode_resp.json()
-    except requests.exceptions.RequestException as e: # Use logging for errors
-        return f"Error during geocoding: {e}"
-    except ValueError as e: # Handles JSON decoding errors, use logging
-        return f"Error decoding geocoding JSON response: {e}"
+    return {"q": location, "format": "json", "limit": 1}
 
+
+def _parse_geocode(geo, location: str):
     if not geo:
-        return f"No geocoding result for '{location}'."
-    
+        raise WeatherError(f"No geocoding result for '{location}'.")
+
     # It's possible for geo[0] to not exist if geo is an empty list but not None
     if not isinstance(geo, list) or len(geo) == 0 or "lat" not in geo[0] or "lon" not in geo[0]:
-        return f"Geocoding result for '{location}' is malformed or missing lat/lon."
-        
-    lat, lon = geo[0]["lat"], geo[0]["lon"]
+        raise WeatherError(f"Geocoding result for '{location}' is malformed or missing lat/lon.")
+
+    return geo[0]["lat"], geo[0]["lon"]
 
-    # Get forecast endpoint from NWS Points API
-    points_url = NWS_POINTS_URL_TEMPLATE.format(lat=lat, lon=lon)
-    headers = {"User-Agent": NWS_USER_AGENT}
-    try: # Add try-except for network requests
-        points_resp = requests.get(points_url, headers=headers, timeout=10) # Added timeout
-        points_resp.raise_for_status()
-        points_data = points_resp.json() # Use logging for errors
-    except requests.exceptions.RequestException as e:
-        return f"Error fetching NWS points data: {e}"
-    except ValueError as e: # Handles JSON decoding errors, use logging
-        return f"Error decoding NWS points JSON response: {e}"
 
+def _parse_points(points_data) -> str:
     # Check for expected structure in points_data
     if not (points_data.get("properties") and points_data["properties"].get("forecast")):
-        return "Could not retrieve forecast URL from NWS points data."
-    forecast_url = points_data["properties"]["forecast"]
+        raise WeatherError("Could not retrieve forecast URL from NWS points data.")
+    return points_data["properties"]["forecast"]
 
 
-    # Fetch the forecast
-    try: # Add try-except for network requests
-        forecast_resp = requests.get(forecast_url, headers=headers, timeout=10) # Added timeout
-        forecast_resp.raise_for_status()
-        forecast_data = forecast_resp.json() # Use logging for errors
-    except requests.exceptions.RequestException as e:
-        return f"Error fetching NWS forecast: {e}"
-    except ValueError as e: # Handles JSON decoding errors, use logging
-        return f"Error decoding NWS forecast JSON response: {e}"
-
+def _format_forecast(forecast_data) -> str:
     # Check for expected structure in forecast_data
     if not (forecast_data.get("properties") and forecast_data["properties"].get("periods")):
         return "Forecast data is missing expected 'periods' information."
-        
+
     periods = forecast_data["properties"]["periods"]
     # Use logging for warnings/info about data structure
     if not periods: # Check if periods list is empty
@@ -83,5 +64,218 @@ def weather_tool(location: str) -> str:
         updated = raw_updated_time[:19].replace("T", " ")
     else:
         updated = "Timestamp N/A"
-        
+
     return f"{name}: {short}, {temp}°{unit} (as of {updated} UTC)"
+
+
+# (request error prefix, JSON decoding label) per step, as shown to the user
+_GEOCODE_STEP = ("Error during geocoding", "geocoding")
+_POINTS_STEP = ("Error fetching NWS points data", "NWS points")
+_FORECAST_STEP = ("Error fetching NWS forecast", "NWS forecast")
+
+
+def _fetch(step, url, params=None, headers=None):
+    try:
+        return get_json_response(url, params=params, headers=headers)
+    except _HTTP_ERRORS as e:
+        raise WeatherError(f"{step[0]}: {e}")
+    except ValueError as e: # Handles JSON decoding errors
+        raise WeatherError(f"Error decoding {step[1]} JSON response: {e}")
+
+
+async def _afetch(step, url, params=None, headers=None):
+    try:
+        return await aget_json_response(url, params=params, headers=headers)
+    except _HTTP_ERRORS as e:
+        raise WeatherError(f"{step[0]}: {e}")
+    except ValueError as e: # Handles JSON decoding errors
+        raise WeatherError(f"Error decoding {step[1]} JSON response: {e}")
+
+
+# Each lookup checks its cache first; only successful results are cached.
+
+def _geocode(location: str):
+    key = normalize_location(location)
+    cached = geocode_cache().get(key)
+    if cached is not None:
+        return cached
+    geo, _ = _fetch(_GEOCODE_STEP, NOMINATIM_URL, _geocode_params(location), _HEADERS)
+    lat_lon = _parse_geocode(geo, location)
+    geocode_cache().set(key, lat_lon)
+    return lat_lon
+
+
+def _forecast_url(lat, lon) -> str:
+    key = point_key(lat, lon)
+    cached = points_cache().get(key)
+    if cached is not None:
+        return cached
+    # Get forecast endpoint from NWS Points API
+    points_url = NWS_POINTS_URL_TEMPLATE.format(lat=lat, lon=lon)
+    points_data, _ = _fetch(_POINTS_STEP, points_url, headers=_HEADERS)
+    forecast_url = _parse_points(points_data)
+    points_cache().set(key, forecast_url)
+    return forecast_url
+
+
+def _forecast(forecast_url: str):
+    cached = forecast_cache().get(forecast_url)
+    if cached is not None:
+        return cached
+    forecast_data, headers = _fetch(_FORECAST_STEP, forecast_url, headers=_HEADERS)
+    ttl = cache_ttl_from_headers(headers, WEATHER_FORECAST_TTL_SECONDS)
+    if ttl > 0:
+        forecast_cache().set(forecast_url, forecast_data, ttl=ttl)
+    return forecast_data
+
+
+async def _ageocode(location: str):
+    key = normalize_location(location)
+    cached = geocode_cache().get(key)
+    if cached is not None:
+        return cached
+    geo, _ = await _afetch(_GEOCODE_STEP, NOMINATIM_URL, _geocode_params(location), _HEADERS)
+    lat_lon = _parse_geocode(geo, location)
+    geocode_cache().set(key, lat_lon)
+    return lat_lon
+
+
+async def _aforecast_url(lat, lon) -> str:
+    key = point_key(lat, lon)
+    cached = points_cache().get(key)
+    if cached is not None:
+        return cached
+    points_url = NWS_POINTS_URL_TEMPLATE.format(lat=lat, lon=lon)
+    points_data, _ = await _afetch(_POINTS_STEP, points_url, headers=_HEADERS)
+    forecast_url = _parse_points(points_data)
+    points_cache().set(key, forecast_url)
+    return forecast_url
+
+
+async def _aforecast(forecast_url: str):
+    cached = forecast_cache().get(forecast_url)
+    if cached is not None:
+        return cached
+    forecast_data, headers = await _afetch(_FORECAST_STEP, forecast_url, headers=_HEADERS)
+    ttl = cache_ttl_from_headers(headers, WEATHER_FORECAST_TTL_SECONDS)
+    if ttl > 0:
+        forecast_cache().set(forecast_url, forecast_data, ttl=ttl)
+    return forecast_data
+
+
+@tool(
+    description="Get current weather for a location using the National Weather Service API."
+)
+def weather_tool(location: str) -> str:
+    """
+    Retrieve current weather for the given location (e.g. 'Maryville, MO' or ZIP code)
+    using the NWS Points and Forecast endpoints. Geocodes, grid points and forecasts
+    are cached, so a repeated location needs one HTTP request or none.
+    """
+    try:
+        lat, lon = _geocode(location)
+        forecast_data = _forecast(_forecast_url(lat, lon))
+    except WeatherError as e:
+        return str(e)
+    return _format_forecast(forecast_data)
+
+
+async def aweather_tool(location: str) -> str:
+    """
+    Async version of weather_tool using the shared async HTTP client.
+    """
+    try:
+        lat, lon = await _ageocode(location)
+        forecast_data = await _aforecast(await _aforecast_url(lat, lon))
+    except WeatherError as e:
+        return str(e)
+    return _format_forecast(forecast_data)
+
+
+weather_tool.coroutine = aweather_tool # Used by weather_tool.ainvoke
+
+
+# --- Batch lookup ---
+# Locations are geocoded concurrently (the HTTP layer keeps Nominatim within its rate limit),
+# then locations sharing coordinates share one points lookup and locations on the same NWS
+# grid point share one forecast fetch.
+
+_BATCH_MAX_WORKERS = 8
+
+
+def _format_batch(locations, lat_lons, urls_by_point, forecasts_by_url) -> str:
+    lines = []
+    for location in locations:
+        lat_lon = lat_lons[location]
+        if isinstance(lat_lon, WeatherError):
+            lines.append(f"{location}: {lat_lon}")
+            continue
+        forecast_url = urls_by_point[point_key(*lat_lon)]
+        if isinstance(forecast_url, WeatherError):
+            lines.append(f"{location}: {forecast_url}")
+            continue
+        forecast_data = forecasts_by_url[forecast_url]
+        if isinstance(forecast_data, WeatherError):
+            lines.append(f"{location}: {forecast_data}")
+        else:
+            lines.append(f"{location}: {_format_forecast(forecast_data)}")
+    return "\n".join(lines)
+
+
+def _capture(fn, *args):
+    try:
+        return fn(*args)
+    except WeatherError as e:
+        return e
+
+
+async def _acapture(coro):
+    try:
+        return await coro
+    except WeatherError as e:
+        return e
+
+
+@tool(
+    description="Get current weather for several locations at once using the National Weather Service API. "
+                "Prefer this over repeated weather_tool calls when comparing multiple locations."
+)
+def weather_batch_tool(locations: List[str]) -> str:
+    """
+    Retrieve current weather for every location in the list, one line per location.
+    """
+    locations = list(dict.fromkeys(locations)) # Drop exact duplicates, keep order
+    if not locations:
+        return "No locations given."
+    with ThreadPoolExecutor(max_workers=min(_BATCH_MAX_WORKERS, len(locations))) as pool:
+        lat_lons = dict(zip(locations, pool.map(lambda loc: _capture(_geocode, loc), locations)))
+
+        points = {point_key(*ll): ll for ll in lat_lons.values() if not isinstance(ll, WeatherError)}
+        urls_by_point = dict(zip(points, pool.map(lambda ll: _capture(_forecast_url, *ll), points.values())))
+
+        forecast_urls = {url for url in urls_by_point.values() if not isinstance(url, WeatherError)}
+        forecasts_by_url = dict(zip(forecast_urls, pool.map(lambda url: _capture(_forecast, url), forecast_urls)))
+    return _format_batch(locations, lat_lons, urls_by_point, forecasts_by_url)
+
+
+async def aweather_batch_tool(locations: List[str]) -> str:
+    """
+    Async version of weather_batch_tool.
+    """
+    locations = list(dict.fromkeys(locations))
+    if not locations:
+        return "No locations given."
+    geocoded = await asyncio.gather(*(_acapture(_ageocode(loc)) for loc in locations))
+    lat_lons = dict(zip(locations, geocoded))
+
+    points = {point_key(*ll): ll for ll in lat_lons.values() if not isinstance(ll, WeatherError)}
+    urls = await asyncio.gather(*(_acapture(_aforecast_url(*ll)) for ll in points.values()))
+    urls_by_point = dict(zip(points, urls))
+
+    forecast_urls = list({url for url in urls_by_point.values() if not isinstance(url, WeatherError)})
+    forecasts = await asyncio.gather(*(_acapture(_aforecast(url)) for url in forecast_urls))
+    forecasts_by_url = dict(zip(forecast_urls, forecasts))
+    return _format_batch(locations, lat_lons, urls_by_point, forecasts_by_url)
+
+
+weather_batch_tool.coroutine = aweather_batch_tool # Used by weather_batch_tool.ainvoke
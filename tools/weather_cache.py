@@ -0,0 +1,46 @@
+import re
+from cache_store import TieredCache
+from config import WEATHER_GEOCODE_TTL_SECONDS, WEATHER_POINTS_TTL_SECONDS, WEATHER_FORECAST_TTL_SECONDS
+
+# Caches for the three weather_tool lookups. Geocodes and NWS grid points practically
+# never change, so they live for days; forecast bodies follow the NWS cache headers.
+# Each cache is an in-memory LRU backed by a SQLite table, created on first use.
+
+_caches = {}
+_SPECS = {
+    "weather_geocode": WEATHER_GEOCODE_TTL_SECONDS,
+    "weather_points": WEATHER_POINTS_TTL_SECONDS,
+    "weather_forecast": WEATHER_FORECAST_TTL_SECONDS,
+}
+
+
+def _cache(namespace: str) -> TieredCache:
+    if namespace not in _caches:
+        _caches[namespace] = TieredCache(namespace, ttl=_SPECS[namespace])
+    return _caches[namespace]
+
+
+def geocode_cache() -> TieredCache:
+    return _cache("weather_geocode")
+
+
+def points_cache() -> TieredCache:
+    return _cache("weather_points")
+
+
+def forecast_cache() -> TieredCache:
+    return _cache("weather_forecast")
+
+
+def normalize_location(location: str) -> str:
+    """
+    ' Rolla ,  MO.' and 'rolla, mo' map to the same key.
+    """
+    s = " ".join(str(location).lower().split())
+    s = re.sub(r"\s*,\s*", ", ", s)
+    return s.strip(" .,;")
+
+
+def point_key(lat, lon) -> str:
+    # NWS resolves points at 4 decimal places
+    return f"{float(lat):.4f},{float(lon):.4f}"
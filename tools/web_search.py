@@ -1,10 +1,8 @@
-import json
-from config import TAVILY_API_KEY
-from tavily import TavilyClient
 from langchain_core.tools import tool
+from tools.search_backend import search, asearch
 
-# Initialize Tavily client
-tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
+# Both search tools share one backend (tools/search_backend.py): results are cached per
+# normalized query, compacted, and deduplicated by URL across the whole agent turn.
 
 # Perform a web search using Tavily and return the top_n results as a JSON string.
 
@@ -16,9 +14,48 @@ def tavily_search_tool(query: str, top_n: int = 2) -> str:
     Perform a web search using Tavily and return the top_n results as a JSON string.
     """
     try:
-        results = tavily_client.search(query)
-        if isinstance(results, list) and top_n > 0:
-            results = results[:top_n]
-        return json.dumps(results, indent=2)
+        return search(query, top_n)
     except Exception as exc:
         return f"Error during web search: {exc}"
+
+
+async def atavily_search_tool(query: str, top_n: int = 2) -> str:
+    """
+    Async version of tavily_search_tool.
+    """
+    try:
+        return await asearch(query, top_n)
+    except Exception as exc:
+        return f"Error during web search: {exc}"
+
+
+tavily_search_tool.coroutine = atavily_search_tool # Used by tavily_search_tool.ainvoke
+
+
+# Same name and behaviour as the langchain_tavily TavilySearch(max_results=2) tool it replaces
+@tool(
+    "tavily_search_results_json",
+    description="A search engine optimized for comprehensive, accurate, and trusted results. "
+                "Useful for when you need to answer questions about current events. Input should be a search query.",
+)
+def tavily_search_results_tool(query: str) -> str:
+    """
+    Search the web and return the top 2 results as a JSON string.
+    """
+    try:
+        return search(query, 2)
+    except Exception as exc:
+        return f"Error during web search: {exc}"
+
+
+async def atavily_search_results_tool(query: str) -> str:
+    """
+    Async version of tavily_search_results_tool.
+    """
+    try:
+        return await asearch(query, 2)
+    except Exception as exc:
+        return f"Error during web search: {exc}"
+
+
+tavily_search_results_tool.coroutine = atavily_search_results_tool # Used by tavily_search_results_tool.ainvoke
@@ -1,5 +1,10 @@
+import json
+import os
 import streamlit as st
-from mermaid_graph import render_graph
+import uuid
+from config import LOG_PAGE_SIZE, LOG_MAX_ENTRIES, LOG_SPILL_DIR
+from mermaid_graph import render_graph, tool_entries_digest
+from metrics import format_step_cost
 # from typing import List # Not strictly needed if not type hinting elsewhere in this file
 
 def display_title():
@@ -13,54 +18,169 @@ def get_user_input():
 # def display_parsed_output(parsed: str):
 #     st.text_area("Parsed Output", value=parsed, height=200)
 
-def display_full_log(session_log: list):
+def _entry_markdown(overall_entry: dict) -> str:
     md_lines = []
-    for i, overall_entry in enumerate(session_log):
-        md_lines.append(f"# Interaction {i+1}")
-        md_lines.append(f"## User Query: {overall_entry['query']}")
-        md_lines.append("---")
-        md_lines.append("### Tool Execution Log:")
-
-        for step_idx, tool_step in enumerate(overall_entry.get("tool_entries", [])):
-            md_lines.append(f"#### Step {step_idx + 1}: {tool_step['name']}")
-            if tool_step["name"] == "tool_determination_router":
-                md_lines.append("**Router LLM Prompt:**")
-                md_lines.append("```text")
-                md_lines.append(str(tool_step.get("router_llm_prompt", "N/A")))
-                md_lines.append("```")
-                md_lines.append("**Router LLM Raw Response:**")
-                md_lines.append("```text")
-                md_lines.append(str(tool_step.get("router_llm_raw_response", "N/A")))
-                md_lines.append("```")
-                md_lines.append(f"**Selected Tools List:** `{tool_step.get('selected_tools_list', [])}`")
-            else: # For other tools
-                md_lines.append("**Tool Input:**")
-                md_lines.append("```text")
-                md_lines.append(str(tool_step.get("tool_input", "N/A")))
-                md_lines.append("```")
-                md_lines.append("**Tool Output:**")
-                md_lines.append("```text")
-                md_lines.append(str(tool_step.get("tool_output", "N/A")))
-                md_lines.append("```")
-            md_lines.append("---")
-
-        md_lines.append("### Final Parsed Output:")
-        if overall_entry.get("parsed"):
+    md_lines.append(f"## User Query: {overall_entry['query']}")
+    md_lines.append("---")
+    md_lines.append("### Tool Execution Log:")
+
+    for step_idx, tool_step in enumerate(overall_entry.get("tool_entries", [])):
+        md_lines.append(f"#### Step {step_idx + 1}: {tool_step['name']}")
+        if tool_step["name"] == "tool_determination_router":
+            md_lines.append("**Router LLM Prompt:**")
+            md_lines.append("```text")
+            md_lines.append(str(tool_step.get("router_llm_prompt", "N/A")))
             md_lines.append("```")
-            md_lines.append(overall_entry["parsed"])
+            md_lines.append("**Router LLM Raw Response:**")
+            md_lines.append("```text")
+            md_lines.append(str(tool_step.get("router_llm_raw_response", "N/A")))
             md_lines.append("```")
-        else:
-            md_lines.append("*(No final parsed output)*")
-        md_lines.append("")
-    md_content = "\n".join(md_lines)
+            md_lines.append(f"**Selected Tools List:** `{tool_step.get('selected_tools_list', [])}`")
+            if "confidence" in tool_step:
+                md_lines.append(f"**Decision:** {tool_step.get('router_method')}, confidence "
+                                f"{tool_step['confidence']} (threshold {tool_step.get('threshold')})")
+        else: # For other tools
+            md_lines.append("**Tool Input:**")
+            md_lines.append("```text")
+            md_lines.append(str(tool_step.get("tool_input", "N/A")))
+            md_lines.append("```")
+            md_lines.append("**Tool Output:**")
+            md_lines.append("```text")
+            md_lines.append(str(tool_step.get("tool_output", "N/A")))
+            md_lines.append("```")
+            if tool_step.get("payload_ref"):
+                md_lines.append(f"*Sent to the LLM compacted: {tool_step.get('original_tokens')} → "
+                                f"{tool_step.get('context_tokens')} tokens*")
+        if tool_step.get("provider"):
+            md_lines.append(f"*Answered by {tool_step['provider']}*")
+        if tool_step.get("metrics"):
+            md_lines.append(f"*Cost: {format_step_cost(tool_step['metrics'])}*")
+        md_lines.append("---")
+
+    steps = overall_entry.get("tool_entries", [])
+    other_providers = sorted({step["provider"] for step in steps if step.get("provider")} - {overall_entry.get("llm")})
+    if overall_entry.get("llm") and other_providers:
+        md_lines.append(f"*Failover/hedge: answered by {', '.join(other_providers)} instead of the selected "
+                        f"{overall_entry['llm']}*")
+
+    turn_metrics = overall_entry.get("metrics")
+    if turn_metrics:
+        md_lines.append(f"*Turn: {turn_metrics['turn_seconds']:.2f} s, {turn_metrics['llm_calls']} LLM calls, "
+                        f"{turn_metrics['llm_input_tokens']} in / {turn_metrics['llm_output_tokens']} out tokens*")
+        if turn_metrics.get("prompt_cache_read_tokens") or turn_metrics.get("prompt_cache_creation_tokens"):
+            md_lines.append(f"*Prompt cache: {turn_metrics['prompt_cache_read_tokens']} tokens read, "
+                            f"{turn_metrics['prompt_cache_creation_tokens']} written*")
+        if turn_metrics.get("prefetch", {}).get("started"):
+            prefetch = turn_metrics["prefetch"]
+            md_lines.append(f"*Prefetched tool calls: {prefetch['hits']} of {prefetch['started']} used by the LLM*")
+    md_lines.append("### Final Parsed Output:")
+    if overall_entry.get("parsed"):
+        md_lines.append("```")
+        md_lines.append(overall_entry["parsed"])
+        md_lines.append("```")
+    else:
+        md_lines.append("*(No final parsed output)*")
+    md_lines.append("")
+    return "\n".join(md_lines)
+
+def append_log_entry(session_log: list, entry: dict):
+    """
+    Adds an interaction to the session log. Entries beyond LOG_MAX_ENTRIES are dropped
+    from memory, oldest first, and appended to LOG_SPILL_DIR/<session_id>.jsonl if it is set.
+    """
+    entry.setdefault("id", uuid.uuid4().hex)
+    st.session_state["log_count"] = st.session_state.get("log_count", 0) + 1
+    entry["number"] = st.session_state["log_count"] # Numbering survives spilled entries
+    session_log.append(entry)
+
+    overflow = len(session_log) - LOG_MAX_ENTRIES
+    if overflow <= 0:
+        return
+    dropped = session_log[:overflow]
+    del session_log[:overflow]
+    markdown_cache = st.session_state.get("log_markdown", {})
+    for old_entry in dropped:
+        markdown_cache.pop(old_entry["id"], None)
+    if LOG_SPILL_DIR:
+        os.makedirs(LOG_SPILL_DIR, exist_ok=True)
+        with open(os.path.join(LOG_SPILL_DIR, f"{st.session_state['session_id']}.jsonl"), "a", encoding="utf-8") as f:
+            for old_entry in dropped:
+                f.write(json.dumps(old_entry, default=str, ensure_ascii=False) + "\n")
+    st.session_state["log_spilled"] = st.session_state.get("log_spilled", 0) + overflow
+
+def display_full_log(session_log: list):
+    """
+    Renders the log one page at a time, newest first: the latest interaction expanded,
+    older ones collapsed. Each entry's Markdown is built once and cached by entry id.
+    """
+    if not session_log:
+        return
+    markdown_cache = st.session_state.setdefault("log_markdown", {})
     st.write("**Full interaction log (Markdown):**")
-    st.markdown(md_content)
 
-def ui_main(chat_fn):
+    page_count = (len(session_log) + LOG_PAGE_SIZE - 1) // LOG_PAGE_SIZE
+    page = 1
+    if page_count > 1:
+        page = st.number_input("Log page (newest first)", min_value=1, max_value=page_count, value=1, step=1)
+    newest_first = session_log[::-1]
+    page_entries = newest_first[(page - 1) * LOG_PAGE_SIZE:page * LOG_PAGE_SIZE]
+
+    for overall_entry in page_entries:
+        entry_id = overall_entry.get("id") or str(id(overall_entry))
+        if entry_id not in markdown_cache:
+            markdown_cache[entry_id] = _entry_markdown(overall_entry)
+        number = overall_entry.get("number", "")
+        with st.expander(f"Interaction {number}: {overall_entry['query'][:80]}",
+                         expanded=overall_entry is session_log[-1]):
+            st.markdown(markdown_cache[entry_id])
+
+    spilled = st.session_state.get("log_spilled", 0)
+    if spilled:
+        where = f" (saved to `{LOG_SPILL_DIR}`)" if LOG_SPILL_DIR else ""
+        st.caption(f"{spilled} older interaction(s) are no longer kept in memory{where}.")
+
+def render_stream(events) -> dict:
+    """
+    Renders streamed agent events progressively and returns the final entry.
+    Tool calls show up as they start/finish, and the answer is written token by token.
+    """
+    tool_status = st.status("Running agent...", expanded=True)
+    answer_placeholder = st.empty()
+    answer_text = ""
+    final_entry = None
+
+    for event in events:
+        if event["type"] == "token":
+            answer_text += event["content"]
+            answer_placeholder.markdown(answer_text)
+        elif event["type"] == "tool_start":
+            # Text streamed before a tool call is the agent "thinking", not the answer
+            answer_text = ""
+            answer_placeholder.empty()
+            tool_status.write(f"▶️ `{event['name']}` with input `{event['tool_input']}`")
+        elif event["type"] == "tool_end":
+            tool_status.write(f"✅ `{event['entry']['name']}` finished")
+        elif event["type"] == "final":
+            final_entry = event["entry"]
+
+    tool_status.update(label="Agent finished", state="complete", expanded=False)
+    if final_entry is None:
+        # The stream ended without a final event (e.g. the chat API dropped it): log what was shown
+        final_entry = {"raw": "LangGraph Agent Invoked", "parsed": answer_text, "tool_entries": []}
+    if final_entry.get("parsed") is None:
+        final_entry["parsed"] = answer_text
+    answer_placeholder.markdown(final_entry["parsed"])
+    return final_entry
+
+def ui_main(chat_fn, stream_fn=None):
     """Main UI orchestration."""
     if "log" not in st.session_state:
         st.session_state["log"] = []
+    if "session_id" not in st.session_state:
+        # Identifies this browser session's conversation thread in the checkpointer
+        st.session_state["session_id"] = str(uuid.uuid4())
     session_log = st.session_state["log"]
+    session_id = st.session_state["session_id"]
 
     display_title()
 
@@ -72,12 +192,21 @@ def ui_main(chat_fn):
 
     user_input = get_user_input()
     if st.button("Submit") and user_input.strip():
-        entry = chat_fn(user_input, llm_choice) # Pass the selected LLM name
-        session_log.append(entry)
+        if stream_fn is not None:
+            entry = render_stream(stream_fn(user_input, llm_choice, session_id))
+        else:
+            entry = chat_fn(user_input, llm_choice, session_id) # Pass the selected LLM name
+        entry.setdefault("query", user_input)
+        append_log_entry(session_log, entry)
         # Ensure "tool_entries" exists and is a list before rendering
         tool_entries_for_graph = entry.get("tool_entries", [])
         if isinstance(tool_entries_for_graph, list):
-            render_graph(tool_entries_for_graph)
+            st.session_state["graph"] = (entry["id"], tool_entries_digest(tool_entries_for_graph))
         else:
+            st.session_state.pop("graph", None)
             st.warning("Graph data (tool_entries) is not in the expected list format.")
-        display_full_log(session_log)
+    # The graph and the log are rendered on every rerun (e.g. when the log page changes): the
+    # graph of the latest interaction from the diagram cache, the log from cached Markdown
+    if "graph" in st.session_state and session_log and session_log[-1]["id"] == st.session_state["graph"][0]:
+        render_graph(session_log[-1]["tool_entries"], digest=st.session_state["graph"][1])
+    display_full_log(session_log)